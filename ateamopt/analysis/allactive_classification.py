@@ -10,15 +10,11 @@ import numpy as np
 import os
 from collections import defaultdict,namedtuple
 from sklearn.preprocessing import StandardScaler,MinMaxScaler   
-from sklearn.pipeline import Pipeline
-from sklearn.manifold import TSNE
-from sklearn.svm import SVC
-from sklearn.ensemble import RandomForestClassifier           
 from sklearn.decomposition import PCA
 from sklearn import preprocessing
 from sklearn.metrics import classification_report,\
                  confusion_matrix,accuracy_score  
-from sklearn.model_selection import train_test_split,StratifiedKFold  
+from sklearn.model_selection import train_test_split  
 from sklearn.utils.multiclass import unique_labels     
 import seaborn as sns
 import matplotlib.pyplot as plt
@@ -26,15 +22,17 @@ from matplotlib.lines import Line2D
 from matplotlib.cm import ScalarMappable
 from matplotlib.colors import ListedColormap
 from scipy.stats import iqr
-from umap import UMAP
 from matplotlib.ticker import MaxNLocator
 from scipy import stats
 from scipy.stats import distributions,find_repeats
 import warnings
 from sklearn.cluster import KMeans,DBSCAN
 from sklearn import metrics
-from sklearn.model_selection import GridSearchCV
 from ateamopt.analysis.cluster_score import silhouette_score,gap_statistic
+from ateamopt.analysis import model_warehouse
+from ateamopt.analysis.embedding_cache import Embedding_Cache
+from ateamopt.analysis.classifier_cv import Classifier_CV
+from ateamopt.analysis import batch_stats
 
 #def silhouette_score(estimator, X):
 #    cluster_labels = estimator.fit_predict(X)
@@ -175,14 +173,26 @@ def wilcoxon_v(x, y=None, zero_method="wilcox", correction=False,
 
 
 class Allactive_Classification(object):
+    # Embeddings and clustering sweeps, set to Embedding_Cache(cache_dir)
+    # to persist them across sessions
+    embedding_cache = Embedding_Cache()
+    # Cross-validation of the classifiers, cached alongside the embeddings
+    # (looked up on every use, so it follows a swapped embedding_cache)
+    classifier_cv = Classifier_CV(
+        cache=lambda: Allactive_Classification.embedding_cache)
+
     def __init__(self, param_file_list=None,metadata_file_list=None,
                      model_perf_filelist=None,me_cluster_data=None,
                      sdk_datapath=None,
                      efeature_file_list = None,
                      protocol_file_list = None,
                      morph_file_list = None,
-                     species=None):
+                     species=None,
+                     warehouse_dir=None):
         self.species = species
+        # Per-cell outputs are read through the warehouse if given
+        self.warehouse = model_warehouse.Model_Warehouse(warehouse_dir) \
+                    if warehouse_dir else None
         self.param_file_list = param_file_list
         self.metadata_file_list = metadata_file_list
         self.sdk_datapath = sdk_datapath
@@ -193,14 +203,21 @@ class Allactive_Classification(object):
         self.morph_file_list = morph_file_list
     
     def allactive_param_data(self,repeat_params,save_data=False):
-        analysis_handler = Optim_Analyzer()
-        func = partial(analysis_handler.convert_aibs_param_to_dict,
-                       repeat_params = repeat_params)
-        p = Pool(multiprocessing.cpu_count())
-        param_dict_list = p.map(func,self.param_file_list)
-        p.close()
-        p.join()
-        param_df = pd.DataFrame(param_dict_list)
+        if self.warehouse:
+            self.warehouse.ingest('params',self.param_file_list,
+                      model_warehouse.read_param_rows,
+                      cell_id_func=model_warehouse.cell_id_from_hof_param,
+                      repeat_params=repeat_params)
+            param_df = self.warehouse.read_table('params')
+        else:
+            analysis_handler = Optim_Analyzer()
+            func = partial(analysis_handler.convert_aibs_param_to_dict,
+                           repeat_params = repeat_params)
+            p = Pool(multiprocessing.cpu_count())
+            param_dict_list = p.map(func,self.param_file_list)
+            p.close()
+            p.join()
+            param_df = pd.DataFrame(param_dict_list)
         if save_data:
             self.save_class_data(param_df,'allactive_params.csv',
                         'allactive_paramsdatatype.csv')
@@ -208,11 +225,15 @@ class Allactive_Classification(object):
     
     def allactive_metadata(self,save_data=False):
         metadata_file_list = self.metadata_file_list
-        metadata_list = []
-        for metadata_file_ in metadata_file_list:
-            metadata_list.append(utility.load_json(metadata_file_))
-            
-        metadata_df = pd.DataFrame(metadata_list)
+        if self.warehouse:
+            self.warehouse.ingest('metadata',metadata_file_list,
+                                  model_warehouse.read_metadata_rows)
+            metadata_df = self.warehouse.read_table('metadata')
+        else:
+            metadata_list = []
+            for metadata_file_ in metadata_file_list:
+                metadata_list.append(utility.load_json(metadata_file_))
+            metadata_df = pd.DataFrame(metadata_list)
         if save_data:
             self.save_class_data(metadata_df,'allactive_metadata.csv',
                         'allactive_metadatatype.csv')
@@ -220,14 +241,15 @@ class Allactive_Classification(object):
         
     def morph_data(self,save_data=False):
         morph_file_list = self.morph_file_list
-        morph_data_list = []
-        for morph_file_ in morph_file_list:
-            morph_dict = utility.load_json(morph_file_)
-            cell_id = morph_file_.split('/')[-2]
-            morph_dict['Cell_id'] = cell_id
-            morph_data_list.append(morph_dict.copy())
-         
-        morph_df = pd.DataFrame(morph_data_list)   
+        if self.warehouse:
+            self.warehouse.ingest('morph',morph_file_list,
+                                  model_warehouse.read_morph_rows)
+            morph_df = self.warehouse.read_table('morph')
+        else:
+            morph_data_list = []
+            for morph_file_ in morph_file_list:
+                morph_data_list.extend(model_warehouse.read_morph_rows(morph_file_))
+            morph_df = pd.DataFrame(morph_data_list)
         if save_data:
             self.save_class_data(morph_df,'morph_data.csv',
                         'morph_datatype.csv')
@@ -256,19 +278,16 @@ class Allactive_Classification(object):
         return me_cluster_df
     
     def model_performance_data(self,save_data=False):
-        metric_list_df = []
         model_perf_filelist = self.model_perf_filelist
-        for metric_file_ in model_perf_filelist:
-            cell_id= metric_file_.split('/')[-2]
-            metric_list = utility.load_pickle(metric_file_)
-            metric_dict = [{'hof_index' : ii, 'Feature_Avg_Train' : metric_list_['Feature_Average'],
-                           'Feature_Avg_Generalization' : metric_list_['Feature_Average_Generalization'],
-                           'Explained_Variance' : metric_list_['Explained_Variance'],
-                           'Seed_Index' : metric_list_['Seed'],
-                           'Cell_id' : cell_id} \
-                           for ii,metric_list_ in enumerate(metric_list)]
-            metric_list_df.extend(metric_dict)
-        perf_metric_df = pd.DataFrame(metric_list_df)
+        if self.warehouse:
+            self.warehouse.ingest('performance',model_perf_filelist,
+                                  model_warehouse.read_performance_rows)
+            perf_metric_df = self.warehouse.read_table('performance')
+        else:
+            metric_list_df = []
+            for metric_file_ in model_perf_filelist:
+                metric_list_df.extend(model_warehouse.read_performance_rows(metric_file_))
+            perf_metric_df = pd.DataFrame(metric_list_df)
         perf_metric_df['Explained_Variance'] *= 100
         
         if save_data:
@@ -310,29 +329,17 @@ class Allactive_Classification(object):
 #        ephys_features_df = pd.DataFrame(features_list)
         
         
-        ephys_dict_list = []
-        for proto_file,efeature_file in zip(protocol_file_list,\
-                                            efeature_file_list):
-            cell_id = proto_file.split('/')[-2]
-            proto_dict = utility.load_json(proto_file)
-            proto_dict = {p_key:p_val['stimuli'][0]['amp'] for p_key,p_val\
-                          in proto_dict.items()}
-            sorted_proto_names = sorted(proto_dict,key=proto_dict.__getitem__)
-            efeature_dict = utility.load_json(efeature_file)
-            
-            
-            for sorted_proto in sorted_proto_names:
-                if 'LongDC_' in sorted_proto:
-                    ephys_dict = {'Cell_id':cell_id}
-                    ephys_dict['stim_name'] = sorted_proto
-                    ephys_dict['amp'] = proto_dict[sorted_proto]
-                    if sorted_proto in efeature_dict.keys():
-                        feat= efeature_dict[sorted_proto]['soma']
-                        feat = {e_key:e_val[0] for e_key,e_val in feat.items()}
-                        ephys_dict.update(feat)
-                    ephys_dict_list.append(ephys_dict)
-        
-        ephys_df= pd.DataFrame(ephys_dict_list)  
+        proto_efeature_files = list(zip(protocol_file_list,efeature_file_list))
+        if self.warehouse:
+            self.warehouse.ingest('ephys',proto_efeature_files,
+                                  model_warehouse.read_ephys_rows)
+            ephys_df = self.warehouse.read_table('ephys')
+        else:
+            ephys_dict_list = []
+            for proto_efeature_file in proto_efeature_files:
+                ephys_dict_list.extend(model_warehouse.read_ephys_rows(
+                                            proto_efeature_file))
+            ephys_df= pd.DataFrame(ephys_dict_list)  
         cell_ids = ephys_df.Cell_id.unique()
         efeat_max_amp_df= pd.concat([ephys_df.loc[ephys_df.Cell_id==cell_id,]\
                          .tail(1) for cell_id in cell_ids])
@@ -447,66 +454,32 @@ class Allactive_Classification(object):
         y_df = data_section.loc[:,[target_field]]
         return X_df,y_df,revised_features
     
-    @staticmethod    
-    def SVM_classifier(X_df,y_df,feature_fields,
-                       target_field,
-                       plot_confusion_mat=False,
-                       conf_mat_figname=None):
-        
-        
-        clf = SVC(kernel='rbf')  
-        svm_pipeline =  Pipeline([('scaler', StandardScaler()),
-                                      ('svc', clf)])
+    @staticmethod
+    def _encode_labels(X_df,y_df,feature_fields,target_field):
         le = preprocessing.LabelEncoder()  
         y_df['label_encoder']= le.fit_transform(y_df[target_field])
         
         X_data = X_df.loc[:,feature_fields].values
         y_data = y_df['label_encoder'].values
-        
-        np.random.seed(0)
-        sampled_arr = np.random.choice(y_data,size=int(1e4))
-        unique, counts = np.unique(sampled_arr, return_counts=True)
-        counts_percentage = counts/np.sum(counts)*100
-        sampled_df = pd.DataFrame(data=counts_percentage,index= \
-                          le.inverse_transform(unique),columns=['percentage'])
-        
-        n_splits = 3
-        skf = StratifiedKFold(n_splits=n_splits,random_state=0) # K-fold train test split 
-        
+        return X_data,y_data,le
+    
+    @staticmethod
+    def _cv_summary(fold_results,le):
         confusion_matrix_list = list()
         score_list = list()
         delta_chance = 0
-        for train_index,test_index in skf.split(X_data,y_data):
-            X_train, X_test = X_data[train_index], X_data[test_index]
-            y_train, y_test = y_data[train_index], y_data[test_index]
-        
-            svm_pipeline.fit(X_train, y_train)
-            y_pred_test = svm_pipeline.predict(X_test)
-            y_pred_chance = np.random.choice(y_test,len(y_test))
-            confusion_matrix_svm = confusion_matrix(y_test, y_pred_test)
+        for fold_result in fold_results:
+            y_test,y_pred_test = fold_result['y_test'],fold_result['y_pred_test']
+            confusion_matrix_fold = confusion_matrix(y_test, y_pred_test)
+            score_list.append(fold_result['score'])
             
-            score = accuracy_score(y_test, y_pred_test)
-            chance_score = accuracy_score(y_test, y_pred_chance)
-            
-            score_list.append(score)
-            if score == max(score_list):
-                best_y_pred = y_pred_test
-                best_y = y_test
-             
             classes = le.inverse_transform(unique_labels(y_test, \
                                             y_pred_test))
-            
-            df_conf_svm = pd.DataFrame(confusion_matrix_svm, classes,
+            df_conf = pd.DataFrame(confusion_matrix_fold, classes,
                   classes)
-            df_conf_svm=df_conf_svm.div(df_conf_svm.sum(axis=1),axis=0)
-            confusion_matrix_list.append(df_conf_svm)
-            
-            
-            cm_svm_normalized = confusion_matrix_svm/np.sum(np.sum(confusion_matrix_svm))
-            cm_svm_normalized *= 100
-            sampled_df = sampled_df.reindex(index=classes)
-            delta_chance += score - chance_score
-
+            df_conf=df_conf.div(df_conf.sum(axis=1),axis=0)
+            confusion_matrix_list.append(df_conf)
+            delta_chance += fold_result['score'] - fold_result['chance_score']
             
         score_avg = np.mean(score_list)*100
         index,columns = confusion_matrix_list[0].index,\
@@ -515,116 +488,44 @@ class Allactive_Classification(object):
                                    axis=0)
         confusion_matrix_df = pd.DataFrame(data=conf_matrix,index=index,
                                            columns=columns)
+        delta_chance = int(delta_chance/len(fold_results)*100)
         
-        delta_chance = int(delta_chance/n_splits*100)
-        
-        
+        # predictions of the last fold
         best_y_pred,best_y = le.inverse_transform(y_pred_test),\
                                     le.inverse_transform(y_test)
-        
-        return int(score_avg),confusion_matrix_df,delta_chance,best_y,best_y_pred,\
-                sampled_df
-            
+        return int(score_avg),confusion_matrix_df,delta_chance,best_y,\
+                    best_y_pred,classes
     
     @staticmethod
-    def RF_classifier(X_df,y_df,feature_fields,target_field,
-                  plot_feat_imp=False,feat_imp_figname=None):
+    def _svm_summary(fold_results,le,y_data):
+        score_avg,confusion_matrix_df,delta_chance,best_y,best_y_pred,\
+            classes = Allactive_Classification._cv_summary(fold_results,le)
         
-        clf = RandomForestClassifier(n_estimators=80, random_state=0)
-        rf_pipeline = Pipeline([('scaler', StandardScaler()),
-                                  ('random_forest', clf)])
-        le = preprocessing.LabelEncoder()   
-        y_df['label_encoder']= le.fit_transform(y_df[target_field])
+        sampled_arr = np.random.RandomState(0).choice(y_data,size=int(1e4))
+        unique, counts = np.unique(sampled_arr, return_counts=True)
+        counts_percentage = counts/np.sum(counts)*100
+        sampled_df = pd.DataFrame(data=counts_percentage,index= \
+                          le.inverse_transform(unique),columns=['percentage'])
+        sampled_df = sampled_df.reindex(index=classes)
         
-        X_data = X_df.loc[:,feature_fields].values
-        y_data = y_df['label_encoder'].values
-
+        return score_avg,confusion_matrix_df,delta_chance,best_y,best_y_pred,\
+                sampled_df
+    
+    @staticmethod
+    def _rf_summary(fold_results,le,feature_fields):
+        score_avg,confusion_matrix_df,delta_chance,best_y,best_y_pred,\
+            _ = Allactive_Classification._cv_summary(fold_results,le)
         
-        n_splits = 3
-        skf = StratifiedKFold(n_splits=n_splits,random_state=0) # K-fold train test split 
-        confusion_matrix_list = list()
-        score_list = list()
-        delta_chance = 0
         feature_imp_df_list = list()
-        np.random.seed(0)
-        
-        for train_index,test_index in skf.split(X_data,y_data):
-            X_train, X_test = X_data[train_index], X_data[test_index]
-            y_train, y_test = y_data[train_index], y_data[test_index]
-            rf_pipeline.fit(X_train, y_train)
-            y_pred_test = rf_pipeline.predict(X_test)
-            y_pred_chance = np.random.choice(y_test,len(y_test))
-            confusion_matrix_rf = confusion_matrix(y_test, y_pred_test)
-            
-            score = accuracy_score(y_test, y_pred_test)
-            score_list.append(score)
-            chance_score = accuracy_score(y_test, y_pred_chance)
-            
-            score_list.append(score)
-            if score == max(score_list):
-                best_y_pred = y_pred_test
-                best_y = y_test
-            
-            classes = le.inverse_transform(unique_labels(y_test, \
-                                        y_pred_test))
-            df_conf_rf= pd.DataFrame(confusion_matrix_rf, classes,
-                  classes)
-            df_conf_rf=df_conf_rf.div(df_conf_rf.sum(axis=1),axis=0)
-            confusion_matrix_list.append(df_conf_rf)
-
-            delta_chance += score - chance_score
-        
-            feature_imp = pd.Series(rf_pipeline.named_steps['random_forest'].feature_importances_,
-                        index=feature_fields).sort_values(ascending=False)
-            feature_fields_sorted = feature_imp.index.values
-            feature_dict = {'importance': [], 'param_name' : []}
-            for tree in rf_pipeline.named_steps['random_forest'].estimators_:
-                for i, param_name_ in enumerate(feature_fields_sorted):
-                    sorted_idx = np.where(np.array(feature_fields) == param_name_)[0][0]
-                    feature_dict['importance'].append(tree.feature_importances_[sorted_idx])
-                    feature_dict['param_name'].append(param_name_)
-            feature_imp_df = pd.DataFrame(feature_dict)
+        for fold_result in fold_results:
+            # per tree importances, features in the order of the forest importance
+            sorted_idx = np.argsort(-fold_result['feature_importances'],
+                                    kind='stable')
+            tree_importances = fold_result['tree_importances'][:,sorted_idx]
+            feature_imp_df = pd.DataFrame({'importance': tree_importances.ravel(),
+                    'param_name': np.tile(np.array(feature_fields)[sorted_idx],
+                                          tree_importances.shape[0])})
             feature_imp_df_list.append(feature_imp_df)
-
-#        
-#        if plot_feat_imp:
-#            fig,ax = plt.subplots(1, figsize = (8,6))
-#            color_list = [color_dict[feature_field_] for feature_field_ in
-#                          feature_fields_sorted]
-#            
-#            feature_fields_cmap = [ckey for ckey in
-#                          color_dict.keys() if ckey in feature_fields_sorted]
-#            cmap_color_list = [color_dict[color_feat] for color_feat in 
-#                               feature_fields_cmap]
-#            my_cmap = ListedColormap(cmap_color_list)
-#            sm = ScalarMappable(cmap=my_cmap, norm=plt.Normalize(0,
-#                                     len(feature_fields_cmap)-1))
-#            sm.set_array([])
-#            ax = sns.barplot(x='param_name', y='importance', data= feature_imp_df,
-#                            order =feature_fields_sorted, 
-#                            palette=color_list,errwidth=1,ax = ax)
-#            ax.set_ylabel('Feature Importance Score')
-#            ax.set_xlabel('')
-#            ax.set_xticklabels(labels=feature_fields_sorted,
-#                               rotation=90,ha = 'center')
-#            cbar = plt.colorbar(sm,boundaries=np.arange(\
-#                                len(feature_fields_sorted)+1)-0.5)
-#            cbar.set_ticks(np.arange(len(feature_fields_cmap)))
-#            cbar.ax.set_yticklabels(feature_fields_cmap, fontsize=10)    
-#            fig.savefig(feat_imp_figname,bbox_inches='tight')
-#            plt.close(fig)
-#        
-        score_avg = np.mean(score_list)*100
-        
-        index,columns = confusion_matrix_list[0].index,\
-                    confusion_matrix_list[0].columns
-        conf_matrix = np.mean([df_.values for df_ in confusion_matrix_list],
-                                   axis=0)
-        confusion_matrix_df = pd.DataFrame(data=conf_matrix,index=index,
-                                           columns=columns)
-        delta_chance = int(delta_chance/n_splits*100)
-        best_y_pred,best_y = le.inverse_transform(y_pred_test),\
-                                    le.inverse_transform(y_test)
         
         param_imp_df = pd.concat(feature_imp_df_list,sort=False,ignore_index=True)
         param_group_dict = param_imp_df.groupby('param_name')['importance'].\
@@ -632,8 +533,88 @@ class Allactive_Classification(object):
         params_sorted =  sorted(param_group_dict, key=param_group_dict.get,
                                 reverse=True)
         
-        return int(score_avg),confusion_matrix_df,delta_chance,best_y,best_y_pred,param_imp_df,\
-                    params_sorted
+        return score_avg,confusion_matrix_df,delta_chance,best_y,best_y_pred,\
+                    param_imp_df,params_sorted
+    
+    @staticmethod    
+    def SVM_classifier(X_df,y_df,feature_fields,
+                       target_field,
+                       plot_confusion_mat=False,
+                       conf_mat_figname=None):
+        
+        X_data,y_data,le = Allactive_Classification._encode_labels(X_df,y_df,
+                                        feature_fields,target_field)
+        fold_results = Allactive_Classification.classifier_cv.\
+                        cross_validate('SVM',X_data,y_data)
+        return Allactive_Classification._svm_summary(fold_results,le,y_data)
+            
+    
+    @staticmethod
+    def RF_classifier(X_df,y_df,feature_fields,target_field,
+                  plot_feat_imp=False,feat_imp_figname=None):
+        
+        X_data,y_data,le = Allactive_Classification._encode_labels(X_df,y_df,
+                                        feature_fields,target_field)
+        fold_results = Allactive_Classification.classifier_cv.\
+                        cross_validate('RF',X_data,y_data)
+        return Allactive_Classification._rf_summary(fold_results,le,
+                                                    feature_fields)
+    
+    @staticmethod
+    def classifier_sweep(data,feature_sets,target_fields,classifier='SVM',
+                         **kwargs):
+        '''
+        Cross-validated classification of every (feature set, target field)
+        combination, all the folds fit in one parallel batch
+        
+        Parameters
+        ----------
+        data : pd.DataFrame
+        feature_sets : dict
+            name -> list of feature fields
+        target_fields : list
+        classifier : str
+            'SVM' or 'RF'
+        kwargs :
+            passed to prepare_data_clf (property_fields, least_pop)
+        
+        Returns
+        -------
+        score_df : pd.DataFrame
+            feature_set, target_field, score, delta_chance per combination
+        results : dict
+            (feature_set, target_field) -> SVM_classifier/RF_classifier output
+        '''
+        combinations,cv_inputs = list(),list()
+        for feature_set,feature_fields in feature_sets.items():
+            for target_field in target_fields:
+                X_df,y_df,revised_features = Allactive_Classification.\
+                    prepare_data_clf(data,feature_fields,target_field,**kwargs)
+                X_data,y_data,le = Allactive_Classification._encode_labels(X_df,
+                                        y_df,revised_features,target_field)
+                combinations.append((feature_set,target_field,le,y_data,
+                                     revised_features))
+                cv_inputs.append((classifier,X_data,y_data))
+        
+        all_fold_results = Allactive_Classification.classifier_cv.\
+                            cross_validate_many(cv_inputs)
+        
+        results,score_list = dict(),list()
+        for (feature_set,target_field,le,y_data,revised_features),fold_results \
+                in zip(combinations,all_fold_results):
+            if classifier == 'RF':
+                result = Allactive_Classification._rf_summary(fold_results,
+                                                le,revised_features)
+            else:
+                result = Allactive_Classification._svm_summary(fold_results,
+                                                le,y_data)
+            results[feature_set,target_field] = result
+            score_list.append({'feature_set':feature_set,
+                               'target_field':target_field,
+                               'score':result[0],
+                               'delta_chance':result[2]})
+        score_df = pd.DataFrame(score_list)
+        return score_df,results
         
     
     @staticmethod
@@ -644,14 +625,12 @@ class Allactive_Classification(object):
                        **kwargs):
         
         
-        umap_pipeline = Pipeline([
-                ('scaling', StandardScaler()), \
-                     ('umap',UMAP())])
         X_data = X_df.loc[:,feature_fields].values
         le = preprocessing.LabelEncoder()   
         y_df['label_encoder']= le.fit_transform(y_df[target_field])
         
-        umap_results = umap_pipeline.fit_transform(X_data)
+        umap_results = Allactive_Classification.embedding_cache.embedding(
+                X_data,feature_fields,'umap',**kwargs.pop('umap_params',{}))
         
         data = pd.concat([X_df,y_df],axis=1)
         data['x-umap'] = umap_results[:,0]
@@ -718,14 +697,12 @@ class Allactive_Classification(object):
     def elbow_method_kmeans(data_,max_clust_num=11,**kwargs):
         from kneed import KneeLocator
         
-        data_= StandardScaler().fit_transform(data_)
-        distortions = []
+        embedding_cache = Allactive_Classification.embedding_cache
+        data_= embedding_cache.scaled(data_)
         clust_num_arr = range(2, max_clust_num)
-        np.random.seed(0)
-        for k in clust_num_arr:
-            kmeans = KMeans(n_clusters=k,max_iter=2000)
-            kmeans.fit(data_)
-            distortions.append(kmeans.inertia_)
+        kmeans_sweep = embedding_cache.estimator_sweep(data_,
+                    KMeans(max_iter=2000,random_state=0),'n_clusters',clust_num_arr)
+        distortions = [kmeans.inertia_ for kmeans,_ in kmeans_sweep]
         
         kn = KneeLocator(clust_num_arr, distortions, curve='convex', direction='decreasing')
         
@@ -748,20 +725,16 @@ class Allactive_Classification(object):
     
     @staticmethod
     def gridsearch_kmeans(data_,max_clust_num=11,**kwargs):
-        data_= StandardScaler().fit_transform(data_)
+        embedding_cache = Allactive_Classification.embedding_cache
+        data_= embedding_cache.scaled(data_)
         
         clust_num_arr = range(2, max_clust_num)
-        param_grid = {"n_clusters": clust_num_arr,'max_iter':[2000]}
-        np.random.seed(0)
-        search_clust = GridSearchCV(
-            KMeans(),
-            param_grid=param_grid,
-            scoring=gap_statistic,
-            cv= [(slice(None), slice(None))]
-            )
-        search_clust.fit(data_)
-        score_arr = search_clust.cv_results_['mean_test_score']
-        optimal_cluster_num =  search_clust.best_estimator_.n_clusters
+        scoring = kwargs.get('scoring') or gap_statistic
+        kmeans_sweep = embedding_cache.estimator_sweep(data_,
+                    KMeans(max_iter=2000,random_state=0),'n_clusters',clust_num_arr,
+                    scoring=scoring)
+        score_arr = np.array([score for _,score in kmeans_sweep])
+        optimal_cluster_num = clust_num_arr[int(np.argmax(score_arr))]
         
         sns.set(style='whitegrid')
         fig,ax = plt.subplots(figsize=(2,2))
@@ -769,7 +742,7 @@ class Allactive_Classification(object):
         ax.vlines(optimal_cluster_num, ax.get_ylim()[0], ax.get_ylim()[1], lw=.5)
         ax.grid(False)
         ax.set_xticks([2,4,6,8])
-        ax.set_title('%s method'%search_clust.scoring.__name__)
+        ax.set_title('%s method'%scoring.__name__)
         ax.set_xlabel('# of clusters')
         ax.set_ylabel('score')  
         sns.despine(ax=ax)
@@ -809,23 +782,17 @@ class Allactive_Classification(object):
     
     @staticmethod
     def gridsearch_dbscan(data_,**kwargs):
-        data_= StandardScaler().fit_transform(data_)
+        embedding_cache = Allactive_Classification.embedding_cache
+        data_= embedding_cache.scaled(data_)
 
         eps_arr = np.linspace(1e-3,5,100)
-        min_samples_arr = range(20) or kwargs.get('min_samples_arr')
-        
-        param_grid = {"eps": eps_arr,'min_samples':min_samples_arr}
-        np.random.seed(1)
-        search_clust = GridSearchCV(
-            DBSCAN(),
-            n_jobs=2,
-            param_grid=param_grid,
-            scoring=silhouette_score,
-            cv= [(slice(None), slice(None))]
-            )
-        search_clust.fit(data_)
-        eps_best,min_sample_best = search_clust.best_estimator_.eps,\
-            search_clust.best_estimator_.min_samples
+        min_samples_arr = kwargs.get('min_samples_arr') or range(1,20)
+        
+        # Silhouette scores of the grid on the shared distance matrix
+        score_grid = embedding_cache.dbscan_grid(data_,eps_arr,min_samples_arr)
+        eps_idx,min_samples_idx = np.unravel_index(np.argmax(score_grid),
+                                                   score_grid.shape)
+        eps_best,min_sample_best = eps_arr[eps_idx],min_samples_arr[min_samples_idx]
         return eps_best,min_sample_best
     
     @staticmethod
@@ -869,12 +836,9 @@ class Allactive_Classification(object):
                        figtitle = '',
                        **kwargs):
         
-        tsne_pipeline = Pipeline([('scaling', StandardScaler()), \
-                     ('tsne',TSNE(n_components=2,perplexity=35,
-                                  random_state =0))])
-            
         X_data = X_df.loc[:,feature_fields].values
-        tsne_results = tsne_pipeline.fit_transform(X_data)
+        tsne_results = self.embedding_cache.embedding(X_data,feature_fields,'tsne',
+                                n_components=2,perplexity=35,random_state=0)
         
         data = pd.concat([X_df,y_df],axis=1)
         data['x-tsne'] = tsne_results[:,0]
@@ -982,29 +946,45 @@ class Allactive_Classification(object):
     
     
     def calc_param_separation(self,hof_param_df):
+        '''
+        calc_param_dist of every cell (in the order of appearance) in one
+        groupby pass over the whole table
+        '''
         hof_param_df = hof_param_df.dropna(how='any',axis=1)
-        cell_ids = hof_param_df.Cell_id.unique()
-        param_df_list = [hof_param_df.loc[hof_param_df.Cell_id == cell_id,]\
-                         for cell_id in cell_ids]
-#        self.calc_param_dist(param_df_list[0])
-        p = Pool(multiprocessing.cpu_count())
-        param_dist_list = p.map(self.calc_param_dist,param_df_list)
-        p.close()
-        p.join()
+        cell_codes,cell_ids = pd.factorize(hof_param_df.Cell_id)
+        hof_param_df = hof_param_df.assign(cell_code=cell_codes).\
+                    sort_values(['cell_code','hof_index'],kind='mergesort')
+        param_fields = [field for field in hof_param_df.columns
+                        if field not in ['Cell_id','hof_index','cell_code']]
+        param_grouped = hof_param_df.groupby('cell_code',sort=True)[param_fields]
+
+        # Parameters constant within a cell are left out of its distances
+        param_varied = (param_grouped.nunique() > 1).values
+        vec_len = param_varied.sum(axis=1)
+        param_mean = param_grouped.transform('mean').values
+        row_codes = hof_param_df.cell_code.values
+        param_values_sub = (hof_param_df[param_fields].values - param_mean)/param_mean
+        param_values_sub = np.where(param_varied[row_codes],param_values_sub,0)
+        sub_norm_vec = np.sqrt(np.sum(param_values_sub**2,axis=1))
+        sub_norm_total = np.bincount(row_codes,weights=sub_norm_vec,
+                                     minlength=len(cell_ids))/vec_len
+        sub_norm_ratio = sub_norm_vec/vec_len[row_codes]
+
+        cell_bounds = np.cumsum(np.bincount(row_codes,minlength=len(cell_ids)))[:-1]
+        param_dist_list = [np.append(sub_norm_ratio_,sub_norm_total_) for
+                           sub_norm_ratio_,sub_norm_total_ in
+                           zip(np.split(sub_norm_ratio,cell_bounds),sub_norm_total)]
         return param_dist_list
         
     @staticmethod
-    def calc_obj_all(all_obj_file_list):
+    def calc_obj_all(all_obj_file_list,warehouse=None):
+        if warehouse:
+            warehouse.ingest('objectives',all_obj_file_list,
+                             model_warehouse.read_obj_rows)
+            return warehouse.read_table('objectives')
         obj_dict_list = [] 
         for obj_file in all_obj_file_list:
-            obj_dict = utility.load_pickle(obj_file)
-            cell_id = obj_file.split('/')[-2]
-            for ii,obj_dict_ in enumerate(obj_dict):
-                hof_obj_dict = {'Cell_id':cell_id,
-                                'hof_index' : ii}
-                hof_obj_dict['Feature_Avg'] = np.mean([val for val in obj_dict_.\
-                            values()])
-                obj_dict_list.append(hof_obj_dict)
+            obj_dict_list.extend(model_warehouse.read_obj_rows(obj_file))
         hof_obj_df = pd.DataFrame(obj_dict_list)
         return hof_obj_df
     
@@ -1094,7 +1074,58 @@ class Allactive_Classification(object):
         return data_dict
     
     @staticmethod
-    def compare_fI_prop(fi_data_df,figname='fI_metric_comparison.pdf'):
+    def fI_prop_long(fi_data_df):
+        # slope/intercept columns as a feature, value_exp/aa/peri table
+        fi_df_list = []
+        for fi_prop in ['slope','intercept']:
+            fi_df_list.append(pd.DataFrame({'feature':fi_prop,
+                      'value_exp':fi_data_df['%s_exp'%fi_prop].values,
+                      'value_aa':fi_data_df['%s_All_active'%fi_prop].values,
+                      'value_peri':fi_data_df['%s_Perisomatic'%fi_prop].values}))
+        return pd.concat(fi_df_list,ignore_index=True)
+    
+    @staticmethod
+    def model_prop_stats(efeature_df,correction='fdr_bh',**kwargs):
+        '''
+        Signed-rank tests of the All-active and Perisomatic models against
+        the experiment for every feature of efeature_df (feature, value_exp,
+        value_aa, value_peri), see batch_stats.paired_feature_tests
+        '''
+        return batch_stats.paired_feature_tests(efeature_df,'value_exp',
+                        {'All-active':'value_aa','Perisomatic':'value_peri'},
+                        correction=correction,**kwargs)
+    
+    @staticmethod
+    def _stat_pvalue(stats_df,feature,model):
+        # (corrected) p-value of the model vs experiment test, None if untested
+        if stats_df is None:
+            return None
+        stat_row = stats_df.loc[(stats_df.feature == feature) & \
+                                (stats_df.model == model),]
+        if stat_row.empty:
+            return None
+        pvalue_field = 'pvalue_corrected' if 'pvalue_corrected' in \
+                        stats_df else 'pvalue'
+        return stat_row[pvalue_field].values[0]
+    
+    @staticmethod
+    def _stat_label(label,stats_df,feature):
+        # legend label with the p-value of the feature
+        pvalue = Allactive_Classification._stat_pvalue(stats_df,feature,label)
+        return label if pvalue is None else '%s (p=%.2g)'%(label,pvalue)
+    
+    @staticmethod
+    def _stat_title(title,stats_df,feature):
+        # axis title with the p-values of both models
+        stat_str = ['%s p=%.2g'%(model_abbr,pvalue) for model,model_abbr in 
+                [('All-active','AA'),('Perisomatic','Peri')] for pvalue in 
+                [Allactive_Classification._stat_pvalue(stats_df,feature,model)]
+                if pvalue is not None]
+        return title if not stat_str else title + '\n' + ', '.join(stat_str)
+    
+    @staticmethod
+    def compare_fI_prop(fi_data_df,figname='fI_metric_comparison.pdf',
+                        stats_df=None):
         utility.create_filepath(figname)
         slope_exp = fi_data_df.slope_exp.values
         slope_aa = fi_data_df.slope_All_active.values
@@ -1124,7 +1155,8 @@ class Allactive_Classification(object):
 
         ax1.set_xlabel('$Hz \:pA^{-1}$')
         ax1.set_ylabel('$Hz \:pA^{-1}$')
-        ax1.set_title('fi slope')
+        ax1.set_title(Allactive_Classification._stat_title('fi slope',
+                                    stats_df,'slope'))
         
         max_intercept = max(max(icpt_exp), max(icpt_aa), 
                             max(icpt_peri))+10
@@ -1136,7 +1168,8 @@ class Allactive_Classification(object):
         
         ax2.set_xlabel('$I_{inj} \:(pA)$')
         ax2.set_ylabel('$I_{inj} \:(pA)$')
-        ax2.set_title('Rheobase')
+        ax2.set_title(Allactive_Classification._stat_title('Rheobase',
+                                    stats_df,'intercept'))
         
         handles = [sc_aa,sc_peri]
         labels = [h.get_label() for h in handles]
@@ -1314,7 +1347,7 @@ class Allactive_Classification(object):
     def compare_ephys_prop(efeature,efeaure_df,
                            figname='efeature_comparison.pdf',
                            axis_label='',
-                           title= '',**kwargs):
+                           title= '',stats_df=None,**kwargs):
         utility.create_filepath(figname)
         select_df = efeaure_df.loc[efeaure_df.feature == \
                            efeature,]
@@ -1339,9 +1372,11 @@ class Allactive_Classification(object):
         ax.plot([min_efeature_amp,max_efeature_amp], [min_efeature_amp,max_efeature_amp],
                  color = 'k', lw = .5)
         scat_peri= ax.scatter(efeature_exp_peri, efeature_peri, color = 'r', 
-                    s = 40, alpha = 0.5, lw = 0,label='Perisomatic')
+                    s = 40, alpha = 0.5, lw = 0,label=Allactive_Classification.\
+                    _stat_label('Perisomatic',stats_df,efeature))
         scat_aa=ax.scatter(efeature_exp_aa, efeature_aa, color = 'b', 
-                    s = 40, alpha = 0.5, lw = 0,label='All-active')
+                    s = 40, alpha = 0.5, lw = 0,label=Allactive_Classification.\
+                    _stat_label('All-active',stats_df,efeature))
         
         xlim_minus,xlim_plus = max(median_efeature-5*feature_iqr,\
                 min_efeature_amp),min(median_efeature+5*feature_iqr,\
@@ -1382,7 +1417,8 @@ class Allactive_Classification(object):
         plt.close(fig)
     
     @staticmethod
-    def compare_AP_prop(AP_data_df,figname='AP_metric_comparison.pdf'):
+    def compare_AP_prop(AP_data_df,figname='AP_metric_comparison.pdf',
+                        stats_df=None):
         utility.create_filepath(figname)
         AP_amp_df = AP_data_df.loc[AP_data_df.feature == \
                            'AP_amplitude_from_voltagebase',]
@@ -1423,7 +1459,8 @@ class Allactive_Classification(object):
 
         ax1.set_xlabel('$mV$')
         ax1.set_ylabel('$mV$')
-        ax1.set_title('AP amplitude')
+        ax1.set_title(Allactive_Classification._stat_title('AP amplitude',
+                                    stats_df,'AP_amplitude_from_voltagebase'))
 
         ax2.plot([0,max_AP_width], [0,max_AP_width], color = 'k', lw = .5)
         ax2.scatter(AP_width_exp_aa, AP_width_aa, color = 'b', 
@@ -1433,7 +1470,8 @@ class Allactive_Classification(object):
         
         ax2.set_xlabel('$ms$')
         ax2.set_ylabel('$ms$')
-        ax2.set_title('AP width')
+        ax2.set_title(Allactive_Classification._stat_title('AP width',
+                                    stats_df,'AP_width'))
         
         handles = [AP_amp_aa,AP_amp_peri]
         labels = [h.get_label() for h in handles]
@@ -1,24 +1,160 @@
-from scipy import interpolate
 import numpy as np
 import scipy.signal as signal
 import pandas as pd
 import os
+from functools import lru_cache
+
+def get_spike_shape_matrix(time, voltage, spike_times, AP_shape_time,
+                           prefix_pad=10.5, postfix_pad=15.5):
+    """
+    Action potential waveforms of all the spikes resampled on AP_shape_time
+    (relative to the spike times) in one batched linear interpolation, each
+    relative to its value at AP_shape_time[0]
+
+    Returns
+    -------
+    np.ndarray
+        n_spikes x len(AP_shape_time), spikes whose window is not fully
+        inside the trace are dropped
+    """
+    time = np.asarray(time, dtype=float)
+    voltage = np.asarray(voltage, dtype=float)
+    AP_shape_time = np.asarray(AP_shape_time, dtype=float)
+    spike_times = np.asarray(spike_times if spike_times is not None else [],
+                             dtype=float)
+
+    # Windows of the spikes, dropping the ones running off the trace
+    min_index = np.searchsorted(time, spike_times - prefix_pad)
+    max_index = np.searchsorted(time, spike_times + postfix_pad)
+    valid = (min_index < len(time)) & (max_index < len(time)) & \
+        (time[np.minimum(min_index, len(time) - 1)] <= spike_times + AP_shape_time[0]) & \
+        (spike_times + AP_shape_time[-1] <= time[-1])
+    spike_times = spike_times[valid]
+
+    AP_shapes = np.interp(spike_times[:, None] + AP_shape_time[None, :],
+                          time, voltage)
+    return AP_shapes - AP_shapes[:, :1]
+
+
+def get_average_spike_shape(time, voltage, spike_times, AP_shape_time,
+                            return_matrix=False, return_variance=False):
+    """
+    Mean action potential waveform, optionally with the per spike matrix
+    and the variance across spikes
+
+    Returns
+    -------
+    AP_shape_mean : np.ndarray
+    AP_shapes : np.ndarray
+        n_spikes x len(AP_shape_time), if return_matrix
+    AP_shape_var : np.ndarray
+        if return_variance
+    """
+    AP_shapes = get_spike_shape_matrix(time, voltage, spike_times,
+                                       AP_shape_time)
+    if len(AP_shapes):
+        AP_shape_mean = AP_shapes.mean(axis=0)
+        AP_shape_var = AP_shapes.var(axis=0)
+    else:
+        AP_shape_mean = AP_shape_var = np.full(len(AP_shape_time), np.nan)
+    output = [AP_shape_mean]
+    if return_matrix:
+        output.append(AP_shapes)
+    if return_variance:
+        output.append(AP_shape_var)
+    return output[0] if len(output) == 1 else tuple(output)
+
 
 def get_spike_shape(time,voltage,spike_times,
                     AP_shape_time, AP_shape_voltage):
+    # Sum of the spike waveforms added to AP_shape_voltage
+    AP_shape_voltage += get_spike_shape_matrix(time, voltage, spike_times,
+                                               AP_shape_time).sum(axis=0)
+    return AP_shape_voltage
+
+
+def efel_distance(feature_values, exp_mean, exp_std, max_score=250,
+                  force_max_score=False):
+    """
+    eFEL distance (mean absolute deviation in units of the experimental
+    std) from already computed feature values, same as efel.getDistance
+    """
+    if feature_values is None or len(feature_values) == 0:
+        return max_score
+    score = np.mean(np.abs(np.asarray(feature_values, dtype=float) - exp_mean)) \
+        / exp_std
+    if np.isnan(score):
+        return max_score
+    if force_max_score:
+        score = min(score, max_score)
+    return score
+
+
+def _efel_feature_key(feature):
+    return (feature.name, feature.efel_feature_name,
+            tuple(sorted(feature.recording_names.items())),
+            feature.stim_start, feature.stim_end, feature.threshold)
+
+
+def calculate_multi_target_scores(response, targets):
+    """
+    Score a response against several feature sets computing every eFEL
+    feature only once
     
-    prefix_pad = 10.5 #should cover 2ms (default)
-    postfix_pad = 15.5 #should cover 5ms
+    Parameters
+    ----------
+    response : dict or list
+        simulated responses (or a list with the responses as first element)
+    targets : OrderedDict
+        target name (e.g. train/all/test) to the list of bluepyopt 
+        eFELFeatures of the target
+        
+    Returns
+    -------
+    obj_dicts : dict
+        target name to the objective dictionary
+    feature_dict : dict
+        mean feature value for every feature in the targets
+        
+    """
+    import efel
     
-    for i,spike_time in enumerate(spike_times):
-        min_index = np.argmax(time >= spike_time - prefix_pad) 
-        max_index = np.argmax(time >= spike_time + postfix_pad) 
-        AP_shape = voltage[min_index:max_index]
-        t_shape  = time[min_index:max_index] - spike_time
-        f_shape = interpolate.interp1d(t_shape, AP_shape)
-        AP_shape_voltage += f_shape(AP_shape_time)- \
-                f_shape(AP_shape_time[0])
-    return AP_shape_voltage
+    responses = response[0] if isinstance(response, (list, tuple)) \
+        else response
+    
+    feature_values = {}
+    feature_dict = {}
+    for target_features in targets.values():
+        for feature in target_features:
+            feature_key = _efel_feature_key(feature)
+            if feature_key in feature_values:
+                continue
+            efel_trace = feature._construct_efel_trace(responses)
+            if efel_trace is None:
+                values = None
+            else:
+                feature._setup_efel()
+                values = efel.getFeatureValues([efel_trace], 
+                            [feature.efel_feature_name],
+                            raise_warnings=False)[0][feature.efel_feature_name]
+                efel.reset()
+            feature_values[feature_key] = (efel_trace is not None, values)
+            feature_dict[feature.name] = np.mean(values) \
+                if values is not None and len(values) > 0 else None
+    
+    obj_dicts = {}
+    for target_name, target_features in targets.items():
+        obj_dict = {}
+        for feature in target_features:
+            trace_valid, values = feature_values[_efel_feature_key(feature)]
+            if not trace_valid:
+                obj_dict[feature.name] = feature.max_score
+            else:
+                obj_dict[feature.name] = efel_distance(values, feature.exp_mean,
+                            feature.exp_std, feature.max_score, 
+                            feature.force_max_score)
+        obj_dicts[target_name] = obj_dict
+    return obj_dicts, feature_dict
 
 
 def calculate_spike_time_metrics(expt_trains, model_train, total_length, dt, sigma):
@@ -44,28 +180,141 @@ def calculate_spike_time_metrics(expt_trains, model_train, total_length, dt, sig
         Explained variance in percentage
         
     """
-    trialtotrial_expvar_result = []
+    return calculate_spike_time_metrics_batch(expt_trains, [model_train],
+                                              total_length, dt, sigma)[0]
+
+
+@lru_cache(maxsize=None)
+def _gauss_autocorrelation(sigma, dt):
+    # Autocorrelation R(d) = sum_u g(u)g(u+d) of the Gaussian window, lag d at d+W-1
+    sigma_points = sigma / dt
+    gauss_func = signal.windows.gaussian(int(10 * sigma_points), sigma_points)
+    autocorr = signal.fftconvolve(gauss_func, gauss_func[::-1])
+    autocorr.setflags(write=False)
+    return autocorr, gauss_func.sum(), len(gauss_func)
+
+
+def _lagged_pair_sums(a, b, autocorr, window_length, a_groups=None,
+                      n_groups=1):
+    """
+    sum over the spike pairs (a_i, b_j) of R(a_i - b_j), per group of a_i,
+    only pairs closer than the window contribute
+    """
+    b = np.sort(b)
+    lo = np.searchsorted(b, a - window_length + 1)
+    hi = np.searchsorted(b, a + window_length)
+    counts = hi - lo
+    n_pairs = counts.sum()
+    if not n_pairs:
+        return np.zeros(n_groups)
+    b_idx = np.repeat(lo - np.cumsum(counts) + counts, counts) + \
+        np.arange(n_pairs)
+    lags = np.repeat(a, counts) - b[b_idx]
+    weights = autocorr[lags + window_length - 1]
+    if a_groups is None:
+        return np.array([weights.sum()])
+    return np.bincount(np.repeat(a_groups, counts), weights=weights,
+                       minlength=n_groups)
+
+
+def prepare_expt_spike_statistics(expt_trains, total_length, dt, sigma):
+    """
+    Statistics of the Gaussian convolved experimental trials needed by
+    calculate_spike_time_metrics_batch, computed once per stimulus and sigma
+    from the spike indices (no dense trains)
+
+    Returns
+    -------
+    list
+        one dict per sigma
+    """
+    expt_trains = [np.unique(np.asarray(et, dtype=int)) for et in expt_trains]
+    all_expt_spikes = np.concatenate(expt_trains) if expt_trains else \
+        np.array([], dtype=int)
+    n_trials = len(expt_trains)
+    expt_stats = []
     for s in sigma:
-        sigma_points = s / dt
-        window_length = 10 * sigma_points
-        gauss_func = signal.gaussian(window_length, sigma_points)
-        binary_expt_trains = []
-        for et in expt_trains:
-            bt = np.zeros(total_length)
-            if len(et) > 0:
-                bt[et] = 1
-            binary_expt_trains.append(bt)
-        convolved_expt_trains = [signal.fftconvolve(gauss_func, bt_) for bt_ in binary_expt_trains]
-        avg_convolved_expt_train = np.mean(convolved_expt_trains, axis=0)
-        binary_model_train = np.zeros(total_length)
-        if len(model_train) > 0:
-            binary_model_train[model_train] = 1
-        convolved_model_train = signal.fftconvolve(gauss_func, binary_model_train)
-
-        f = np.array(convolved_expt_trains)
-        trialtotrial_expvar_result.append(trial_expvar(f, convolved_model_train) / trial_expvar(f, avg_convolved_expt_train))
-
-    return np.array(trialtotrial_expvar_result)
+        autocorr, gauss_sum, window_length = _gauss_autocorrelation(s, dt)
+        conv_length = total_length + window_length - 1
+        fbar = len(all_expt_spikes) * gauss_sum / (n_trials * conv_length)
+        # sum over trials and time of f^2 and of the trial average squared
+        f_sq = sum(_lagged_pair_sums(et, et, autocorr, window_length)[0]
+                   for et in expt_trains)
+        favg_sq = _lagged_pair_sums(all_expt_spikes, all_expt_spikes,
+                                    autocorr, window_length)[0] / n_trials**2
+        expt_stats.append({'sigma': s, 'n_trials': n_trials,
+                           'spikes': all_expt_spikes,
+                           'conv_length': conv_length, 'fbar': fbar,
+                           'F2': f_sq - n_trials * conv_length * fbar**2,
+                           'G': favg_sq - conv_length * fbar**2})
+    return expt_stats
+
+
+def calculate_spike_time_metrics_batch(expt_trains, model_trains, total_length,
+                                       dt, sigma, expt_stats=None):
+    """
+    Explained variance of many models against the same experimental trials,
+    same as calculate_spike_time_metrics for each model.
+
+    With m the convolved model train, f the convolved trials (n trials) and
+    favg their average, trial_expvar(f, m) reduces to
+    2n sum_t (m_t - mbar)(favg_t - fbar) / (F2 + n sum_t (m_t - mbar)^2),
+    every sum over t being a sum over spike pairs of the window
+    autocorrelation.
+
+    Parameters
+    ----------
+    expt_trains : list
+        list of nparrays of the spike time indices of the experimental trials
+    model_trains : list
+        list of nparrays of the spike time indices of each model
+    total_length : int
+        the total number of time bins
+    dt : float
+        Time step between each bin
+    sigma : list
+        Lengths of the Gaussian convolution window (same units as dt)
+    expt_stats : list
+        prepare_expt_spike_statistics output, computed if not provided
+
+    Returns
+    -------
+    np.array
+        explained variance, n_models x n_sigma
+    """
+    if expt_stats is None:
+        expt_stats = prepare_expt_spike_statistics(expt_trains, total_length,
+                                                   dt, sigma)
+    n_models = len(model_trains)
+    model_trains = [np.unique(np.asarray(mt, dtype=int)) for mt in model_trains]
+    model_spikes = np.concatenate(model_trains + [np.array([], dtype=int)])
+    model_groups = np.repeat(np.arange(n_models),
+                             [len(mt) for mt in model_trains])
+    n_spikes = np.bincount(model_groups, minlength=n_models)
+
+    expvar_result = np.empty((n_models, len(expt_stats)))
+    for k, stats in enumerate(expt_stats):
+        autocorr, gauss_sum, window_length = _gauss_autocorrelation(
+            stats['sigma'], dt)
+        n_trials = stats['n_trials']
+        conv_length = stats['conv_length']
+        mbar = n_spikes * gauss_sum / conv_length
+
+        # models apart by more than the window never pair with each other
+        offset_spikes = model_spikes + model_groups * (total_length + 2 * window_length)
+        m_sq = _lagged_pair_sums(offset_spikes, offset_spikes, autocorr,
+                                 window_length, model_groups, n_models)
+        m_favg = _lagged_pair_sums(model_spikes, stats['spikes'], autocorr,
+                                   window_length, model_groups,
+                                   n_models) / n_trials
+        m_var = m_sq - conv_length * mbar**2
+        m_cov = m_favg - conv_length * mbar * stats['fbar']
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ev_model = 2 * n_trials * m_cov / (stats['F2'] + n_trials * m_var)
+            ev_avg = 2 * n_trials * stats['G'] / (stats['F2'] + n_trials * stats['G'])
+            expvar_result[:, k] = ev_model / ev_avg
+    return expvar_result
 
 
 def trial_expvar(f, m):
@@ -0,0 +1,208 @@
+import os
+import glob
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from ateamopt.utils import utility
+
+logger = logging.getLogger(__name__)
+
+
+class Analysis_Pipeline(object):
+    '''
+    The analysis as a DAG of named steps producing artifacts (files).
+
+    A step is stale when the content of its input files, its parameters
+    or an upstream step changed since it last ran, or when one of its
+    outputs (or of the optional outputs it wrote last time) is missing. Only the stale steps are run (their old outputs removed
+    first), independent steps in parallel threads. Steps which are not
+    thread safe (NEURON, eFEL, pyplot) are added as exclusive and never
+    overlap each other. Steps forking processes are added with forks, they
+    run in the calling thread while no other step is running.
+    '''
+
+    def __init__(self, manifest_path, nthreads=4):
+        self.manifest_path = manifest_path
+        self.nthreads = nthreads
+        self.nodes = OrderedDict()
+        if os.path.exists(manifest_path):
+            self.manifest = utility.load_json(manifest_path)
+        else:
+            self.manifest = {'nodes': {}, 'file_hashes': {}}
+        self._node_hashes = {}
+        self._exclusive_lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+
+    def add_node(self, name, func, outputs=(), input_files=(), depends_on=(),
+                 params=None, exclusive=False, forks=False, optional_outputs=()):
+        '''
+        Parameters
+        ----------
+        name : str
+            name of the step
+        func : callable
+            called without arguments, reads its inputs and writes its outputs
+        outputs : list
+            files or directories written by func
+        optional_outputs : list
+            files (or glob patterns) func writes depending on the data
+        input_files : list
+            files or directories func reads, besides the outputs of depends_on,
+            hashed again only when their size or modification time changed
+        depends_on : list
+            names of the upstream steps
+        params : dict
+            json serializable settings affecting the outputs
+        exclusive : bool
+            step is not thread safe
+        forks : bool
+            step starts process pools, which must not be forked from a
+            worker thread or next to running steps
+        '''
+        for dep in depends_on:
+            if dep not in self.nodes:
+                raise Exception('Unknown dependency %s of %s' % (dep, name))
+        self.nodes[name] = {'func': func,
+                            'outputs': [output for output in outputs if output],
+                            'input_files': [input_file for input_file in input_files
+                                            if input_file],
+                            'optional_outputs': [output for output in optional_outputs
+                                                 if output],
+                            'depends_on': list(depends_on),
+                            'params': params or {},
+                            'exclusive': exclusive,
+                            'forks': forks}
+
+    def file_hash(self, path):
+        '''Content hash of a file or directory, cached on mtime and size'''
+        if not os.path.exists(path):
+            return None
+        if os.path.isdir(path):
+            dir_hash = hashlib.sha1()
+            for root, dirs, files in sorted(os.walk(path)):
+                dirs.sort()
+                for filename in sorted(files):
+                    file_path = os.path.join(root, filename)
+                    dir_hash.update(os.path.relpath(file_path, path).encode())
+                    dir_hash.update(self.file_hash(file_path).encode())
+            return dir_hash.hexdigest()
+
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        cached = self.manifest['file_hashes'].get(abs_path)
+        if cached and cached['mtime'] == stat.st_mtime and \
+                cached['size'] == stat.st_size:
+            return cached['hash']
+
+        content_hash = hashlib.sha1()
+        with open(abs_path, 'rb') as file_read:
+            for chunk in iter(lambda: file_read.read(1 << 20), b''):
+                content_hash.update(chunk)
+        self.manifest['file_hashes'][abs_path] = {'mtime': stat.st_mtime,
+                                                  'size': stat.st_size,
+                                                  'hash': content_hash.hexdigest()}
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def written_outputs(node):
+        '''The outputs and the optional outputs which exist'''
+        outputs = list(node['outputs'])
+        for output in node['optional_outputs']:
+            if glob.has_magic(output):
+                outputs.extend(sorted(glob.glob(output)))
+            elif os.path.exists(output):
+                outputs.append(output)
+        return outputs
+
+    def node_hash(self, name):
+        '''Hash of the inputs, parameters and upstream steps of a step'''
+        if name not in self._node_hashes:
+            node = self.nodes[name]
+            node_inputs = {'params': node['params'],
+                           'input_files': [[os.path.abspath(input_file),
+                                            self.file_hash(input_file)]
+                                           for input_file in node['input_files']],
+                           'depends_on': [[dep, self.node_hash(dep)]
+                                          for dep in node['depends_on']]}
+            self._node_hashes[name] = hashlib.sha1(json.dumps(
+                node_inputs, sort_keys=True, default=str).encode()).hexdigest()
+        return self._node_hashes[name]
+
+    def stale_nodes(self):
+        '''OrderedDict of step name to the reason it is stale (None if up to date)'''
+        self._node_hashes = {}
+        stale = OrderedDict()
+        for name, node in self.nodes.items():
+            node_record = self.manifest['nodes'].get(name)
+            recorded_outputs = node_record.get('outputs', []) if node_record else []
+            missing_outputs = [output for output in
+                               node['outputs'] + [output for output in recorded_outputs
+                                                  if output not in node['outputs']]
+                               if not os.path.exists(output)]
+            stale_deps = [dep for dep in node['depends_on'] if stale[dep]]
+            if not node_record:
+                stale[name] = 'never run'
+            elif node_record['hash'] != self.node_hash(name):
+                stale[name] = 'inputs changed'
+            elif missing_outputs:
+                stale[name] = 'missing %s' % ', '.join(missing_outputs)
+            elif stale_deps:
+                stale[name] = 'upstream %s stale' % ', '.join(stale_deps)
+            else:
+                stale[name] = None
+        return stale
+
+    def save_manifest(self):
+        utility.create_filepath(self.manifest_path)
+        utility.save_json(self.manifest_path, self.manifest)
+
+    def _run_node(self, name):
+        node = self.nodes[name]
+        for output in self.written_outputs(node):
+            if os.path.isdir(output):
+                shutil.rmtree(output)
+            elif os.path.exists(output):
+                os.remove(output)
+
+        logger.debug('Running analysis step %s', name)
+        if node['exclusive']:
+            with self._exclusive_lock:
+                node['func']()
+        else:
+            node['func']()
+
+        with self._manifest_lock:
+            self.manifest['nodes'][name] = {'hash': self.node_hash(name),
+                                            'outputs': self.written_outputs(node)}
+            self.save_manifest()
+
+    def run(self):
+        '''Run the stale steps, returns their names'''
+        stale = [name for name, reason in self.stale_nodes().items() if reason]
+        done = set(self.nodes) - set(stale)
+        pending = list(stale)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.nthreads) as executor:
+            while pending or running:
+                ready = [name for name in pending if
+                         all(dep in done for dep in self.nodes[name]['depends_on'])]
+                for name in ready:
+                    if not self.nodes[name]['forks']:
+                        pending.remove(name)
+                        running[executor.submit(self._run_node, name)] = name
+                ready_forks = [name for name in ready if self.nodes[name]['forks']]
+                if ready_forks and not running:
+                    pending.remove(ready_forks[0])
+                    self._run_node(ready_forks[0])
+                    done.add(ready_forks[0])
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    future.result()
+                    done.add(name)
+        return stale
@@ -0,0 +1,303 @@
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+from scipy.stats import distributions
+
+logger = logging.getLogger(__name__)
+
+
+def pad_samples(sample_list):
+    '''List of 1D samples as a nan padded (n_samples x max length) array'''
+    max_len = max([len(sample) for sample in sample_list] + [1])
+    padded = np.full((len(sample_list), max_len), np.nan)
+    for ii, sample in enumerate(sample_list):
+        padded[ii, :len(sample)] = sample
+    return padded
+
+
+def rank_rows(values):
+    '''
+    Average ranks (ties share the mean rank) along the rows, nan excluded
+
+    Returns
+    -------
+    ranks : np.ndarray
+        same shape as values, nan where values is nan
+    tie_term : np.ndarray
+        sum of t**3 - t over the tie groups of each row
+    '''
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    n_rows, n_cols = values.shape
+    order = np.argsort(values, axis=1, kind='mergesort')  # nan last
+    sorted_values = np.take_along_axis(values, order, axis=1)
+
+    new_group = np.ones_like(sorted_values, dtype=bool)
+    new_group[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    group_id = np.cumsum(new_group.ravel()) - 1
+    positions = np.tile(np.arange(1, n_cols + 1, dtype=float), n_rows)
+    group_size = np.bincount(group_id)
+    group_rank = np.bincount(group_id, weights=positions)/group_size
+
+    sorted_ranks = group_rank[group_id].reshape(n_rows, n_cols)
+    sorted_ranks[np.isnan(sorted_values)] = np.nan
+    ranks = np.empty_like(sorted_ranks)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=1)
+
+    group_valid = ~np.isnan(sorted_values.ravel()[new_group.ravel()])
+    group_row = np.repeat(np.arange(n_rows), new_group.sum(axis=1))
+    tie_size = group_size[group_valid].astype(float)
+    tie_term = np.bincount(group_row[group_valid], weights=tie_size**3 - tie_size,
+                           minlength=n_rows)
+    return ranks, tie_term
+
+
+def _normal_pvalue(z, alternative):
+    if alternative == 'two-sided':
+        return 2.*distributions.norm.sf(np.abs(z))
+    elif alternative == 'greater':
+        return distributions.norm.sf(z)
+    return distributions.norm.cdf(z)
+
+
+def _continuity(statistic, mean, correction, alternative):
+    if not correction:
+        return 0
+    if alternative == 'two-sided':
+        return 0.5*np.sign(statistic - mean)
+    elif alternative == 'less':
+        return -0.5
+    return 0.5
+
+
+def signed_rank_test(x, y=None, zero_method='wilcox', correction=False,
+                     alternative='two-sided'):
+    '''
+    Wilcoxon signed-rank test (normal approximation, as wilcoxon_v) of every
+    row at once, nan marks a missing pair
+
+    Parameters
+    ----------
+    x, y : array-like
+        n_tests x n_pairs, the differences x - y are tested (x if y is None)
+
+    Returns
+    -------
+    statistic, pvalue : np.ndarray
+        min(r_plus, r_minus) for two-sided, r_plus otherwise; nan for the
+        rows without non-zero differences
+    '''
+    if zero_method not in ['wilcox', 'pratt', 'zsplit']:
+        raise Exception("Zero method should be either 'wilcox' "
+                        "or 'pratt' or 'zsplit'")
+    d = np.atleast_2d(np.asarray(x, dtype=float))
+    if y is not None:
+        d = d - np.atleast_2d(np.asarray(y, dtype=float))
+
+    n_zero = np.sum(d == 0, axis=1)
+    if zero_method == 'wilcox':
+        d = np.where(d == 0, np.nan, d)
+    count = np.sum(~np.isnan(d), axis=1)
+
+    r, _ = rank_rows(np.abs(d))
+    r = np.nan_to_num(r)
+    r_plus = np.sum((d > 0)*r, axis=1)
+    r_minus = np.sum((d < 0)*r, axis=1)
+    if zero_method == 'zsplit':
+        r_zero = np.sum((d == 0)*r, axis=1)
+        r_plus += r_zero/2.
+        r_minus += r_zero/2.
+
+    statistic = np.minimum(r_plus, r_minus) if alternative == 'two-sided' \
+        else r_plus
+    mn = count*(count + 1.)*0.25
+    se = count*(count + 1.)*(2.*count + 1.)
+    if zero_method == 'pratt':
+        # ties among the non-zero differences only
+        mn -= n_zero*(n_zero + 1.)*0.25
+        se -= n_zero*(n_zero + 1.)*(2.*n_zero + 1.)
+        _, tie_term = rank_rows(np.where(d == 0, np.nan, np.abs(d)))
+    else:
+        _, tie_term = rank_rows(np.abs(d))
+    se = np.sqrt((se - 0.5*tie_term)/24)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (statistic - mn - _continuity(statistic, mn, correction,
+                                          alternative))/se
+    pvalue = _normal_pvalue(z, alternative)
+    no_test = (count - (n_zero if zero_method == 'pratt' else 0)) == 0
+    statistic, pvalue = statistic.astype(float), np.asarray(pvalue, dtype=float)
+    statistic[no_test], pvalue[no_test] = np.nan, np.nan
+    return statistic, pvalue
+
+
+def rank_sum_test(x, y, correction=False, alternative='two-sided'):
+    '''
+    Wilcoxon rank-sum (Mann-Whitney U, normal approximation with tie
+    correction) of every row of x against the same row of y, nan padded
+
+    Returns
+    -------
+    statistic : np.ndarray
+        U of x
+    pvalue : np.ndarray
+    '''
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n1 = np.sum(~np.isnan(x), axis=1).astype(float)
+    n2 = np.sum(~np.isnan(y), axis=1).astype(float)
+    n = n1 + n2
+
+    ranks, tie_term = rank_rows(np.hstack((x, y)))
+    r1 = np.nansum(ranks[:, :x.shape[1]], axis=1)
+    statistic = r1 - n1*(n1 + 1)/2.
+    mn = n1*n2/2.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sd = np.sqrt(n1*n2/12.*((n + 1) - tie_term/(n*(n - 1))))
+        z = (statistic - mn - _continuity(statistic, mn, correction,
+                                          alternative))/sd
+    pvalue = np.asarray(_normal_pvalue(z, alternative), dtype=float)
+    no_test = (n1 == 0) | (n2 == 0)
+    statistic[no_test], pvalue[no_test] = np.nan, np.nan
+    return statistic, pvalue
+
+
+def adjust_pvalues(pvalues, method='fdr_bh'):
+    '''
+    Multiple comparison correction, nan p-values are left out of the family
+
+    Parameters
+    ----------
+    method : str
+        'fdr_bh' (Benjamini-Hochberg), 'bonferroni' or 'holm'
+    '''
+    pvalues = np.asarray(pvalues, dtype=float)
+    adjusted = np.full(pvalues.shape, np.nan)
+    valid = ~np.isnan(pvalues)
+    p = pvalues[valid]
+    m = len(p)
+    if not m:
+        return adjusted
+
+    if method == 'bonferroni':
+        p_adj = p*m
+    elif method in ['holm', 'fdr_bh']:
+        order = np.argsort(p, kind='mergesort')
+        p_sorted = p[order]
+        if method == 'holm':
+            p_sorted = np.maximum.accumulate((m - np.arange(m))*p_sorted)
+        else:
+            p_sorted = np.minimum.accumulate((m/np.arange(1., m + 1)*p_sorted)
+                                             [::-1])[::-1]
+        p_adj = np.empty(m)
+        p_adj[order] = p_sorted
+    else:
+        raise Exception('Unknown correction method %s' % method)
+    adjusted[valid] = np.minimum(p_adj, 1)
+    return adjusted
+
+
+def _correct(stat_df, correction, alpha, correction_by):
+    if not correction:
+        return stat_df
+    if correction_by:
+        stat_df['pvalue_corrected'] = stat_df.groupby(correction_by)['pvalue'].\
+            transform(lambda pvalue: adjust_pvalues(pvalue.values, correction))
+    else:
+        stat_df['pvalue_corrected'] = adjust_pvalues(stat_df['pvalue'].values,
+                                                     correction)
+    stat_df['significant'] = stat_df['pvalue_corrected'] < alpha
+    return stat_df
+
+
+def paired_feature_tests(feature_df, x_field, y_fields, feature_field='feature',
+                         correction='fdr_bh', alpha=0.05, correction_by=None,
+                         **kwargs):
+    '''
+    Signed-rank tests of y against x for every feature and y field at once
+
+    Parameters
+    ----------
+    feature_df : pd.DataFrame
+        long format, a row per (cell, feature)
+    x_field : str
+        column of the reference values (e.g. value_exp)
+    y_fields : dict
+        name -> column compared with x_field (e.g. {'All-active': 'value_aa'})
+    correction : str
+        see adjust_pvalues, None for no correction
+    correction_by : list
+        columns defining the families corrected separately
+    kwargs :
+        passed to signed_rank_test
+
+    Returns
+    -------
+    stat_df : pd.DataFrame
+        feature, model, n, statistic, pvalue (pvalue_corrected, significant)
+    '''
+    features = list(pd.unique(feature_df[feature_field]))
+    feature_groups = feature_df.groupby(feature_field, sort=False)
+    stat_list = []
+    for y_name, y_field in y_fields.items():
+        x_list, y_list = [], []
+        for feature in features:
+            pair_df = feature_groups.get_group(feature)[[x_field, y_field]].dropna()
+            x_list.append(pair_df[x_field].values)
+            y_list.append(pair_df[y_field].values)
+        statistic, pvalue = signed_rank_test(pad_samples(y_list),
+                                             pad_samples(x_list), **kwargs)
+        stat_list.append(pd.DataFrame({feature_field: features, 'model': y_name,
+                                       'n': [len(x_) for x_ in x_list],
+                                       'statistic': statistic,
+                                       'pvalue': pvalue}))
+    stat_df = pd.concat(stat_list, ignore_index=True)
+    return _correct(stat_df, correction, alpha, correction_by)
+
+
+def group_feature_tests(data, feature_fields, group_field, group_pairs=None,
+                        correction='fdr_bh', alpha=0.05, correction_by=None,
+                        **kwargs):
+    '''
+    Rank-sum tests of every feature between every pair of groups at once
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        wide format, a row per cell
+    group_pairs : list
+        (group_1, group_2) tuples, all pairs of the groups by default
+    kwargs :
+        passed to rank_sum_test
+
+    Returns
+    -------
+    stat_df : pd.DataFrame
+        feature, group_1, group_2, n_1, n_2, statistic, pvalue
+        (pvalue_corrected, significant)
+    '''
+    groups = {group: group_df[feature_fields].values.astype(float).T
+              for group, group_df in data.groupby(group_field)}
+    if group_pairs is None:
+        group_pairs = list(itertools.combinations(sorted(groups), 2))
+
+    x_list, y_list = [], []
+    for group_1, group_2 in group_pairs:
+        for ii in range(len(feature_fields)):
+            x_ = groups[group_1][ii] if group_1 in groups else np.array([])
+            y_ = groups[group_2][ii] if group_2 in groups else np.array([])
+            x_list.append(x_[~np.isnan(x_)])
+            y_list.append(y_[~np.isnan(y_)])
+    statistic, pvalue = rank_sum_test(pad_samples(x_list), pad_samples(y_list),
+                                      **kwargs)
+
+    stat_df = pd.DataFrame({'feature': np.tile(feature_fields, len(group_pairs)),
+                            'group_1': np.repeat([pair[0] for pair in group_pairs],
+                                                 len(feature_fields)),
+                            'group_2': np.repeat([pair[1] for pair in group_pairs],
+                                                 len(feature_fields)),
+                            'n_1': [len(x_) for x_ in x_list],
+                            'n_2': [len(y_) for y_ in y_list],
+                            'statistic': statistic,
+                            'pvalue': pvalue})
+    return _correct(stat_df, correction, alpha, correction_by)
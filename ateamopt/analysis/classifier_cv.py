@@ -0,0 +1,124 @@
+import logging
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold
+from ateamopt.analysis.embedding_cache import Embedding_Cache
+
+logger = logging.getLogger(__name__)
+
+
+def svm_pipeline():
+    return Pipeline([('scaler', StandardScaler()),
+                     ('svc', SVC(kernel='rbf'))])
+
+
+def rf_pipeline():
+    return Pipeline([('scaler', StandardScaler()),
+                     ('random_forest', RandomForestClassifier(n_estimators=80,
+                                                              random_state=0))])
+
+
+classifier_pipelines = {'SVM': svm_pipeline, 'RF': rf_pipeline}
+
+
+def _cv_fold(pipeline, X_data, y_data, train_index, test_index, seed):
+    '''
+    Fit and score a single fold, the chance prediction is drawn from
+    a generator seeded per fold so the result does not depend on the
+    order the folds are run in
+    '''
+    X_train, X_test = X_data[train_index], X_data[test_index]
+    y_train, y_test = y_data[train_index], y_data[test_index]
+    pipeline.fit(X_train, y_train)
+    y_pred_test = pipeline.predict(X_test)
+    y_pred_chance = np.random.RandomState(seed).choice(y_test, len(y_test))
+
+    # the fitted pipeline is not kept, only what the analysis reads
+    fold_result = {'y_test': y_test,
+                   'y_pred_test': y_pred_test,
+                   'score': accuracy_score(y_test, y_pred_test),
+                   'chance_score': accuracy_score(y_test, y_pred_chance)}
+
+    estimator = pipeline.steps[-1][1]
+    if hasattr(estimator, 'estimators_'):
+        # n_trees x n_features
+        fold_result['tree_importances'] = np.array([tree.feature_importances_
+                                                    for tree in estimator.estimators_])
+        fold_result['feature_importances'] = estimator.feature_importances_
+    return fold_result
+
+
+class Classifier_CV(object):
+    '''
+    Stratified k-fold cross-validation of the classifiers, the folds of
+    one or many (data, classifier) combinations run in a single parallel
+    batch. The fold predictions, scores and (random forest) importances are
+    cached on the data, labels and classifier, so that only the new
+    combinations are fit.
+    '''
+
+    def __init__(self, cache=None, n_splits=3, n_jobs=-1, seed=0):
+        # Embedding_Cache, or a callable returning the one in use
+        self._cache = cache or Embedding_Cache()
+        self.n_splits = n_splits
+        self.n_jobs = n_jobs
+        self.seed = seed
+
+    @property
+    def cache(self):
+        if callable(self._cache):
+            return self._cache()
+        return self._cache
+
+    def key(self, classifier, X_data, y_data):
+        cv_data = np.column_stack((X_data, y_data))
+        return self.cache.key(cv_data, 'cv_%s' % classifier,
+                              n_splits=self.n_splits, seed=self.seed)
+
+    def folds(self, y_data):
+        # Unshuffled splits, the folds of the original serial loop
+        skf = StratifiedKFold(n_splits=self.n_splits)
+        return list(skf.split(np.zeros(len(y_data)), y_data))
+
+    def cross_validate_many(self, cv_inputs):
+        '''
+        Parameters
+        ----------
+        cv_inputs : list
+            (classifier, X_data, y_data), classifier in classifier_pipelines
+
+        Returns
+        -------
+        list of fold results (dicts, see _cv_fold) per cv input
+        '''
+        cv_keys = [self.key(classifier, X_data, y_data)
+                   for classifier, X_data, y_data in cv_inputs]
+        cv_results = [self.cache.get(cv_key) for cv_key in cv_keys]
+
+        fold_tasks, task_owner = [], []
+        for ii, (classifier, X_data, y_data) in enumerate(cv_inputs):
+            if cv_results[ii] is not None:
+                continue
+            for fold_idx, (train_index, test_index) in \
+                    enumerate(self.folds(y_data)):
+                fold_tasks.append(delayed(_cv_fold)(
+                    classifier_pipelines[classifier](), X_data, y_data,
+                    train_index, test_index, self.seed + fold_idx))
+                task_owner.append(ii)
+
+        if fold_tasks:
+            logger.debug('Fitting %s cross-validation folds', len(fold_tasks))
+            fold_results = Parallel(n_jobs=self.n_jobs)(fold_tasks)
+            for ii in sorted(set(task_owner)):
+                cv_results[ii] = self.cache.put(cv_keys[ii], [
+                    fold_result for owner, fold_result in
+                    zip(task_owner, fold_results) if owner == ii])
+        return cv_results
+
+    def cross_validate(self, classifier, X_data, y_data):
+        return self.cross_validate_many([(classifier, X_data, y_data)])[0]
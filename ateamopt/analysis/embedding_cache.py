@@ -0,0 +1,203 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import joblib
+from collections import OrderedDict
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
+from sklearn.neighbors import NearestNeighbors
+from sklearn.metrics import pairwise_distances
+from sklearn import metrics
+from ateamopt.utils import utility
+
+logger = logging.getLogger(__name__)
+
+
+def data_hash(data):
+    data = np.ascontiguousarray(data, dtype=float)
+    content_hash = hashlib.sha1(data.tobytes())
+    content_hash.update(str(data.shape).encode())
+    return content_hash.hexdigest()
+
+
+def precomputed_silhouette_score(labels, dist_matrix):
+    # -1 for a single cluster or all singletons (as the silhouette scorer)
+    num_labels = len(set(labels))
+    if num_labels == 1 or num_labels == len(labels):
+        return -1
+    return metrics.silhouette_score(dist_matrix, labels, metric='precomputed')
+
+
+def _fit_score(estimator, data, scoring=None):
+    estimator.fit(data)
+    score = scoring(estimator, data) if scoring else None
+    return estimator, score
+
+
+def _dbscan_score(dist_matrix, eps, min_samples):
+    from sklearn.cluster import DBSCAN
+    labels = DBSCAN(eps=eps, min_samples=min_samples,
+                    metric='precomputed').fit_predict(dist_matrix)
+    return precomputed_silhouette_score(labels, dist_matrix)
+
+
+class Embedding_Cache(object):
+    '''
+    Cache of the embeddings and clustering sweeps of the classification,
+    keyed on the data hash, method and hyperparameters. The standardized
+    matrix, k-nearest neighbors and pairwise distances of a dataset are
+    computed once and shared by every embedding and grid point.
+
+    The max_memory_items most recently used results are kept in memory
+    and, with cache_dir, every result is persisted with joblib.
+    '''
+
+    def __init__(self, cache_dir=None, n_jobs=-1, max_memory_items=32):
+        self.cache_dir = cache_dir
+        self.n_jobs = n_jobs
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+
+    def key(self, data, method, **params):
+        key_params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha1(('%s|%s|%s' % (data_hash(data), method,
+                                           key_params)).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '%s.pkl' % key)
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                value = joblib.load(self._path(key))
+            except:
+                logger.debug('Cache entry %s is corrupt' % key)
+                return None
+            self._remember(key, value)
+            return value
+        return None
+
+    def clear_memory(self):
+        self._memory.clear()
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.cache_dir:
+            utility.create_dirpath(self.cache_dir)
+            joblib.dump(value, self._path(key))
+        return value
+
+    def cached(self, key, func, *args, **kwargs):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, func(*args, **kwargs))
+        return value
+
+    def scaled(self, data):
+        '''Standardized data'''
+        return self.cached(self.key(data, 'scaled'),
+                           StandardScaler().fit_transform, data)
+
+    def distances(self, data_scaled):
+        '''Pairwise euclidean distances of the (scaled) data'''
+        return self.cached(self.key(data_scaled, 'distances'),
+                           pairwise_distances, data_scaled, n_jobs=self.n_jobs)
+
+    def knn(self, data_scaled, n_neighbors):
+        '''
+        (indices, distances) of the n_neighbors nearest neighbors (self
+        included), sliced from the largest k already computed
+        '''
+        knn_key = self.key(data_scaled, 'knn')
+        knn_indices, knn_dists = self.get(knn_key) or (None, None)
+        if knn_indices is None or knn_indices.shape[1] < n_neighbors:
+            knn_dists, knn_indices = NearestNeighbors(
+                n_neighbors=n_neighbors, n_jobs=self.n_jobs).\
+                fit(data_scaled).kneighbors(data_scaled)
+            self.put(knn_key, (knn_indices, knn_dists))
+        return knn_indices[:, :n_neighbors], knn_dists[:, :n_neighbors]
+
+    def embedding(self, data, feature_fields, method, **params):
+        '''
+        2D embedding ('umap' or 'tsne') of the standardized data, params are
+        passed to the UMAP/TSNE estimator
+        '''
+        embed_key = self.key(data, method, feature_fields=list(feature_fields),
+                             **params)
+        embedding = self.get(embed_key)
+        if embedding is not None:
+            return embedding
+
+        data_scaled = self.scaled(data)
+        if method == 'umap':
+            from umap import UMAP
+            n_neighbors = params.get('n_neighbors', 15)
+            try:
+                umap_obj = UMAP(precomputed_knn=self.knn(data_scaled, n_neighbors) +
+                                (None,), **params)
+            except TypeError:
+                umap_obj = UMAP(**params)
+            embedding = umap_obj.fit_transform(data_scaled)
+        elif method == 'tsne':
+            from sklearn.manifold import TSNE
+            embedding = TSNE(**params).fit_transform(data_scaled)
+        else:
+            raise Exception('Unknown embedding method %s' % method)
+        return self.put(embed_key, embedding)
+
+    def estimator_sweep(self, data, estimator, param_name, param_values,
+                        scoring=None):
+        '''
+        Fit clones of estimator over param_values in parallel
+
+        Returns
+        -------
+        list of (fitted estimator, score) in the order of param_values
+        '''
+        base_params = {key: val for key, val in estimator.get_params().items()
+                       if key != param_name}
+        sweep_key = self.key(data, type(estimator).__name__, param_name=param_name,
+                             param_values=list(param_values),
+                             scoring=getattr(scoring, '__name__', scoring),
+                             **base_params)
+        sweep_result = self.get(sweep_key)
+        if sweep_result is None:
+            sweep_result = Parallel(n_jobs=self.n_jobs)(
+                delayed(_fit_score)(clone(estimator).set_params(**{param_name: val}),
+                                    data, scoring) for val in param_values)
+            self.put(sweep_key, sweep_result)
+        return sweep_result
+
+    def dbscan_grid(self, data_scaled, eps_arr, min_samples_arr):
+        '''
+        Silhouette score of DBSCAN over the eps x min_samples grid (eps
+        outer), on the shared precomputed distances
+
+        Returns
+        -------
+        scores : np.ndarray
+            len(eps_arr) x len(min_samples_arr)
+        '''
+        grid_key = self.key(data_scaled, 'dbscan_grid', eps_arr=list(eps_arr),
+                            min_samples_arr=list(min_samples_arr))
+        scores = self.get(grid_key)
+        if scores is None:
+            dist_matrix = self.distances(data_scaled)
+            scores = Parallel(n_jobs=self.n_jobs)(
+                delayed(_dbscan_score)(dist_matrix, eps, min_samples)
+                for eps in eps_arr for min_samples in min_samples_arr)
+            scores = np.reshape(scores, (len(eps_arr), len(min_samples_arr)))
+            self.put(grid_key, scores)
+        return scores
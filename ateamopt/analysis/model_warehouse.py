@@ -0,0 +1,258 @@
+import os
+import json
+import hashlib
+import logging
+import multiprocessing
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+import pandas as pd
+from ateamopt.utils import utility
+from ateamopt.analysis.optim_analysis import Optim_Analyzer
+
+logger = logging.getLogger(__name__)
+
+
+def cell_id_from_dir(file_path):
+    # .../<cell_id>/<filename>
+    if isinstance(file_path, (tuple, list)):
+        file_path = file_path[0]
+    return file_path.split('/')[-2]
+
+
+def cell_id_from_hof_param(file_path):
+    # hof_param_<cell_id>_<hof_index>.json
+    return file_path.split('_')[-2]
+
+
+def read_param_rows(param_file, repeat_params=[]):
+    return [Optim_Analyzer.convert_aibs_param_to_dict(param_file,
+                                                      repeat_params=repeat_params)]
+
+
+def read_metadata_rows(metadata_file):
+    return [utility.load_json(metadata_file)]
+
+
+def read_morph_rows(morph_file):
+    morph_dict = utility.load_json(morph_file)
+    morph_dict['Cell_id'] = cell_id_from_dir(morph_file)
+    return [morph_dict]
+
+
+def read_performance_rows(metric_file):
+    cell_id = cell_id_from_dir(metric_file)
+    return [{'hof_index': ii, 'Feature_Avg_Train': metric_['Feature_Average'],
+             'Feature_Avg_Generalization': metric_['Feature_Average_Generalization'],
+             'Explained_Variance': metric_['Explained_Variance'],
+             'Seed_Index': metric_['Seed'],
+             'Cell_id': cell_id}
+            for ii, metric_ in enumerate(utility.load_pickle(metric_file))]
+
+
+def read_obj_rows(obj_file):
+    cell_id = cell_id_from_dir(obj_file)
+    return [{'Cell_id': cell_id, 'hof_index': ii,
+             'Feature_Avg': np.mean([val for val in obj_dict_.values()])}
+            for ii, obj_dict_ in enumerate(utility.load_pickle(obj_file))]
+
+
+def read_ephys_rows(proto_efeature_files):
+    proto_file, efeature_file = proto_efeature_files
+    cell_id = cell_id_from_dir(proto_file)
+    proto_dict = utility.load_json(proto_file)
+    proto_dict = {p_key: p_val['stimuli'][0]['amp'] for p_key, p_val
+                  in proto_dict.items()}
+    sorted_proto_names = sorted(proto_dict, key=proto_dict.__getitem__)
+    efeature_dict = utility.load_json(efeature_file)
+
+    ephys_dict_list = []
+    for sorted_proto in sorted_proto_names:
+        if 'LongDC_' in sorted_proto:
+            ephys_dict = {'Cell_id': cell_id}
+            ephys_dict['stim_name'] = sorted_proto
+            ephys_dict['amp'] = proto_dict[sorted_proto]
+            if sorted_proto in efeature_dict.keys():
+                feat = efeature_dict[sorted_proto]['soma']
+                feat = {e_key: e_val[0] for e_key, e_val in feat.items()}
+                ephys_dict.update(feat)
+            ephys_dict_list.append(ephys_dict)
+    return ephys_dict_list
+
+
+def _read_cell_partition(reader, cell_files):
+    cell_rows = []
+    for cell_file in cell_files:
+        cell_rows.extend(reader(cell_file))
+    return pd.DataFrame(cell_rows)
+
+
+class Model_Warehouse(object):
+    '''
+    Columnar copy of the per-cell model outputs (parameters, metadata,
+    morphology, performance ...), one table per kind with a Parquet (or
+    Feather) partition per cell. A manifest keeps the mtime, size and
+    content hash of the files each partition was read from, so only the
+    new or changed cells are read again.
+
+    Layout::
+
+        warehouse_dir/manifest.json
+        warehouse_dir/<table>/<cell_id>.parquet
+    '''
+
+    manifest_filename = 'manifest.json'
+
+    def __init__(self, warehouse_dir, fmt='parquet', nprocs=None):
+        self.warehouse_dir = warehouse_dir
+        self.fmt = fmt
+        self.nprocs = nprocs or multiprocessing.cpu_count()
+        self.manifest_path = os.path.join(warehouse_dir, self.manifest_filename)
+        if os.path.exists(self.manifest_path):
+            self.manifest = utility.load_json(self.manifest_path)
+        else:
+            self.manifest = {}
+
+    def save_manifest(self):
+        utility.create_dirpath(self.warehouse_dir)
+        utility.save_json(self.manifest_path, self.manifest)
+
+    def _partition_path(self, table, cell_id):
+        return os.path.join(self.warehouse_dir, table, '%s.%s' % (cell_id, self.fmt))
+
+    def _write_partition(self, partition_df, partition_path):
+        utility.create_filepath(partition_path)
+        if self.fmt == 'feather':
+            partition_df.reset_index(drop=True).to_feather(partition_path)
+        else:
+            partition_df.to_parquet(partition_path, index=False)
+
+    def _read_partition(self, partition_path):
+        if self.fmt == 'feather':
+            return pd.read_feather(partition_path)
+        return pd.read_parquet(partition_path)
+
+    @staticmethod
+    def _file_hash(file_path):
+        content_hash = hashlib.sha1()
+        with open(file_path, 'rb') as file_read:
+            for chunk in iter(lambda: file_read.read(1 << 20), b''):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    def _file_state(self, file_path, file_record=None):
+        # mtime, size and content hash, the hash of file_record is reused
+        # when the mtime and size match
+        stat = os.stat(file_path)
+        if file_record and file_record['mtime'] == stat.st_mtime and \
+                file_record['size'] == stat.st_size:
+            return file_record
+        return {'mtime': stat.st_mtime, 'size': stat.st_size,
+                'hash': self._file_hash(file_path)}
+
+    def _cell_changed(self, cell_record, cell_files, file_states):
+        # mtime and size first, the content only when those differ. The
+        # states of the files are collected in file_states.
+        if cell_record is None or \
+                sorted(cell_record['files'].keys()) != sorted(cell_files):
+            return True
+        changed = False
+        for file_path in cell_files:
+            file_record = cell_record['files'][file_path]
+            file_states[file_path] = self._file_state(file_path, file_record)
+            if file_states[file_path]['hash'] != file_record['hash']:
+                changed = True
+        if not changed:
+            cell_record['files'] = {file_path: file_states[file_path]
+                                    for file_path in cell_files}
+        return changed
+
+    def ingest(self, table, file_list, reader, cell_id_func=cell_id_from_dir,
+               prune=False, **reader_kwargs):
+        '''
+        Bring the cells of file_list up to date in a table. The cells of
+        other cohorts ingested into the same table are kept unless prune,
+        read_table returns the cells of the last ingest by default.
+
+        Parameters
+        ----------
+        table : str
+        file_list : list
+            per-cell output files (or tuples of files read together)
+        reader : callable
+            module level function, file -> list of row dicts
+        cell_id_func : callable
+            file -> Cell_id
+        prune : bool
+            drop the cells of the table which are not in file_list
+        reader_kwargs :
+            passed to reader, a change rebuilds the table
+
+        Returns
+        -------
+        updated_cells : list
+        '''
+        cell_files = OrderedDict()
+        for file_entry in file_list:
+            cell_files.setdefault(str(cell_id_func(file_entry)), []).append(file_entry)
+
+        reader_kwargs_record = json.loads(json.dumps(reader_kwargs))
+        table_record = self.manifest.get(table)
+        if table_record is None or \
+                table_record['reader_kwargs'] != reader_kwargs_record:
+            table_record = {'reader_kwargs': reader_kwargs_record, 'cells': {}}
+            self.manifest[table] = table_record
+
+        def flatten(files):
+            flat_files = []
+            for file_entry in files:
+                flat_files.extend(file_entry if isinstance(file_entry, (tuple, list))
+                                  else [file_entry])
+            return flat_files
+
+        file_states = {}
+        updated_cells = [cell_id for cell_id, files in cell_files.items()
+                         if self._cell_changed(table_record['cells'].get(cell_id),
+                                               flatten(files), file_states) or
+                         not os.path.exists(self._partition_path(table, cell_id))]
+
+        if updated_cells:
+            logger.debug('Reading %s cells into %s', len(updated_cells), table)
+            read_func = partial(_read_cell_partition, partial(reader, **reader_kwargs))
+            nprocs = min(self.nprocs, len(updated_cells))
+            if nprocs > 1:
+                with multiprocessing.Pool(nprocs) as pool:
+                    partitions = pool.map(read_func, [cell_files[cell_id]
+                                                      for cell_id in updated_cells])
+            else:
+                partitions = list(map(read_func, [cell_files[cell_id]
+                                                  for cell_id in updated_cells]))
+            for cell_id, partition_df in zip(updated_cells, partitions):
+                self._write_partition(partition_df, self._partition_path(table, cell_id))
+                table_record['cells'][cell_id] = {'files': {
+                    file_path: file_states.get(file_path) or self._file_state(file_path)
+                    for file_path in flatten(cell_files[cell_id])}}
+
+        if prune:
+            for cell_id in list(table_record['cells'].keys()):
+                if cell_id not in cell_files:
+                    partition_path = self._partition_path(table, cell_id)
+                    if os.path.exists(partition_path):
+                        os.remove(partition_path)
+                    del table_record['cells'][cell_id]
+        table_record['order'] = list(cell_files.keys())
+        self.save_manifest()
+        return updated_cells
+
+    def read_table(self, table, cell_ids=None):
+        '''Table as a DataFrame, the cells in the order they were ingested'''
+        table_record = self.manifest.get(table)
+        if table_record is None:
+            raise Exception('Table %s not in the warehouse %s' % (table,
+                                                                self.warehouse_dir))
+        cell_ids = cell_ids or table_record['order']
+        partitions = [self._read_partition(self._partition_path(table, cell_id))
+                      for cell_id in cell_ids]
+        if not partitions:
+            return pd.DataFrame()
+        return pd.concat(partitions, ignore_index=True, sort=False)
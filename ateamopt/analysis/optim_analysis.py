@@ -15,16 +15,76 @@ import math
 import efel
 import seaborn as sns
 import copy
-from .analysis_module import get_spike_shape,calculate_spike_time_metrics
+import shutil
+import multiprocessing
+from functools import partial
+from .analysis_module import get_spike_shape_matrix,get_average_spike_shape,\
+            calculate_spike_time_metrics_batch,\
+            calculate_multi_target_scores
+from .response_store import Response_Store, load_response
+from ateamopt.optim_algorithms import response_capture_path,\
+    evaluate_with_responses
 
 logger = logging.getLogger(__name__)
 
+# Hall of fame responses and stimulus windows of hof_statistics, set once
+# per worker instead of being pickled for every model
+_hof_statistics_data = {}
+
+
+def _is_noise_recording(recording_name):
+    return 'Noise' in recording_name
+
+
+def _init_hof_statistics(hof_response_list, stim_windows):
+    _hof_statistics_data['responses'] = hof_response_list
+    _hof_statistics_data['stim_windows'] = stim_windows
+
+
+def _model_noise_spiketimes(model_idx):
+    '''eFEL spike times of a hall of fame model on the Noise stimuli'''
+    hof_response_list = _hof_statistics_data['responses']
+    stim_windows = _hof_statistics_data['stim_windows']
+    spiketimes_model = OrderedDict()
+    for noise_stim,noise_resp in hof_response_list[model_idx][0].items():
+        if 'Noise' not in noise_stim:
+            continue
+        noise_stim_name = noise_stim.split('.')[0]
+        stim_start, stim_stop = stim_windows[noise_stim_name]
+        trace = {'T': noise_resp['time'], 'V': noise_resp['voltage'],
+                 'stim_start': [stim_start], 'stim_end': [stim_stop]}
+        spiketimes_model[noise_stim] = efel.getFeatureValues(
+            [trace], ['peak_time'])[0]['peak_time']
+    return spiketimes_model
+
+def complete_captured_response(evaluator, evaluate, params_response):
+    '''
+    Simulate the protocols of evaluator missing from a response captured
+    during the optimization (which only ran the training protocols),
+    through the evaluation function of the evaluator (toolbox.evaluate)
+    '''
+    params, response = params_response
+    responses = dict(response[0])
+    missing_protocols = [protocol_name for protocol_name in
+                         evaluator.fitness_protocols.keys()
+                         if not any(recording_name.split('.')[0] == protocol_name
+                                    for recording_name in responses)]
+    if missing_protocols:
+        _, missing_responses = evaluate_with_responses(
+            evaluator, evaluate, params, protocol_names=missing_protocols)
+        responses.update(missing_responses)
+    return [responses]
+
+
 class Optim_Analyzer(object):
 
     def __init__(self,job_config=None,opt_obj=None):
         self._opt = opt_obj
+        self.plot_point_budget = 5000
         if job_config:
             self.stage_jobconfig = job_config['stage_jobconfig']
+            self.plot_point_budget = self.stage_jobconfig.get(
+                'plot_point_budget', self.plot_point_budget)
             self.highlevel_job_props = job_config['highlevel_jobconfig']
             self.job_config = job_config
             self.cp_dir = self.stage_jobconfig['cp_dir']
@@ -33,15 +93,31 @@ class Optim_Analyzer(object):
             else:
                 self._cp_path = None
 
+    def __getstate__(self):
+        # The report sections are pickled to spawned processes, which
+        # don't get the ipyparallel map of the optimizer
+        state = self.__dict__.copy()
+        if getattr(self._opt, 'map_function', None):
+            opt = copy.copy(self._opt)
+            opt.map_function = None
+            opt.toolbox = copy.copy(opt.toolbox)
+            opt.toolbox.register('map', map)
+            state['_opt'] = opt
+        return state
+
+    def _plot_trace(self, ax, x, y, x_range=None, **kwargs):
+        '''ax.plot with the trace decimated to the plot point budget'''
+        x, y = utility.decimate_trace(x, y, self.plot_point_budget, x_range)
+        return ax.plot(x, y, **kwargs)
+
     def get_best_cp_seed(self):
         checkpoint_dir  = os.path.join(self.cp_dir,'seed*.pkl')
         file_list = glob.glob(checkpoint_dir)
 
         cp_min = float('inf')
         for filename in file_list:
-            cp = utility.load_pickle(filename)
-            cp_log = cp['logbook']
-            cp_log_min =  np.min(np.array(cp_log.select('min')))
+            cp_summary = utility.load_cp_summary(filename)
+            cp_log_min =  np.min(np.array(cp_summary['logbook']['min']))
             if cp_log_min < cp_min:
                 cp_min = cp_log_min
                 cp_best = filename
@@ -55,8 +131,8 @@ class Optim_Analyzer(object):
 
 
     def get_best_model(self, hof_idx = 0):
-        checkpoint = utility.load_pickle(self._cp_path)
-        best_model = [checkpoint['halloffame'][hof_idx]] # least training error
+        cp_summary = utility.load_cp_summary(self._cp_path)
+        best_model = [cp_summary['halloffame'][hof_idx]] # least training error
         return best_model
 
 
@@ -67,7 +143,7 @@ class Optim_Analyzer(object):
         hof_params = []
         seed_indices = []
         for i,cp_file in enumerate(cp_list):
-            hof_i = utility.load_pickle(cp_file)['halloffame']
+            hof_i = utility.load_cp_summary(cp_file)['halloffame']
             hof_params.extend(hof_i)
             seed = [cp_file.split('/')[1].split('.')[0]]*len(hof_i)
             seed_indices.extend(seed)
@@ -91,6 +167,65 @@ class Optim_Analyzer(object):
         return hof_response_list
 
 
+    def get_model_response_store(self, hof_params, store_dir, chunk_size=50,
+                                 capture_dir=None):
+        '''
+        Responses of the hall-of-fame models in a Response_Store, simulated
+        in chunks so that only a chunk of responses is held in memory.
+        Responses captured during the optimization (capture_dir) are
+        reused and only the missing ones are simulated.
+        '''
+        if Response_Store.exists(store_dir):
+            store = Response_Store(store_dir)
+            if len(store) == len(hof_params):
+                logger.debug('Retrieving Hall of Fame Responses')
+                return store
+            logger.debug('Response store does not match the Hall of Fame')
+            shutil.rmtree(store_dir)
+
+        logger.debug('Calculating Hall of Fame Responses')
+        store = Response_Store(store_dir)
+        n_captured = 0
+        for i in range(0, len(hof_params), chunk_size):
+            param_chunk = hof_params[i:i+chunk_size]
+            response_chunk = [None] * len(param_chunk)
+            if capture_dir and os.path.isdir(capture_dir):
+                captured = []
+                for j, params in enumerate(param_chunk):
+                    capture_path = response_capture_path(capture_dir, params)
+                    if os.path.exists(capture_path):
+                        captured.append(j)
+                if captured:
+                    complete_responses = self._opt.toolbox.map(
+                        partial(complete_captured_response, self._opt.evaluator,
+                                self._opt.toolbox.evaluate),
+                        [(param_chunk[j], utility.load_pickle(
+                            response_capture_path(capture_dir, param_chunk[j])))
+                         for j in captured])
+                    for j, response in zip(captured, complete_responses):
+                        response_chunk[j] = response
+                n_captured += len(captured)
+            missing = [j for j, response in enumerate(response_chunk)
+                       if response is None]
+            if missing:
+                sim_responses = self._opt.toolbox.map(
+                    self._opt.toolbox.save_sim_response,
+                    [param_chunk[j] for j in missing])
+                for j, response in zip(missing, sim_responses):
+                    response_chunk[j] = response
+            store.add_responses(response_chunk, param_chunk)
+        logger.debug('%s of %s Hall of Fame Responses captured during the '
+                     'optimization', n_captured, len(hof_params))
+        return store
+
+    def map_responses(self, func, response_list, chunk_size=50):
+        '''map over (possibly lazily loaded) responses chunk by chunk'''
+        result_list = []
+        for i in range(0, len(response_list), chunk_size):
+            result_list.extend(self._opt.toolbox.map(func,
+                                    response_list[i:i+chunk_size]))
+        return result_list
+
     def get_response_scores(self,response_list):
         logger.debug('Calculating Objectives for Responses')
         opt = self._opt
@@ -103,6 +238,26 @@ class Optim_Analyzer(object):
         feature_list = list(opt.toolbox.map(opt.toolbox.evaluate_features,response_list))
         return feature_list
 
+    def get_response_scores_multi_target(self, response_list, opt_targets):
+        '''
+        Objectives for several feature sets (e.g. train/all/test) and the
+        features in a single pass over the responses
+        
+        opt_targets : OrderedDict of target name and optimizer
+        '''
+        logger.debug('Calculating Objectives and Features for Responses')
+        targets = OrderedDict()
+        for target_name, opt_target in opt_targets.items():
+            targets[target_name] = [objective.features[0] for objective in 
+                    opt_target.evaluator.fitness_calculator.objectives]
+        
+        score_func = partial(calculate_multi_target_scores, targets=targets)
+        score_list = self.map_responses(score_func, response_list)
+        obj_lists = {target_name: [obj_dicts[target_name] for obj_dicts,_ 
+                            in score_list] for target_name in targets.keys()}
+        feature_list = [feature_dict for _,feature_dict in score_list]
+        return obj_lists, feature_list
+
     @staticmethod
     def organize_models(param_list, score_list_train):
         param_list_arranged = [x for _,x in sorted(zip(score_list_train,
@@ -128,13 +283,11 @@ class Optim_Analyzer(object):
 
     def save_GA_evolultion_info(self,GA_evol_path):
 
-        checkpoint = utility.load_pickle(self._cp_path)
-
-        log = checkpoint['logbook']
-        gen_numbers = log.select('gen')
-        mean = np.array(log.select('avg'))
-        std = np.array(log.select('std'))
-        minimum = np.array(log.select('min'))
+        log = utility.load_cp_summary(self._cp_path)['logbook']
+        gen_numbers = log['gen']
+        mean = np.array(log['avg'])
+        std = np.array(log['std'])
+        minimum = np.array(log['min'])
 
         logger.debug('Saving the plot_GA_evolution parameters')
         GA_evolution_params = {'gen_numbers': gen_numbers,
@@ -287,12 +440,28 @@ class Optim_Analyzer(object):
 
         return aibs_format_params
 
+    def grid_Response_pages(self, stim_file, n_col=3, n_row=5):
+        '''Number of pages plot_grid_Response draws'''
+        stim_df = pd.read_csv(stim_file, sep='\s*,\s*',
+                               header=0, encoding='ascii', engine='python')
+        all_plots = 0
+        for trace_rep in stim_df['DataPath'].tolist():
+            rep_id = trace_rep.split('|')[0]
+            if rep_id.split('.')[0] in self._opt.evaluator.fitness_protocols.keys():
+                all_plots += len(trace_rep.split('|'))
+        return int(math.ceil(all_plots/float(n_col*n_row)))
+
     def plot_grid_Response(self,response_filename,
                       response_release_filename,
                       stim_file,pdf_pages,
                       resp_comparison = 'All-active',
                       save_model_response = False,
-                      model_response_dir = 'model_response/'):
+                      model_response_dir = 'model_response/',
+                      pages = None):
+        '''
+        Model vs experiment responses in a grid, pages (list of page
+        indices) restricts the plotting to those pages
+        '''
 
         stim_df = pd.read_csv(stim_file, sep='\s*,\s*',
                                header=0, encoding='ascii', engine='python')
@@ -304,9 +473,9 @@ class Optim_Analyzer(object):
         opt = self._opt # Optimizer object
 
         logger.debug('Retrieving Optimized and Released Responses')
-        response = utility.load_pickle(response_filename)[0] # response with minimum training error
+        response = load_response(response_filename) # response with minimum training error
         try:
-            responses_release = utility.load_pickle(response_release_filename)[0]
+            responses_release = load_response(response_release_filename)
         except:
             logger.debug('No released %s model'%resp_comparison)
         
@@ -333,9 +502,11 @@ class Optim_Analyzer(object):
         n_col = 3; n_row = 5
         fig_per_page = n_col * n_row
         fig_pages =  int(math.ceil(all_plots/float(fig_per_page)))
-        fig_mat = list()
-        ax_mat = list()
-        for page_i in range(fig_pages):
+        if pages is None:
+            pages = range(fig_pages)
+        fig_mat = dict()
+        ax_mat = dict()
+        for page_i in pages:
 
             fig,ax = plt.subplots(n_row,n_col, figsize=(10,10),squeeze = False)
 
@@ -348,8 +519,8 @@ class Optim_Analyzer(object):
                     for ind in fig_empty_index_train:
                         ax[ind//n_col,ind%n_col].axis('off')
 
-            fig_mat.append(fig)
-            ax_mat.append(ax)
+            fig_mat[page_i] = fig
+            ax_mat[page_i] = ax
 
 
         index = 0
@@ -366,14 +537,23 @@ class Optim_Analyzer(object):
             if rep_id.split('.')[0] in opt.evaluator.fitness_protocols.keys():
 
                 for name in trace_rep.split('|'):
+                    if fig_index not in fig_mat:
+                        # Page not requested
+                        index += 1
+                        index_plot += 1
+                        if index%fig_per_page == 0 or index_plot == all_plots:
+                            index = 0
+                            fig_index += 1
+                        continue
                     ax_comp = ax_mat[fig_index]
                     fig_comp = fig_mat[fig_index]
                     response_time = response[name_loc]['time']
                     response_voltage = response[name_loc]['voltage']
 
+                    x_range = [amp_start_list[ix]-200, amp_end_list[ix]+200]
                     color = 'blue'
-                    l1, = ax_comp[index//n_col,index%n_col].plot(response_time,
-                            response_voltage,
+                    l1, = self._plot_trace(ax_comp[index//n_col,index%n_col],
+                            response_time, response_voltage, x_range=x_range,
                             color=color,
                             linewidth=1,
                             label= 'Model',
@@ -387,7 +567,7 @@ class Optim_Analyzer(object):
                                                         response_voltage.values]))
 
                     FileName = os.path.join(ephys_dir,name)
-                    data = np.loadtxt(FileName)
+                    data = utility.load_sweep(FileName)
                     if any(data[:,1]):
                         exp_time  = data[:,0]
                         exp_voltage = data[:,1]
@@ -395,8 +575,8 @@ class Optim_Analyzer(object):
                     else: # stolen triblip protocol
                         exp_time,exp_voltage = [],[]
 
-                    l2, = ax_comp[index//n_col,index%n_col].plot(exp_time,
-                                exp_voltage,
+                    l2, = self._plot_trace(ax_comp[index//n_col,index%n_col],
+                                exp_time, exp_voltage, x_range=x_range,
                                 color='black',
                                 linewidth=1,
                                 label = 'Experiment',
@@ -404,8 +584,9 @@ class Optim_Analyzer(object):
                     try:
                         responses_release_time = responses_release[name_loc]['time']
                         responses_release_voltage = responses_release[name_loc]['voltage']
-                        l3,=ax_comp[index//n_col,index%n_col].plot(responses_release_time,
-                                responses_release_voltage,
+                        l3,=self._plot_trace(ax_comp[index//n_col,index%n_col],
+                                responses_release_time,
+                                responses_release_voltage, x_range=x_range,
                                 color='r',
                                 linewidth=1,
                                 label = 'Released %s'%resp_comparison,
@@ -420,8 +601,7 @@ class Optim_Analyzer(object):
                     ax_comp[index//n_col,index%n_col].set_title(name.split('.')[0] + state, fontsize=8)
 
 #                    if 'LongDC' in name:
-                    ax_comp[index//n_col,index%n_col].set_xlim([amp_start_list[ix]-200,\
-                                                                  amp_end_list[ix]+200])
+                    ax_comp[index//n_col,index%n_col].set_xlim(x_range)
 
                     logger.debug('Plotting response comparisons for %s \n'%name.split('.')[0])
                     index += 1
@@ -451,9 +631,9 @@ class Optim_Analyzer(object):
 
         # objectives
         opt = self._opt # Optimizer object
-        opt_response = utility.load_pickle(response_filename)[0]
+        opt_response = load_response(response_filename)
         if response_release_filename:
-            responses_release =  utility.load_pickle(response_release_filename)[0]
+            responses_release = load_response(response_release_filename)
         else:
             responses_release = {}
 
@@ -649,7 +829,7 @@ class Optim_Analyzer(object):
         stdplus = mean + std
 
         fig, ax = plt.subplots(1, figsize=(8,8))
-        ax.plot(gen_numbers,
+        self._plot_trace(ax, gen_numbers,
                 mean,
                 color="white",
                 linewidth=2,
@@ -662,7 +842,7 @@ class Optim_Analyzer(object):
             alpha = 0.5,
             label='population standard deviation')
 
-        ax.plot(gen_numbers,
+        self._plot_trace(ax, gen_numbers,
                 minimum,
                 color='red',
                 linewidth=2,
@@ -675,7 +855,7 @@ class Optim_Analyzer(object):
         left, bottom, width, height = [0.67, 0.6, 0.2, 0.15]
         ax2 = fig.add_axes([left, bottom, width, height])
 
-        ax2.plot(gen_numbers,
+        self._plot_trace(ax2, gen_numbers,
                 minimum,
                 linewidth=2,
                 color='red',
@@ -734,6 +914,24 @@ class Optim_Analyzer(object):
 
         return model_param_dict
 
+    @staticmethod
+    def spike_shape_variance_path(AP_shape_path):
+        '''Variance across the spikes, kept apart from the mean AP shapes'''
+        return os.path.join(os.path.dirname(AP_shape_path),
+                            'spike_shape_variance',
+                            os.path.basename(AP_shape_path))
+
+    @staticmethod
+    def _save_spike_shape_variance(AP_shape_path, stim_name, AP_shape_var):
+        variance_path = Optim_Analyzer.spike_shape_variance_path(AP_shape_path)
+        if os.path.exists(AP_shape_path) and os.path.exists(variance_path):
+            spike_shape_var = utility.load_pickle(variance_path)
+        else:
+            spike_shape_var = {}
+        spike_shape_var[stim_name] = AP_shape_var
+        utility.create_filepath(variance_path)
+        utility.save_pickle(variance_path, spike_shape_var)
+
     @staticmethod
     def prepare_spike_shape(response_filename,stim_map,
                         stim_name_select,exp_AP_shape_path,model_AP_shape_path,
@@ -757,7 +955,7 @@ class Optim_Analyzer(object):
                 sweep_fullpath = os.path.join(
                         ephys_dir,
                         sweep_filename)
-                data = np.loadtxt(sweep_fullpath)
+                data = utility.load_sweep(sweep_fullpath)
                 time = data[:, 0]
                 voltage = data[:, 1]
     
@@ -772,25 +970,18 @@ class Optim_Analyzer(object):
             # Extract experimental spike times
             feature_results = efel.getFeatureValues(sweeps, spike_features)
      
-            # Experimental AP shape
-            AP_shape_exp = np.zeros(AP_shape_time.size)
-            num_spikes_exp = 0
-            for k,sweep_filename in enumerate(sweep_filenames):
-                sweep_fullpath = os.path.join(
-                    ephys_dir,
-                    sweep_filename)
-    
-                data = np.loadtxt(sweep_fullpath)
-                time = data[:, 0]
-                voltage = data[:, 1]
+            # Experimental AP shape (average over the spikes of all sweeps)
+            AP_shapes_exp = []
+            for k,sweep in enumerate(sweeps):
                 spike_times_exp = feature_results[k]['peak_time']
-                AP_shape_exp = get_spike_shape(time,voltage,
-                        spike_times_exp,AP_shape_time,
-                        AP_shape_exp)
-                num_spikes_exp += len(spike_times_exp)
-            AP_shape_exp /= num_spikes_exp
+                AP_shapes_exp.append(get_spike_shape_matrix(sweep['T'],
+                        sweep['V'],spike_times_exp,AP_shape_time))
+            AP_shapes_exp = np.vstack(AP_shapes_exp)
+            AP_shape_exp = AP_shapes_exp.mean(axis=0)
             spike_shape_exp[stim_name_select] = AP_shape_exp
             spike_shape_exp['time'] = AP_shape_time
+            Optim_Analyzer._save_spike_shape_variance(exp_AP_shape_path,
+                    stim_name_select, AP_shapes_exp.var(axis=0))
             utility.create_filepath(exp_AP_shape_path)
             utility.save_pickle(exp_AP_shape_path,spike_shape_exp)
         else:
@@ -803,12 +994,11 @@ class Optim_Analyzer(object):
             spike_shape_model = utility.load_pickle(model_AP_shape_path) 
         
         if stim_name_select not in spike_shape_model.keys():
-            response = utility.load_pickle(response_filename)[0]
-            
             # Calculate model spike times
             model_sweeps = []
             model_sweep = {}
             name_loc = stim_name_select+'.soma.v'
+            response = load_response(response_filename, [name_loc])
             resp_time = response[name_loc]['time'].values
             resp_voltage = response[name_loc]['voltage'].values
             model_sweep['T'] = resp_time
@@ -819,16 +1009,14 @@ class Optim_Analyzer(object):
             feature_results_model = efel.getFeatureValues(model_sweeps, spike_features)
     
             # Model AP shape
-            AP_shape_model = np.zeros(AP_shape_time.size)
             spike_times_model = feature_results_model[0]['peak_time']
-            AP_shape_model = get_spike_shape(resp_time,resp_voltage,
-                        spike_times_model,AP_shape_time,
-                        AP_shape_model)
-    
-            num_spikes_model = len(spike_times_model)
-            AP_shape_model /= num_spikes_model
+            AP_shape_model, AP_shape_var_model = get_average_spike_shape(
+                        resp_time,resp_voltage,spike_times_model,
+                        AP_shape_time,return_variance=True)
             spike_shape_model[stim_name_select] = AP_shape_model
             spike_shape_model['time'] = AP_shape_time
+            Optim_Analyzer._save_spike_shape_variance(model_AP_shape_path,
+                    stim_name_select, AP_shape_var_model)
             utility.create_filepath(model_AP_shape_path)
             utility.save_pickle(model_AP_shape_path,spike_shape_model)
         else:
@@ -855,7 +1043,7 @@ class Optim_Analyzer(object):
                     sweep_fullpath = os.path.join(
                         ephys_dir,sweep_filename)
     
-                    data = np.loadtxt(sweep_fullpath)
+                    data = utility.load_sweep(sweep_fullpath)
                     time = data[:,0]
                     voltage = data[:,1]
     
@@ -911,7 +1099,8 @@ class Optim_Analyzer(object):
         # Calculating the spikerate for the model
         
         if not os.path.exists(model_fi_path):
-            response = utility.load_pickle(response_filename)[0]
+            response = load_response(response_filename,
+                                     lambda name: 'soma' in name)
             feature_mean_model_dict = defaultdict()
             stim_model_dict = defaultdict()
             fI_curve_model={}
@@ -1018,10 +1207,10 @@ class Optim_Analyzer(object):
                     self.prepare_spike_shape(response_filename,stim_map,stim_name,\
                                      exp_AP_shape_path,model_AP_shape_path,model_type,\
                                      ephys_dir=ephys_dir)
-                ax[0,kk].plot(AP_shape_time, AP_shape_exp,lw = 2,
-                              color = 'k',label = 'Experiment')
-                ax[0,kk].plot(AP_shape_time, AP_shape_model,lw = 2,
-                              color = 'b',label = '%s'%model_type)
+                self._plot_trace(ax[0,kk], AP_shape_time, AP_shape_exp,
+                                 lw = 2, color = 'k',label = 'Experiment')
+                self._plot_trace(ax[0,kk], AP_shape_time, AP_shape_model,
+                                 lw = 2, color = 'b',label = '%s'%model_type)
                 ax[0,kk].legend(prop={'size': 10})
                 ax[0,kk].set_title(stim_name,fontsize = 12)
 
@@ -1033,7 +1222,8 @@ class Optim_Analyzer(object):
                        hof_responses_filename,hof_obj_train_filename,
                        hof_obj_untrain_filename,seed_indices_filename,
                        spiketimes_exp_path,spiketimes_hof_path,
-                       exp_variance_hof_path,cell_metadata,model_perf_filename):
+                       exp_variance_hof_path,cell_metadata,model_perf_filename,
+                       nprocs=None):
         
         ephys_dir = self.highlevel_job_props['ephys_dir']
         hof_obj_all_list = utility.load_pickle(hof_obj_all_filename)
@@ -1066,7 +1256,12 @@ class Optim_Analyzer(object):
         pdf_pages.savefig(fig)
         plt.close(fig)
 
-        hof_response_list = utility.load_pickle(hof_responses_filename)
+        if os.path.isdir(hof_responses_filename):
+            # Only the Noise recordings are needed
+            hof_response_list = Response_Store(hof_responses_filename).\
+                    responses(recording_names=_is_noise_recording)
+        else:
+            hof_response_list = utility.load_pickle(hof_responses_filename)
         if os.path.exists(spiketimes_exp_path):
             spike_times_exp = utility.load_pickle(spiketimes_exp_path)
             noise_bool = True
@@ -1086,49 +1281,66 @@ class Optim_Analyzer(object):
         exp_variance_hof = []
         spiketimes_hof = []
 
-        for ii,hof_response_all_proto in enumerate(hof_response_list):
-
+        # Model spike times on the Noise stimuli, the models are spread over
+        # a process pool (unless already in a daemonic worker)
+        spiketimes_models = [{} for _ in range(len(hof_response_list))]
+        model_trains = defaultdict(dict) # noise stim -> {hof index: spike indices}
+        if noise_bool:
+            stim_windows_df = stim_df.drop_duplicates('DistinctID')
+            stim_windows = {stim_name: (stim_start, stim_stop)
+                        for stim_name, stim_start, stim_stop in zip(stim_windows_df.DistinctID,
+                                    stim_windows_df.Stim_Start, stim_windows_df.Stim_End)}
+            model_indices = range(len(hof_response_list))
+            nprocs = min(nprocs or multiprocessing.cpu_count(), len(hof_response_list))
+            # daemonic processes (pool workers) cannot have children
+            use_pool = nprocs > 1 and not multiprocessing.current_process().daemon
+            try:
+                if use_pool:
+                    # spawned, the analysis process holds the ipyparallel
+                    # client; the store is reopened lazily by each worker
+                    pool_context = multiprocessing.get_context('spawn')
+                    with pool_context.Pool(nprocs, initializer=_init_hof_statistics,
+                            initargs=(hof_response_list, stim_windows)) as pool:
+                        spiketimes_noise = pool.map(_model_noise_spiketimes,
+                                                    model_indices)
+                else:
+                    _init_hof_statistics(hof_response_list, stim_windows)
+                    spiketimes_noise = list(map(_model_noise_spiketimes,
+                                                model_indices))
+            finally:
+                _hof_statistics_data.clear()
+
+            for ii,spiketimes_noise_model in enumerate(spiketimes_noise):
+                for noise_stim,model_train in spiketimes_noise_model.items():
+                    spiketimes_models[ii][noise_stim.split('.')[0]] = model_train
+                    if model_train is None:
+                        model_train = []
+                    model_trains[noise_stim][ii] = np.ceil(
+                        np.asarray(model_train, dtype=float)/dt).astype(int)
+
+        # Explained variance of all the models at once for each stimulus,
+        # the experimental trials are convolved once
+        exp_variance_models = {}
+        for noise_stim,stim_model_trains in model_trains.items():
+            noise_stim_name = noise_stim.split('.')[0]
+            expt_trains = [np.ceil(np.asarray(exp_train, dtype=float)/dt).astype(int)
+                           for exp_train in spike_times_exp[noise_stim_name]]
+            sweep_filename = os.path.join(ephys_dir,'%s.txt'%noise_stim_name)
+            exp_data = utility.load_sweep(sweep_filename)
+            total_length = int(math.ceil(exp_data[-1,0]/dt))
+            hof_indices = list(stim_model_trains.keys())
+            exp_variance = calculate_spike_time_metrics_batch(expt_trains,
+                        [stim_model_trains[ii] for ii in hof_indices],
+                        total_length, dt, sigma)[:,0]
+            for ii,exp_variance_model in zip(hof_indices, exp_variance):
+                exp_variance_models[noise_stim,ii] = exp_variance_model
+
+        for ii,spiketimes_model in enumerate(spiketimes_models):
             exp_variance_dict = {}
-            spiketimes_model = {}
-
-            if noise_bool:
-                spike_times_exp_copy = copy.deepcopy(spike_times_exp)
-
-                hof_response = {key:val for key,val in hof_response_all_proto[0].items() if 'Noise' in key}
-
-                for noise_stim,noise_resp in hof_response.items():
-
-                    noise_stim_name = noise_stim.split('.')[0]
+            for noise_stim in model_trains.keys():
+                if (noise_stim,ii) in exp_variance_models:
                     noise_stim_type = noise_stim.rsplit('_',1)[0]
-
-                    expt_trains = spike_times_exp_copy[noise_stim_name]
-
-                    for i,exp_train in enumerate(expt_trains):
-                        exp_train = [int(math.ceil(sp_time/dt)) for sp_time in exp_train]
-                        expt_trains[i] = np.asarray(exp_train)
-
-
-                    trace = {}
-                    trace['T'] = noise_resp['time']
-                    trace['V'] = noise_resp['voltage']
-                    stim_start = stim_df.loc[stim_df.DistinctID == noise_stim_name,'Stim_Start'].values
-                    stim_stop = stim_df.loc[stim_df.DistinctID == noise_stim_name,'Stim_End'].values
-                    trace['stim_start'] = [stim_start[0]]
-                    trace['stim_end'] = [stim_stop[0]]
-                    model_train = efel.getFeatureValues(
-                        [trace],
-                        ['peak_time'])[0]['peak_time']
-                    spiketimes_model[noise_stim_name] = copy.deepcopy(model_train)
-                    for i,sp_time in enumerate(model_train):
-                        model_train[i] = int(math.ceil(sp_time/dt))
-
-                    model_train = model_train.astype(int)
-                    sweep_filename = os.path.join(ephys_dir,'%s.txt'%noise_stim_name)
-                    exp_data = np.loadtxt(sweep_filename)
-                    exp_data_time = exp_data[:,0]
-                    total_length = int(math.ceil(exp_data_time[-1]/dt))
-                    exp_variance_dict[noise_stim_type] = calculate_spike_time_metrics(expt_trains,
-                                model_train, total_length, dt, sigma)[0]
+                    exp_variance_dict[noise_stim_type] = exp_variance_models[noise_stim,ii]
 
             objectives_train = obj_train_list[ii]
             feature_avg_train = np.mean(list(objectives_train.values()))
@@ -1139,9 +1351,9 @@ class Optim_Analyzer(object):
             exp_variance_dict['Feature_Average_Generalization'] = feature_avg_untrain
             exp_variance_dict['Seed'] = seed_list[ii]
 
-            exp_variance_hof.append(copy.deepcopy(exp_variance_dict))
+            exp_variance_hof.append(exp_variance_dict)
             if spiketimes_model:
-                spiketimes_hof.append(copy.deepcopy(spiketimes_model))
+                spiketimes_hof.append(spiketimes_model)
 
         utility.create_filepath(exp_variance_hof_path)
         utility.save_pickle(exp_variance_hof_path, exp_variance_hof)
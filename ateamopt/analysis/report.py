@@ -0,0 +1,142 @@
+import os
+import shutil
+import logging
+import multiprocessing
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from ateamopt.utils import utility
+
+logger = logging.getLogger(__name__)
+
+def _render_section(section):
+    func, args, kwargs, section_path, style = section
+    with matplotlib.rc_context():
+        if style:
+            plt.style.use(style)
+        pdf_pages = PdfPages(section_path)
+        try:
+            func(*args, pdf_pages=pdf_pages, **kwargs)
+            page_count = pdf_pages.get_pagecount()
+        finally:
+            pdf_pages.close()
+    if not page_count:
+        os.remove(section_path)
+        return None
+    return section_path
+
+
+def _get_pdf_merger():
+    try:
+        from pypdf import PdfWriter
+        return PdfWriter()
+    except ImportError:
+        pass
+    try:
+        from PyPDF2 import PdfMerger
+    except ImportError:
+        from PyPDF2 import PdfFileMerger as PdfMerger
+    return PdfMerger()
+
+
+class Report_Builder(object):
+    '''
+    Multi-page pdf report whose sections are rendered in a process pool,
+    each to its own pdf, and merged in the order they were added.
+
+    A section is a plotting function writing into the pdf_pages keyword
+    argument. The pool is spawned rather than forked (the analysis process
+    holds the ipyparallel client), so the sections and their arguments are
+    pickled. Without pypdf/PyPDF2 (the report extra) the sections are
+    rendered sequentially into the report.
+    '''
+
+    def __init__(self, report_path, nprocs=None, style='ggplot',
+                 section_dir=None):
+        self.report_path = report_path
+        self.nprocs = nprocs or multiprocessing.cpu_count()
+        self.style = style
+        self.section_dir = section_dir or \
+            os.path.splitext(report_path)[0] + '_sections'
+        self.sections = []
+        self.dependencies = []
+        self.in_parent = []
+
+    def add_section(self, func, *args, **kwargs):
+        '''
+        Add a section, depends_on (list of section indices) delays it until
+        those sections are rendered, e.g. when they write a cache it reads.
+        A section with in_parent is rendered by the calling process, so that
+        it can run its own process pool. Returns the section index.
+        '''
+        self.dependencies.append(kwargs.pop('depends_on', None) or [])
+        self.in_parent.append(kwargs.pop('in_parent', False))
+        self.sections.append((func, args, kwargs))
+        return len(self.sections) - 1
+
+    def _render_sequential(self):
+        with matplotlib.rc_context():
+            if self.style:
+                plt.style.use(self.style)
+            pdf_pages = PdfPages(self.report_path)
+            for func, args, kwargs in self.sections:
+                func(*args, pdf_pages=pdf_pages, **kwargs)
+            pdf_pages.close()
+
+    def render(self):
+        try:
+            merger = _get_pdf_merger()
+        except ImportError:
+            merger = None
+        if merger is None:
+            logger.debug('Rendering the report sequentially')
+            self._render_sequential()
+            return self.report_path
+
+        pool_context = multiprocessing.get_context('spawn')
+        utility.create_dirpath(self.section_dir)
+        sections = [(func, args, kwargs,
+                     os.path.join(self.section_dir, 'section_%s.pdf' % i),
+                     self.style)
+                    for i, (func, args, kwargs) in enumerate(self.sections)]
+
+        # Render in waves, a section only after the ones it depends on.
+        # The in_parent sections run their own pools, they are rendered
+        # while no pool (and none of its handler threads) is alive.
+        section_paths = {}
+        nprocs = min(self.nprocs, len(self.sections)) or 1
+        pool = None
+        try:
+            while len(section_paths) < len(self.sections):
+                ready = [i for i in range(len(self.sections))
+                         if i not in section_paths and
+                         all(dep in section_paths for dep in self.dependencies[i])]
+                if not ready:
+                    raise Exception('Circular report section dependencies')
+                ready_parent = [i for i in ready if self.in_parent[i]]
+                ready_pool = [i for i in ready if not self.in_parent[i]]
+                if ready_parent and pool is not None:
+                    pool.close()
+                    pool.join()
+                    pool = None
+                for i in ready_parent:
+                    section_paths[i] = _render_section(sections[i])
+                if ready_pool:
+                    if pool is None:
+                        pool = pool_context.Pool(nprocs)
+                    for i, section_path in zip(ready_pool, pool.map(
+                            _render_section, [sections[i] for i in ready_pool])):
+                        section_paths[i] = section_path
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        for i in range(len(self.sections)):
+            if section_paths[i]:
+                merger.append(section_paths[i])
+        merger.write(self.report_path)
+        merger.close()
+        shutil.rmtree(self.section_dir)
+        logger.debug('Rendered %s report sections into %s',
+                     len(self.sections), self.report_path)
+        return self.report_path
@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import pandas as pd
+import logging
+from ateamopt.utils import utility
+
+logger = logging.getLogger(__name__)
+
+
+class Response_Store(object):
+    '''
+    On-disk store of simulated responses, one .npy file (time, voltage) per
+    model and recording plus a json index. Responses are loaded lazily
+    per model and recording.
+
+    Layout::
+
+        store_dir/index.json
+        store_dir/model_<k>/<recording_name>.npy
+    '''
+
+    index_filename = 'index.json'
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, self.index_filename)
+        if os.path.exists(self.index_path):
+            self.index = utility.load_json(self.index_path)
+        else:
+            self.index = {'models': [], 'order': []}
+
+    @classmethod
+    def exists(cls, store_dir):
+        return os.path.exists(os.path.join(store_dir, cls.index_filename))
+
+    def __len__(self):
+        return len(self.index['order'])
+
+    def save_index(self):
+        utility.create_dirpath(self.store_dir)
+        utility.save_json(self.index_path, self.index)
+
+    def _model_entry(self, model_idx):
+        return self.index['models'][self.index['order'][model_idx]]
+
+    def add_response(self, response, params=None, save_index=True):
+        '''
+        Add the responses of a model (dict of recording name to response
+        or a list with the dict as first element), returns the model index
+        '''
+        responses = response[0] if isinstance(response, (list, tuple)) \
+            else response
+        model_key = len(self.index['models'])
+        model_dir = 'model_%s' % model_key
+        utility.create_dirpath(os.path.join(self.store_dir, model_dir))
+
+        recordings = {}
+        for recording_name, recording in responses.items():
+            if recording is None:
+                recordings[recording_name] = None
+                continue
+            recording_file = os.path.join(model_dir, '%s.npy' % recording_name)
+            recording_data = np.vstack((np.asarray(recording['time'], dtype=float),
+                                        np.asarray(recording['voltage'], dtype=float)))
+            np.save(os.path.join(self.store_dir, recording_file),
+                    recording_data)
+            recordings[recording_name] = recording_file
+
+        model_entry = {'dir': model_dir, 'recordings': recordings}
+        if params is not None:
+            model_entry['params'] = [float(param) for param in params]
+        self.index['models'].append(model_entry)
+        self.index['order'].append(model_key)
+        if save_index:
+            self.save_index()
+        return len(self) - 1
+
+    def add_responses(self, response_list, param_list=None):
+        param_list = param_list or [None] * len(response_list)
+        for response, params in zip(response_list, param_list):
+            self.add_response(response, params, save_index=False)
+        self.save_index()
+
+    def recording_names(self, model_idx=0):
+        return list(self._model_entry(model_idx)['recordings'].keys())
+
+    def get_params(self, model_idx):
+        return self._model_entry(model_idx).get('params')
+
+    def get_recording(self, model_idx, recording_name, mmap_mode='r'):
+        '''Recording as a DataFrame with time and voltage columns'''
+        recording_file = self._model_entry(model_idx)['recordings'][recording_name]
+        if recording_file is None:
+            return None
+        recording_data = np.load(os.path.join(self.store_dir, recording_file),
+                                 mmap_mode=mmap_mode)
+        return pd.DataFrame({'time': recording_data[0],
+                             'voltage': recording_data[1]})
+
+    def get_response(self, model_idx, recording_names=None):
+        '''
+        Response dict of a model, restricted to recording_names (list of
+        names or a callable filter on the name) if provided
+        '''
+        all_recording_names = self.recording_names(model_idx)
+        if recording_names is None:
+            recording_names = all_recording_names
+        elif callable(recording_names):
+            recording_names = list(filter(recording_names, all_recording_names))
+        return {recording_name: self.get_recording(model_idx, recording_name)
+                for recording_name in recording_names}
+
+    def responses(self, recording_names=None):
+        return Lazy_Response_List(self, recording_names)
+
+    def reorder(self, order):
+        '''Permute the models, order[i] is the current index of the new i-th model'''
+        self.index['order'] = [self.index['order'][idx] for idx in order]
+        self.save_index()
+
+    def reset_order(self):
+        '''Back to the order the models were added in'''
+        self.index['order'] = list(range(len(self.index['models'])))
+        self.save_index()
+
+
+def load_response(response_path, recording_names=None):
+    '''
+    Response dict of the first model of a Response_Store directory, or of
+    a pickled response list (as resp_opt.txt), restricted to
+    recording_names (see Response_Store.get_response) for a store
+    '''
+    if Response_Store.exists(response_path):
+        return Response_Store(response_path).get_response(0, recording_names)
+    return utility.load_pickle(response_path)[0]
+
+
+class Lazy_Response_List(object):
+    '''
+    Sequence view of a Response_Store with the same element layout as
+    the pickled hall of fame responses ([response_dict] per model)
+    '''
+
+    def __init__(self, store, recording_names=None):
+        self.store = store
+        self.recording_names = recording_names
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('Response index out of range')
+        return [self.store.get_response(idx, self.recording_names)]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
@@ -0,0 +1,189 @@
+import numpy as np
+import multiprocessing
+import logging
+import efel
+from ateamopt.bpopt_evaluator import Bpopt_Evaluator
+from ateamopt.utils import utility
+
+logger = logging.getLogger(__name__)
+
+# Evaluators of the SA worker process, built once by init_sa_worker
+_sa_worker = {}
+
+
+def init_sa_worker(model_configs, stim_names, efel_features):
+    '''
+    Pool initializer, builds the evaluator (cell model, protocols and
+    simulator) of every model once per worker process
+
+    Parameters
+    ----------
+    model_configs : dict
+        model name (e.g. 'all_active', 'perisomatic') -> dict with the
+        Bpopt_Evaluator arguments (protocol_path, feature_path, morph_path,
+        param_path, mech_path and optionally ephys_dir and props) and
+        optim_param, the parameter values the samples are applied on
+    stim_names : list
+        protocols to simulate
+    efel_features : list
+        eFEL features computed on the somatic response
+    '''
+    _sa_worker.clear()
+    _sa_worker['stim_names'] = list(stim_names)
+    _sa_worker['efel_features'] = list(efel_features)
+    try:
+        for model_name, model_config in model_configs.items():
+            eval_handler = Bpopt_Evaluator(model_config['protocol_path'],
+                                           model_config['feature_path'],
+                                           model_config['morph_path'],
+                                           model_config['param_path'],
+                                           model_config['mech_path'],
+                                           ephys_dir=model_config.get('ephys_dir'),
+                                           **model_config.get('props', {}))
+            evaluator = eval_handler.create_evaluator()
+            # The pool workers are daemonic and can not start the process
+            # bluepyopt isolates every protocol in
+            evaluator.isolate_protocols = False
+            stim_protocols = utility.load_json(model_config['protocol_path'])
+            _sa_worker[model_name] = {
+                'evaluator': evaluator,
+                'optim_param': dict(model_config['optim_param']),
+                'protocols': [evaluator.fitness_protocols[stim_name]
+                              for stim_name in stim_names],
+                'stim_windows': {stim_name: (stim_protocols[stim_name]['stimuli'][0]['delay'],
+                                             stim_protocols[stim_name]['stimuli'][0]['stim_end'])
+                                 for stim_name in stim_names}}
+    except Exception as e:
+        # A raising initializer makes the pool restart the worker forever,
+        # the samples of the worker fail instead
+        logger.warning('SA worker setup failed: %r', e)
+        _sa_worker['setup_error'] = e
+
+
+def run_sa_sample(task):
+    '''
+    Simulate one sample in the SA worker
+
+    Parameters
+    ----------
+    task : tuple
+        (model name, sample index, parameter names, parameter values)
+
+    Returns
+    -------
+    model name, sample index, the feature values (stimuli x features
+    flattened, nan where a feature is not defined or the simulation failed)
+    and whether the simulation failed
+    '''
+    model_name, sample_idx, param_names, param_values = task
+    stim_names = _sa_worker['stim_names']
+    efel_features = _sa_worker['efel_features']
+    feature_values = np.full(len(stim_names)*len(efel_features), np.nan)
+    if 'setup_error' in _sa_worker:
+        return model_name, sample_idx, feature_values, True
+    model_worker = _sa_worker[model_name]
+
+    sample_param = dict(model_worker['optim_param'])
+    sample_param.update(zip(param_names, param_values))
+    try:
+        responses = model_worker['evaluator'].run_protocols(
+            model_worker['protocols'], sample_param)
+    except Exception as e:
+        logger.warning('Sample %s of %s failed: %r', sample_idx, model_name, e)
+        return model_name, sample_idx, feature_values, True
+
+    traces, stim_indices = [], []
+    for i, stim_name in enumerate(stim_names):
+        response = responses.get('%s.soma.v' % stim_name)
+        if response is None:
+            continue
+        stim_start, stim_end = model_worker['stim_windows'][stim_name]
+        traces.append({'T': response['time'], 'V': response['voltage'],
+                       'stim_start': [stim_start], 'stim_end': [stim_end]})
+        stim_indices.append(i)
+    trace_features = efel.getFeatureValues(traces, efel_features,
+                                           raise_warnings=False)
+    for i, trace_feature in zip(stim_indices, trace_features):
+        for j, feature in enumerate(efel_features):
+            feature_val = trace_feature[feature]
+            if feature_val is not None and len(feature_val):
+                feature_values[i*len(efel_features)+j] = np.mean(feature_val)
+    return model_name, sample_idx, feature_values, False
+
+
+class SA_Runner(object):
+    '''
+    Sensitivity analysis simulations of several models on several stimuli
+    in one pooled sweep. The workers are persistent, each builds the
+    evaluators once and reuses them (and the simulator) for all samples.
+    '''
+
+    def __init__(self, model_configs, stim_names, efel_features, nprocs=None):
+        self.model_configs = model_configs
+        self.stim_names = list(stim_names)
+        self.efel_features = list(efel_features)
+        self.nprocs = nprocs or multiprocessing.cpu_count()
+
+    @property
+    def output_names(self):
+        '''(stimulus, feature) of every column of the feature matrices'''
+        return [(stim_name, feature) for stim_name in self.stim_names
+                for feature in self.efel_features]
+
+    def run(self, model_samples, chunksize=1, sample_store=None):
+        '''
+        Parameters
+        ----------
+        model_samples : dict
+            model name -> (parameter names, n_samples x n_params array)
+        sample_store : SA_Sample_Store
+            every simulated sample is appended to it, the samples already
+            in the store are not simulated again. The failed samples are
+            not stored, a resumed run retries them
+
+        Returns
+        -------
+        model_features : dict
+            model name -> n_samples x n_outputs array of feature values
+        '''
+        model_features, tasks = {}, []
+        for model_name, (param_names, samples) in model_samples.items():
+            if sample_store is not None:
+                sample_store.create_model(model_name, param_names, samples,
+                                          self.output_names)
+                model_features[model_name], done = sample_store.load_results(
+                    model_name)
+            else:
+                model_features[model_name] = np.full((len(samples),
+                                                      len(self.output_names)), np.nan)
+                done = np.zeros(len(samples), dtype=bool)
+            tasks.extend((model_name, i, list(param_names), list(map(float, samples[i])))
+                         for i in np.flatnonzero(~done))
+        if not tasks:
+            return model_features
+
+        init_args = (self.model_configs, self.stim_names, self.efel_features)
+        nprocs = min(self.nprocs, len(tasks))
+        n_failed = dict.fromkeys(model_samples, 0)
+        try:
+            with multiprocessing.Pool(nprocs, initializer=init_sa_worker,
+                                      initargs=init_args) as pool:
+                for model_name, sample_idx, feature_values, failed in pool.imap_unordered(
+                        run_sa_sample, tasks, chunksize=chunksize):
+                    model_features[model_name][sample_idx] = feature_values
+                    n_failed[model_name] += failed
+                    if sample_store is not None and not failed:
+                        sample_store.append(model_name, sample_idx, feature_values)
+        finally:
+            if sample_store is not None:
+                sample_store.close()
+
+        for model_name, model_failed in n_failed.items():
+            if model_failed:
+                logger.warning('%s of %s samples of %s failed to simulate',
+                               model_failed, len(model_samples[model_name][1]),
+                               model_name)
+        if sum(n_failed.values()) == len(tasks):
+            raise Exception('All %s sensitivity analysis samples failed to '
+                            'simulate' % len(tasks))
+        return model_features
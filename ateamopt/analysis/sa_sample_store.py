@@ -0,0 +1,146 @@
+import os
+import numpy as np
+import logging
+from ateamopt.utils import utility
+
+logger = logging.getLogger(__name__)
+
+
+class SA_Sample_Store(object):
+    '''
+    Append-only store of sensitivity analysis samples, written as the
+    samples finish so that a killed run can be resumed and analyzed from
+    the samples done so far.
+
+    Layout::
+
+        store_dir/index.json                 parameter and output names
+        store_dir/<model_name>_samples.npy   design (n_samples x n_params)
+        store_dir/<model_name>_results.bin   float64 records of
+                                             [sample index, outputs...]
+
+    A record cut short by the kill is ignored, and dropped on the next append.
+    '''
+
+    index_filename = 'index.json'
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, self.index_filename)
+        if os.path.exists(self.index_path):
+            self.index = utility.load_json(self.index_path)
+        else:
+            self.index = {}
+        self._result_files = {}
+
+    def save_index(self):
+        utility.create_dirpath(self.store_dir)
+        utility.save_json(self.index_path, self.index)
+
+    def _samples_path(self, model_name):
+        return os.path.join(self.store_dir, '%s_samples.npy' % model_name)
+
+    def _results_path(self, model_name):
+        return os.path.join(self.store_dir, '%s_results.bin' % model_name)
+
+    def models(self):
+        return list(self.index.keys())
+
+    def create_model(self, model_name, param_names, samples, output_names,
+                     design=None):
+        '''
+        Register the design of a model, or check it against the stored one
+        when resuming
+        '''
+        samples = np.asarray(samples, dtype=float)
+        output_names = [list(name) if isinstance(name, (tuple, list)) else name
+                        for name in output_names]
+        if model_name in self.index:
+            model_index = self.index[model_name]
+            if model_index['param_names'] != list(param_names) or \
+                    model_index['output_names'] != output_names or \
+                    not np.array_equal(self.get_samples(model_name), samples):
+                raise Exception('Sample store %s has a different design for %s'
+                                % (self.store_dir, model_name))
+            return
+        utility.create_dirpath(self.store_dir)
+        np.save(self._samples_path(model_name), samples)
+        self.index[model_name] = {'param_names': list(param_names),
+                                  'output_names': output_names,
+                                  'n_samples': len(samples),
+                                  'design': design or {}}
+        self.save_index()
+
+    def get_samples(self, model_name):
+        return np.load(self._samples_path(model_name))
+
+    def param_names(self, model_name):
+        return self.index[model_name]['param_names']
+
+    def output_names(self, model_name):
+        return [tuple(name) if isinstance(name, list) else name
+                for name in self.index[model_name]['output_names']]
+
+    def append(self, model_name, sample_idx, output_values):
+        '''Write the outputs of a finished sample'''
+        if model_name not in self._result_files:
+            results_path = self._results_path(model_name)
+            # Drop a record cut short by a killed run before appending
+            record_size = 8*(len(self.index[model_name]['output_names'])+1)
+            if os.path.exists(results_path):
+                results_size = os.path.getsize(results_path)
+                if results_size % record_size:
+                    with open(results_path, 'r+b') as result_file:
+                        result_file.truncate(results_size - results_size % record_size)
+            self._result_files[model_name] = open(results_path, 'ab')
+        record = np.concatenate(([sample_idx], np.asarray(output_values,
+                                                          dtype=float)))
+        result_file = self._result_files[model_name]
+        result_file.write(record.astype(np.float64).tobytes())
+        result_file.flush()
+
+    def close(self):
+        for result_file in self._result_files.values():
+            result_file.close()
+        self._result_files = {}
+
+    def load_results(self, model_name):
+        '''
+        Returns
+        -------
+        outputs : np.ndarray
+            n_samples x n_outputs, nan for the samples not done
+        done : np.ndarray
+            bool mask of the samples done
+        '''
+        model_index = self.index[model_name]
+        n_outputs = len(model_index['output_names'])
+        outputs = np.full((model_index['n_samples'], n_outputs), np.nan)
+        done = np.zeros(model_index['n_samples'], dtype=bool)
+        results_path = self._results_path(model_name)
+        if os.path.exists(results_path):
+            records = np.fromfile(results_path, dtype=np.float64)
+            n_records = len(records)//(n_outputs+1)
+            if n_records*(n_outputs+1) != len(records):
+                logger.debug('Ignoring a partial record in %s', results_path)
+            records = records[:n_records*(n_outputs+1)].reshape(n_records, -1)
+            sample_indices = records[:, 0].astype(int)
+            outputs[sample_indices] = records[:, 1:]
+            done[sample_indices] = True
+        return outputs, done
+
+    def pending_samples(self, model_name):
+        _, done = self.load_results(model_name)
+        return np.flatnonzero(~done)
+
+    def complete_blocks(self, model_name, block_size):
+        '''
+        Outputs of the blocks of block_size consecutive samples (e.g. a
+        Saltelli base sample, n_params+2 rows) which are completely done
+        '''
+        outputs, done = self.load_results(model_name)
+        n_blocks = len(done)//block_size
+        block_done = done[:n_blocks*block_size].reshape(n_blocks,
+                                                        block_size).all(axis=1)
+        outputs = outputs[:n_blocks*block_size].reshape(n_blocks, block_size, -1)
+        return outputs[block_done].reshape(-1, outputs.shape[-1])
@@ -1,4 +1,3 @@
-import uncertainpy as un
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')
@@ -10,6 +9,14 @@ import math
 import seaborn as sns
 from matplotlib.cm import ScalarMappable
 from matplotlib.colors import ListedColormap
+import logging
+from ateamopt.analysis.sa_runner import SA_Runner
+from ateamopt.analysis.sensitivity_estimators import saltelli_sample,\
+    saltelli_sample_size, estimate_base_samples, sobol_indices, morris_sample,\
+    morris_elementary_effects, finite_difference_sample,\
+    finite_difference_sensitivity, rank_parameters
+
+logger = logging.getLogger(__name__)
 
 
 class SA_helper(object):
@@ -48,6 +55,80 @@ class SA_helper(object):
         return morph_path,protocol_path,mech_path,feature_path,param_path
 
     
+    def get_sa_model_config(self, sens_param_bounds_path, optim_param,
+                            morph_path=None, model_basepath=None,
+                            perisomatic=False, ephys_dir=None):
+        '''Model config of SA_Runner for the (bounds widened) parameter file'''
+        config_morph_path,protocol_path,mech_path,feature_path,_ = \
+            self.load_config(model_basepath, perisomatic=perisomatic)
+        return {'protocol_path': protocol_path,
+                'feature_path': feature_path,
+                'morph_path': morph_path or config_morph_path,
+                'param_path': sens_param_bounds_path,
+                'mech_path': mech_path,
+                'ephys_dir': ephys_dir,
+                'optim_param': optim_param}
+
+    def screen_parameters(self, sa_runner, model_name, parameters, bounds,
+                          method='morris', top_k=None, n_trajectories=10,
+                          num_levels=4, rel_step=0.05, seed=0,
+                          select_param_path=None):
+        '''
+        Screen the parameters with Morris elementary effects or a finite
+        difference Jacobian around the optimized values before the Sobol
+        analysis, only the top_k are kept in sens_parameters (and saved
+        to select_param_path in the same format).
+
+        Parameters
+        ----------
+        sa_runner : SA_Runner
+        model_name : str
+            model of sa_runner
+        parameters : dict
+            create_sens_param_dict keys -> optimized values
+        bounds : list
+            n_params x 2, in the order of parameters
+        method : str
+            'morris' or 'finite_difference'
+
+        Returns
+        -------
+        ranked_params : list
+            (parameter, score) most important first
+        screen_result : dict
+            morris_elementary_effects or finite_difference_sensitivity output
+        '''
+        param_dict_uc = self.create_sens_param_dict()
+        uc_names = list(parameters.keys())
+        param_names = [param_dict_uc[key] for key in uc_names]
+        if method == 'morris':
+            samples = morris_sample(bounds, n_trajectories, num_levels, seed)
+        else:
+            samples, steps = finite_difference_sample(list(parameters.values()),
+                                                      bounds, rel_step)
+        features = sa_runner.run({model_name: (param_names, samples)})[model_name]
+        if method == 'morris':
+            screen_result = morris_elementary_effects(samples, features, bounds)
+            importance = screen_result['mu_star']
+        else:
+            screen_result = finite_difference_sensitivity(features,
+                                        list(parameters.values()), steps)
+            importance = screen_result['relative_sensitivity']
+
+        ranked_params = rank_parameters(importance, uc_names, top_k)
+        if top_k:
+            selected = [param_dict_uc[key] for key,_ in ranked_params]
+            sens_parameters = {}
+            for key,val in self.sens_parameters.items():
+                sects = [sect for sect in val if '%s.%s'%(key,sect) in selected]
+                if sects:
+                    sens_parameters[key] = sects
+            self.sens_parameters = sens_parameters
+            if select_param_path:
+                utility.create_filepath(select_param_path)
+                utility.save_json(select_param_path, sens_parameters)
+        return ranked_params, screen_result
+
     def create_sens_param_dict(self):
         param_dict_uc = {}
         for key,val in self.sens_parameters.items():
@@ -217,15 +298,20 @@ class SA_helper(object):
                                      len(param_names)-1))
         sm.set_array([])
         
-        g = sns.FacetGrid(sa_data_df,col='feature',
+        facet_kws = {'col':'feature'}
+        if 'stim_name' in sa_data_df and sa_data_df.stim_name.nunique() > 1:
+            # One row of features per stimulus of SA_Runner
+            facet_kws['row'] = 'stim_name'
+        g = sns.FacetGrid(sa_data_df,
               sharex=True,sharey='row', height=7, 
-              aspect=.5)
+              aspect=.5,**facet_kws)
         g = g.map(sns.barplot,'param_name','sobol_index',
                   order=param_names,palette=palette,errwidth=1)        
         axes = g.axes.flatten()
         for ax_ in axes:
             title_ = ax_.get_title()
-            title_ = title_.split('|')[-1].split('=')[-1]
+            title_ = ', '.join(part.split('=')[-1].strip()
+                               for part in title_.split('|'))
             ax_.set_title(title_,fontsize=axislabel_fontsize)
             xticklabels = ax_.get_xticklabels()
             ax_.set_xticklabels(xticklabels,rotation=90,ha='center',
@@ -234,7 +320,8 @@ class SA_helper(object):
                                 fontsize=ticklabel_fontsize)
             ax_.set_xlabel(None)
             
-        axes[0].set_ylabel('Sobol index',fontsize=axislabel_fontsize)
+        for ax_ in g.axes[:,0]:
+            ax_.set_ylabel('Sobol index',fontsize=axislabel_fontsize)
         g.fig.tight_layout(rect=[0, 0.03, 1, 0.95])
         g.fig.subplots_adjust(wspace=0.1)
         cbar = plt.colorbar(sm,boundaries=np.arange(len(param_names)+1)-0.5)
@@ -245,8 +332,62 @@ class SA_helper(object):
         
 
     
+    def save_sobol_data(self, sobol_result, param_names, output_names, **kwargs):
+        '''
+        sens_datadf (as save_analysis_data) from sobol_indices, output_names
+        are feature names or (stimulus, feature) pairs of SA_Runner. The
+        bluepyopt parameter names (gbar_X.somatic) are saved as the
+        uncertainpy ones (gbar_X_somatic) of create_sens_param_dict.
+        '''
+        sens_datalist = []
+        filepath = kwargs.pop('filepath',None)
+        param_dict_bpopt = {}
+        if self.sens_parameters:
+            param_dict_bpopt = {val:key for key,val in
+                                self.create_sens_param_dict().items()}
+        for i,param in enumerate(param_names):
+            for j,output_name in enumerate(output_names):
+                sens_datadict = {}
+                if isinstance(output_name, (tuple, list)):
+                    sens_datadict['stim_name'],sens_datadict['feature'] = output_name
+                else:
+                    sens_datadict['feature'] = output_name
+                sens_datadict['sobol_index'] = sobol_result['S1'][i,j]
+                sens_datadict['param_name'] = param_dict_bpopt.get(param,param)
+                sens_datadict['sobol_total'] = sobol_result['ST'][i,j]
+                if 'S1_conf' in sobol_result:
+                    sens_datadict['sobol_index_conf'] = sobol_result['S1_conf'][i,j]
+                    sens_datadict['sobol_total_conf'] = sobol_result['ST_conf'][i,j]
+                sens_datadict.update(kwargs)
+                sens_datalist.append(sens_datadict)
+
+        sens_datadf = pd.DataFrame(sens_datalist)
+
+        if filepath:
+            utility.create_filepath(filepath)
+            sens_datadf.to_csv(filepath, index=False)
+
+        return sens_datadf
+
+    def sobol_data_from_store(self, sample_store, model_name, n_bootstrap=100,
+                              **kwargs):
+        '''
+        sens_datadf of a Saltelli design in an SA_Sample_Store, from the
+        base samples completely simulated so far
+        '''
+        param_names = sample_store.param_names(model_name)
+        outputs = sample_store.complete_blocks(model_name, len(param_names)+2)
+        sobol_result = sobol_indices(outputs, len(param_names),
+                                     n_bootstrap=n_bootstrap)
+        logger.debug('Sobol indices of %s from %s base samples', model_name,
+                     sobol_result['n_base'])
+        return self.save_sobol_data(sobol_result, param_names,
+                                    sample_store.output_names(model_name),
+                                    **kwargs)
+
     @staticmethod
     def save_analysis_data(ucdata_path,**kwargs):
+        import uncertainpy as un
     
         uc_data =  un.Data(ucdata_path)
         model_name = uc_data.model_name
@@ -0,0 +1,228 @@
+import numpy as np
+from scipy.stats import qmc, norm
+
+
+def saltelli_sample(bounds, n_base, seed=0):
+    '''
+    Saltelli design on a scrambled Sobol sequence
+
+    Parameters
+    ----------
+    bounds : array-like
+        n_params x 2 lower and upper bounds
+    n_base : int
+        base samples, preferably a power of 2 (balance of the Sobol sequence)
+    seed : int
+
+    Returns
+    -------
+    samples : np.ndarray
+        n_base*(n_params+2) x n_params, the rows of base sample j are
+        contiguous: A_j, B_j, then A_j with its i-th column from B_j for
+        every parameter i (so any prefix of complete blocks can be analyzed)
+    '''
+    bounds = np.asarray(bounds, dtype=float)
+    n_params = len(bounds)
+    base = qmc.Sobol(d=2*n_params, scramble=True, seed=seed).random(n_base)
+    A, B = base[:, :n_params], base[:, n_params:]
+    samples = np.repeat(A[:, None, :], n_params+2, axis=1)
+    samples[:, 1, :] = B
+    param_idx = np.arange(n_params)
+    samples[:, 2+param_idx, param_idx] = B
+    samples = samples.reshape(-1, n_params)
+    return bounds[:, 0] + samples*(bounds[:, 1]-bounds[:, 0])
+
+
+def saltelli_sample_size(n_params, n_base):
+    '''Simulations needed for n_base Saltelli base samples'''
+    return n_base*(n_params+2)
+
+
+def estimate_base_samples(conf_width, n_base, target_conf_width):
+    '''
+    Base samples to reach target_conf_width, from the confidence interval
+    widths of a pilot run with n_base samples (the width shrinks as
+    1/sqrt(n)), rounded up to a power of 2
+    '''
+    conf_width = np.nanmax(conf_width)
+    n_needed = n_base*(conf_width/float(target_conf_width))**2
+    return int(2**np.ceil(np.log2(max(n_needed, 1))))
+
+
+def _sobol_estimates(weights, fA, fB, fAB):
+    # weights ... x n x n_outputs, zero for the discarded samples
+    total = weights.sum(axis=-2)
+    mean = (np.sum(weights*fA, axis=-2) + np.sum(weights*fB, axis=-2))/(2*total)
+    mean = mean[..., None, :]
+    var = (np.sum(weights*(fA-mean)**2, axis=-2) +
+           np.sum(weights*(fB-mean)**2, axis=-2))/(2*total)
+    diff = fAB - fA[:, None, :]
+    # Saltelli et al. (2010) first order, Jansen (1999) total order
+    first_order = np.einsum('...nm,nkm->...km', weights*fB, diff)
+    total_order = 0.5*np.einsum('...nm,nkm->...km', weights, diff**2)
+    var = var[..., None, :]*total[..., None, :]
+    return first_order/var, total_order/var
+
+
+def sobol_indices(Y, n_params, n_bootstrap=100, conf_level=0.95, seed=0):
+    '''
+    First and total order Sobol indices of the outputs of a Saltelli design
+
+    Parameters
+    ----------
+    Y : array-like
+        outputs (n_samples x n_outputs) in the row order of saltelli_sample,
+        an incomplete trailing block is ignored. Base samples with non-finite
+        outputs are discarded for that output.
+    n_params : int
+    n_bootstrap : int
+        bootstrap resamples of the base samples for the confidence intervals
+    conf_level : float
+
+    Returns
+    -------
+    sobol_result : dict
+        S1, S1_conf, ST, ST_conf (n_params x n_outputs, conf as the half
+        width of the interval) and n_base
+    '''
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    n_base = len(Y)//(n_params+2)
+    Y = Y[:n_base*(n_params+2)].reshape(n_base, n_params+2, -1)
+    valid = np.all(np.isfinite(Y), axis=1).astype(float)
+    Y = np.where(np.isfinite(Y), Y, 0)
+    fA, fB, fAB = Y[:, 0], Y[:, 1], Y[:, 2:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S1, ST = _sobol_estimates(valid, fA, fB, fAB)
+        result = {'S1': S1, 'ST': ST, 'n_base': n_base}
+        if n_bootstrap:
+            rng = np.random.RandomState(seed)
+            counts = rng.multinomial(n_base, np.ones(n_base)/n_base,
+                                     size=n_bootstrap)
+            S1_boot, ST_boot = _sobol_estimates(counts[:, :, None]*valid,
+                                                fA, fB, fAB)
+            z = norm.ppf(0.5+conf_level/2.)
+            result['S1_conf'] = z*np.nanstd(S1_boot, axis=0)
+            result['ST_conf'] = z*np.nanstd(ST_boot, axis=0)
+    return result
+
+
+def morris_sample(bounds, n_trajectories, num_levels=4, seed=0):
+    '''
+    Morris one-at-a-time trajectories on a num_levels grid
+
+    Returns
+    -------
+    samples : np.ndarray
+        n_trajectories*(n_params+1) x n_params, each trajectory contiguous
+        and consecutive rows differing in a single parameter
+    '''
+    bounds = np.asarray(bounds, dtype=float)
+    n_params = len(bounds)
+    rng = np.random.RandomState(seed)
+    delta = num_levels/(2.*(num_levels-1))
+
+    # Base points on the grid such that x + delta stays in [0, 1]
+    start_levels = np.arange(num_levels//2)/float(num_levels-1)
+    x_base = rng.choice(start_levels, size=(n_trajectories, 1, n_params))
+    # Lower triangular steps, random directions and parameter order
+    steps = np.tril(np.ones((n_params+1, n_params)), -1)
+    directions = rng.choice([-1, 1], size=(n_trajectories, 1, n_params))
+    trajectories = x_base + delta/2.*((2*steps - 1)*directions + 1)
+    orders = np.argsort(rng.rand(n_trajectories, n_params), axis=1)
+    trajectories = np.take_along_axis(trajectories, orders[:, None, :], axis=2)
+    samples = trajectories.reshape(-1, n_params)
+    return bounds[:, 0] + samples*(bounds[:, 1]-bounds[:, 0])
+
+
+def morris_elementary_effects(X, Y, bounds):
+    '''
+    Elementary effects of the morris_sample trajectories
+
+    Returns
+    -------
+    morris_result : dict
+        mu, mu_star (mean absolute effect) and sigma, n_params x n_outputs,
+        effects with undefined features are left out
+    '''
+    bounds = np.asarray(bounds, dtype=float)
+    n_params = len(bounds)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    X_unit = (np.asarray(X, dtype=float)-bounds[:, 0])/(bounds[:, 1]-bounds[:, 0])
+    X_unit = X_unit.reshape(-1, n_params+1, n_params)
+    Y = Y.reshape(len(X_unit), n_params+1, -1)
+
+    dX = np.diff(X_unit, axis=1)
+    changed_param = np.argmax(np.abs(dX), axis=2)
+    step = np.take_along_axis(dX, changed_param[..., None], axis=2)
+    effects_ordered = np.diff(Y, axis=1)/step
+    # Trajectory x parameter x output
+    effects = np.empty_like(effects_ordered)
+    np.put_along_axis(effects, changed_param[..., None], effects_ordered, axis=1)
+    with np.errstate(invalid='ignore'):
+        return {'mu': np.nanmean(effects, axis=0),
+                'mu_star': np.nanmean(np.abs(effects), axis=0),
+                'sigma': np.nanstd(effects, axis=0)}
+
+
+def finite_difference_sample(x0, bounds=None, rel_step=0.05):
+    '''
+    Central differences around x0, rows x0, then x0 + h_i and x0 - h_i for
+    every parameter i. The step is rel_step of the value (of the bounds
+    width for zero values).
+
+    Returns
+    -------
+    samples : np.ndarray
+        2*n_params+1 x n_params
+    steps : np.ndarray
+        h_i
+    '''
+    x0 = np.asarray(x0, dtype=float)
+    steps = rel_step*np.abs(x0)
+    if bounds is not None:
+        bounds = np.asarray(bounds, dtype=float)
+        steps = np.where(steps > 0, steps, rel_step*(bounds[:, 1]-bounds[:, 0]))
+    perturbation = np.diag(steps)
+    samples = np.vstack((x0, x0+perturbation, x0-perturbation))
+    return samples, steps
+
+
+def finite_difference_sensitivity(Y, x0, steps):
+    '''
+    Jacobian (n_params x n_outputs) of the finite_difference_sample outputs,
+    and the relative sensitivity (d log y / d log x)
+    '''
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    n_params = len(steps)
+    jacobian = (Y[1:n_params+1]-Y[n_params+1:])/(2*np.asarray(steps)[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = jacobian*np.asarray(x0, dtype=float)[:, None]/Y[0]
+    return {'jacobian': jacobian, 'relative_sensitivity': relative}
+
+
+def rank_parameters(importance, param_names, top_k=None):
+    '''
+    Rank the parameters on importance (n_params x n_outputs, e.g. mu_star),
+    each output scaled by its most important parameter and a parameter
+    scored by its largest scaled importance across the outputs
+
+    Returns
+    -------
+    list of (parameter name, score), most important first
+    '''
+    importance = np.abs(np.asarray(importance, dtype=float))
+    if importance.ndim == 1:
+        importance = importance[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = importance/np.nanmax(importance, axis=0)
+    scaled = np.where(np.isfinite(scaled), scaled, 0)
+    score = scaled.max(axis=1) if scaled.shape[1] else np.zeros(len(param_names))
+    ranked = [(param_names[i], score[i]) for i in np.argsort(-score, kind='stable')]
+    return ranked[:top_k] if top_k else ranked
@@ -215,6 +215,9 @@ class Slurm_JobModule(JobModule):
 
         seed_string = ''.join(
             ['%s ' % seed_ for seed_ in stage_jobconfig['seed']])
+        if stage_jobconfig.get('island_model'):
+            # One driver process runs all the seeds as islands
+            seed_string = '%s ' % stage_jobconfig['seed'][0]
 
         # High level job config
         batchjob_string = re.sub('conda_env', highlevel_job_props['conda_env'], batchjob_string)
@@ -299,6 +302,9 @@ class PBS_JobModule(JobModule):
 
         seed_string = ''.join(
             ['%s ' % seed_ for seed_ in stage_jobconfig['seed']])
+        if stage_jobconfig.get('island_model'):
+            # One driver process runs all the seeds as islands
+            seed_string = '%s ' % stage_jobconfig['seed'][0]
 
         # High level job config
         batchjob_string = re.sub('conda_env', highlevel_job_props['conda_env'], batchjob_string)
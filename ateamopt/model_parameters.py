@@ -358,6 +358,10 @@ class AllActive_Model_Parameters(object):
         path_dict['released_peri_model'] = kwargs.get('released_peri_model')
         path_dict['released_peri_mechanism'] = kwargs.get(
             'released_peri_mechanism')
+        if kwargs.get('warm_start_checkpoints'):
+            path_dict['warm_start_checkpoints'] = kwargs['warm_start_checkpoints']
+            path_dict['warm_start_parameters'] = kwargs.get(
+                'warm_start_parameters')
 
 #        for config_key,path in kwargs.items():
 #            path_dict[config_key] = path
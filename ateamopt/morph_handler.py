@@ -2,9 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import allensdk.core.swc as swc
 import numpy.linalg as la
-from sklearn.pipeline import Pipeline
 import math
-from sklearn.decomposition import PCA
 from scipy.spatial.transform import Rotation
 from mpl_toolkits.mplot3d import Axes3D
 import os
@@ -24,13 +22,53 @@ dark_grey = (128/255,128/255,128/255)
 class MorphHandler(object):
     def __init__(self, morph_file, cell_id=None):
         self.morph_file = morph_file
-        self.morph = swc.read_swc(morph_file)
-        self.soma_coord = np.array([self.morph.soma["x"],
-                                    self.morph.soma["y"],
-                                    self.morph.soma["z"]
-                                    ])
-        self.soma_rad = self.morph.soma['radius']
+        # id, type, xyz, radius, parent per compartment (utility.swc_dtype)
+        self.swc_data = utility.load_swc(morph_file)
+        soma_idx = self.soma_index()
+        self.soma_coord = self.swc_data['xyz'][soma_idx].copy()
+        self.soma_rad = self.swc_data['radius'][soma_idx]
         self.cell_id = cell_id
+        self._morph = None
+
+    @property
+    def morph(self):
+        # allensdk Morphology, only read if asked for
+        if self._morph is None:
+            self._morph = swc.read_swc(self.morph_file)
+        return self._morph
+
+    def soma_index(self):
+        # root soma compartment (as allensdk), else the first soma compartment
+        soma_mask = self.type_mask(1)
+        root_soma = np.flatnonzero(soma_mask & (self.swc_data['parent'] < 0))
+        if len(root_soma):
+            return root_soma[0]
+        return np.flatnonzero(soma_mask)[0]
+
+    def type_mask(self, *swc_types):
+        return np.isin(self.swc_data['type'], swc_types)
+
+    def soma_distance(self):
+        return la.norm(self.swc_data['xyz'] - self.soma_coord, axis=1)
+
+    def segments(self, reject_axon=True):
+        '''
+        Row indices of the (parent, child) compartment pairs, ordered by
+        parent then child as in the file
+        '''
+        ids, parents = self.swc_data['id'], self.swc_data['parent']
+        sorter = np.argsort(ids, kind='mergesort')
+        parent_pos = np.clip(np.searchsorted(ids, parents, sorter=sorter),
+                             0, len(ids)-1)
+        parent_rows = sorter[parent_pos]
+        has_parent = (parents >= 0) & (ids[parent_rows] == parents)
+        child_rows = np.flatnonzero(has_parent)
+        parent_rows = parent_rows[has_parent]
+        if reject_axon:
+            non_axon = self.swc_data['type'][parent_rows] != 2
+            parent_rows, child_rows = parent_rows[non_axon], child_rows[non_axon]
+        seg_order = np.lexsort((child_rows, parent_rows))
+        return parent_rows[seg_order], child_rows[seg_order]
 
     def save_morph_data(self, morph_stats_filename):
 
@@ -61,39 +99,14 @@ class MorphHandler(object):
             utility.save_json(morph_stats_filename, morph_stats)
 
     def get_morph_coords(self, reject_axon=True):
-        x, x_apical, x_axon = [], [], []
-        y, y_apical, y_axon = [], [], []
-        z, z_apical, z_axon = [], [], []
-        
-        morph_dist_arr = []
-        
-        for comp_ in self.morph.compartment_list:
-            x_coord, y_coord, z_coord = comp_['x'], comp_['y'], comp_['z']
-            if comp_['type'] == 2:
-                x_axon.append(x_coord)
-                y_axon.append(y_coord)
-                z_axon.append(z_coord)
-
-            if reject_axon and comp_['type'] == 2:
-                continue
-
-            x.append(x_coord)
-            y.append(y_coord)
-            z.append(z_coord)
-            
-            dist = np.linalg.norm(self.soma_coord-np.array([x_coord,y_coord,z_coord]))
-            morph_dist_arr.append(dist)
-            
-            if comp_['type'] == 4:
-                x_apical.append(x_coord)
-                y_apical.append(y_coord)
-                z_apical.append(z_coord)
+        xyz = self.swc_data['xyz']
+        axon_mask = self.type_mask(2)
+        select_mask = ~axon_mask if reject_axon else np.ones(len(xyz), dtype=bool)
 
-        morph_data = self.shift_origin(np.array(np.column_stack((x, y, z))))
-        morph_apical = self.shift_origin(np.array(np.column_stack((x_apical,
-                                                                   y_apical, z_apical))))
-        morph_axon = self.shift_origin(np.array(np.column_stack((x_axon,
-                                                                 y_axon, z_axon))))
+        morph_data = self.shift_origin(xyz[select_mask])
+        morph_apical = self.shift_origin(xyz[select_mask & self.type_mask(4)])
+        morph_axon = self.shift_origin(xyz[axon_mask])
+        morph_dist_arr = la.norm(morph_data, axis=1)
 
         return morph_data, morph_apical, morph_axon,morph_dist_arr
 
@@ -101,19 +114,25 @@ class MorphHandler(object):
         shifted_coord = coord_arr - self.soma_coord
         return shifted_coord
 
-    def calc_rotation_angle(self, morph_data, morph_apical=None):
-        pca_ = PCA(n_components=2)
-        pca_pipeline = Pipeline([('pca', pca_)])
+    def pca_inputs(self, reject_axon=True):
+        morph_data, morph_apical, _, _ = self.get_morph_coords(reject_axon)
+        return morph_data, morph_apical
 
-        pca_pipeline.fit(morph_data)
-        v1 = pca_.components_[0]  # the first principal component
+    @staticmethod
+    def principal_axis(morph_data):
+        # first principal component, from the SVD of the centered points
+        _, _, v = la.svd(morph_data - morph_data.mean(axis=0),
+                         full_matrices=False)
+        return v[0]
 
-        z_axis = np.array([0, 0, 1])  # target rotation direction
+    @staticmethod
+    def _align_angle(morph_data, morph_apical, target_axis):
+        v1 = MorphHandler.principal_axis(morph_data)
         v1_unit = v1/la.norm(v1)
-        v1_sign = np.sign(v1_unit[2])
+        v1_sign = np.sign(np.dot(target_axis, v1_unit))
         v1_unit *= v1_sign
-        theta = np.arccos(np.clip(np.dot(z_axis, v1_unit), -1.0, 1.0))
-        axis_of_rot = np.cross(z_axis, v1_unit)
+        theta = np.arccos(np.clip(np.dot(target_axis, v1_unit), -1.0, 1.0))
+        axis_of_rot = np.cross(target_axis, v1_unit)
         axis_of_rot = axis_of_rot/np.linalg.norm(axis_of_rot)
         try:
             proj_dir = np.sign(np.mean(morph_apical.dot(v1_unit)))
@@ -123,31 +142,20 @@ class MorphHandler(object):
             theta = 2*math.pi-theta
         elif proj_dir == -1:
             theta = -theta + math.pi
-
         return theta, axis_of_rot
 
-    def calc_euler_angle(self, morph_data, morph_apical=None):
-        pca_ = PCA(n_components=2)
-        pca_pipeline = Pipeline([('pca', pca_)])
-
-        pca_pipeline.fit(morph_data)
-        v1 = pca_.components_[0]  # the first principal component
+    def calc_rotation_angle(self, morph_data=None, morph_apical=None):
+        if morph_data is None:
+            morph_data, morph_apical = self.pca_inputs()
+        z_axis = np.array([0, 0, 1])  # target rotation direction
+        theta, axis_of_rot = self._align_angle(morph_data, morph_apical, z_axis)
+        return theta, axis_of_rot
 
+    def calc_euler_angle(self, morph_data=None, morph_apical=None):
+        if morph_data is None:
+            morph_data, morph_apical = self.pca_inputs()
         y_axis = np.array([0, 1, 0])  # target rotation direction
-        v1_unit = v1/la.norm(v1)
-        v1_sign = np.sign(v1_unit[1])
-        v1_unit *= v1_sign
-        theta = np.arccos(np.clip(np.dot(y_axis, v1_unit), -1.0, 1.0))
-        axis_of_rot = np.cross(y_axis, v1_unit)
-        axis_of_rot = axis_of_rot/np.linalg.norm(axis_of_rot)
-        try:
-            proj_dir = np.sign(np.mean(morph_apical.dot(v1_unit)))
-        except:
-            proj_dir = np.sign(np.mean(morph_data.dot(v1_unit)))
-        if proj_dir == 1:
-            theta = 2*math.pi-theta
-        elif proj_dir == -1:
-            theta = -theta + math.pi
+        theta, axis_of_rot = self._align_angle(morph_data, morph_apical, y_axis)
 
         r = Rotation.from_rotvec(theta*axis_of_rot)
         r_euler = r.as_euler('xyz')
@@ -159,6 +167,33 @@ class MorphHandler(object):
         point_rotated = r.apply(point)
         return point_rotated
 
+    def rotated_segments(self, theta, axis_of_rot, reject_axon=True):
+        '''
+        Returns
+        -------
+        seg_start, seg_end : np.ndarray
+            n_segments x 3 soma centered and rotated coordinates of the
+            parent and child compartments
+        seg_dist : np.ndarray
+            distance of the child compartment from the soma
+        seg_type : np.ndarray
+            type of the parent compartment
+        '''
+        parent_rows, child_rows = self.segments(reject_axon)
+        shifted_xyz = self.shift_origin(self.swc_data['xyz'])
+        rotated_xyz = Rotation.from_rotvec(theta*axis_of_rot).apply(shifted_xyz)
+        return rotated_xyz[parent_rows], rotated_xyz[child_rows],\
+            la.norm(shifted_xyz[child_rows], axis=1),\
+            self.swc_data['type'][parent_rows]
+
+    @staticmethod
+    def _segment_linewidths(seg_dist, morph_dist_arr, lw_min, lw_max):
+        # Make neurites get thinner with distance
+        if morph_dist_arr is not None and len(morph_dist_arr):
+            max_dist = np.max(morph_dist_arr)
+            return lw_min+(lw_max-lw_min)*(max_dist-seg_dist)/max_dist
+        return np.full(len(seg_dist), lw_max)
+
     def draw_sphere(self, center_tuple):
         rad = self.soma_rad
         xCenter, yCenter, zCenter = center_tuple
@@ -198,9 +233,7 @@ class MorphHandler(object):
 
 
         morph_dist_arr = kwargs.get('morph_dist_arr')
-        if morph_dist_arr:
-            _,max_dist = np.min(morph_dist_arr),np.max(morph_dist_arr)
-            lw_min = kwargs.get('lw_min') or .2
+        lw_min = kwargs.get('lw_min') or .2
         lw_max = kwargs.get('lw') or 1
         ax = kwargs.get('ax')
         alpha = kwargs.get('alpha') or 1
@@ -209,39 +242,15 @@ class MorphHandler(object):
             sns.set(style='whitegrid')
             fig,ax = plt.subplots() 
         
-        all_lines =[]
-        linewidths,colors = [],[]
-        for comp_ in self.morph.compartment_list:
-            if reject_axon and comp_['type'] == 2:
-                continue
-            nx, ny, nz = self.shift_origin(np.array([comp_['x'], comp_['y'], comp_['z']]))
-            [nx_rot, ny_rot, nz_rot] = self.rotate3D_point([nx, ny, nz],
-                                                           theta, axis_of_rot)
-            nx_rot += soma_loc[0]
-            nz_rot += soma_loc[1]
-            
-            for c in self.morph.children_of(comp_):
-                cx, cy, cz = self.shift_origin(
-                    np.array([c['x'], c['y'], c['z']]))
-                [cx_rot, cy_rot, cz_rot] = self.rotate3D_point([cx, cy, cz],
-                                                               theta, axis_of_rot)
-                # Make neurites get thinner with distance
-                if morph_dist_arr:
-                    dist_ = np.linalg.norm(np.array([cx, cy, cz]))
-                    lw = lw_min+(lw_max-lw_min)*(max_dist-dist_)/max_dist
-                else:
-                    lw=lw_max
-                
-                
-                # Shift the origin to the desired soma location
-                cx_rot += soma_loc[0]
-                cz_rot += soma_loc[1]
-
-                
-                linewidths.append(lw)
-                all_lines_x,all_lines_y = (nx_rot, nz_rot),(cx_rot, cz_rot)
-                all_lines.append([all_lines_x,all_lines_y])
-                colors.append(color_dict[comp_['type']])
+        seg_start,seg_end,seg_dist,seg_type = self.rotated_segments(theta,
+                                                axis_of_rot,reject_axon)
+        linewidths = self._segment_linewidths(seg_dist,morph_dist_arr,
+                                              lw_min,lw_max)
+        colors = [color_dict[seg_type_] for seg_type_ in seg_type]
+        
+        # x-z projection, origin shifted to the desired soma location
+        all_lines = np.stack((seg_start[:,[0,2]],seg_end[:,[0,2]]),axis=1) + \
+                            soma_loc[:2]
 
         lc = mc.LineCollection(all_lines, colors=colors, linewidths=linewidths,alpha=alpha)
         ax.add_collection(lc)            
@@ -267,9 +276,7 @@ class MorphHandler(object):
             color_dict = {4: 'orange', 3: 'darkred', 2: 'royalblue', 1: 'dimgrey'}
         
         morph_dist_arr = kwargs.get('morph_dist_arr')
-        if morph_dist_arr:
-            _,max_dist = np.min(morph_dist_arr),np.max(morph_dist_arr)
-            lw_min = kwargs.get('lw_min') or .2
+        lw_min = kwargs.get('lw_min') or .2
         lw_max = kwargs.get('lw') or 1
         alpha = kwargs.get('alpha') or 1
         ax = kwargs.get('ax')
@@ -280,48 +287,23 @@ class MorphHandler(object):
             ax = fig.add_subplot(111, projection='3d')
         #ax.axis('equal')
 
-        all_x, all_y, all_z = [], [], []
-        all_lines =[]
-        linewidths,colors = [],[]
+        seg_start,seg_end,seg_dist,seg_type = self.rotated_segments(theta,
+                                                axis_of_rot,reject_axon)
+        linewidths = self._segment_linewidths(seg_dist,morph_dist_arr,
+                                              lw_min,lw_max)
+        colors = [color_dict[seg_type_] for seg_type_ in seg_type]
+        
+        # Shift the origin to the desired soma location
+        seg_start,seg_end = seg_start + soma_loc,seg_end + soma_loc
+        all_lines = np.stack((seg_start,seg_end),axis=1)
         
-        for comp_ in self.morph.compartment_list:
-            if reject_axon and comp_['type'] == 2:
-                continue
-            nx, ny, nz = self.shift_origin(np.array([comp_['x'], comp_['y'], comp_['z']]))
-            [nx_rot, ny_rot, nz_rot] = self.rotate3D_point([nx, ny, nz],
-                                                           theta, axis_of_rot)
-            nx_rot += soma_loc[0]
-            ny_rot += soma_loc[1]
-            nz_rot += soma_loc[2]
-            for c in self.morph.children_of(comp_):
-                cx, cy, cz = self.shift_origin(
-                    np.array([c['x'], c['y'], c['z']]))
-                [cx_rot, cy_rot, cz_rot] = self.rotate3D_point([cx, cy, cz],
-                                                               theta, axis_of_rot)
-                # Make neurites thinner with distance
-                if morph_dist_arr:
-                    dist_ = np.linalg.norm(np.array([cx, cy, cz]))
-                    lw = lw_min+(lw_max-lw_min)*(max_dist-dist_)/max_dist
-                else:
-                    lw=lw_max
-                    
-                
-                # Shift the origin to the desired soma location
-                cx_rot += soma_loc[0]
-                cy_rot += soma_loc[1]
-                cz_rot += soma_loc[2]
-                
-                # For animation: axis limits are automatically determined here
-                ax.plot([nx_rot, cx_rot], [ny_rot, cy_rot],[nz_rot, cz_rot],
-                        color=color_dict[comp_['type']], lw=lw, alpha=alpha)
-                
-                linewidths.append(lw)
-                point1,point2 = (nx_rot,ny_rot,nz_rot),(cx_rot,cy_rot,cz_rot)
-                all_lines.append([point1,point2])
-                all_x.extend((nx_rot, cx_rot))
-                all_y.extend((ny_rot, cy_rot))
-                all_z.extend((nz_rot, cz_rot))
-                colors.append(color_dict[comp_['type']])
+        # For animation: axis limits are automatically determined here
+        for point1,point2,color,lw in zip(seg_start,seg_end,colors,linewidths):
+            ax.plot([point1[0], point2[0]], [point1[1], point2[1]],
+                    [point1[2], point2[2]], color=color, lw=lw, alpha=alpha)
+        all_x = np.concatenate((seg_start[:,0],seg_end[:,0]))
+        all_y = np.concatenate((seg_start[:,1],seg_end[:,1]))
+        all_z = np.concatenate((seg_start[:,2],seg_end[:,2]))
 
         # For efficiently plotting a large no. of lines
 #        lc = Line3DCollection(all_lines, colors=colors, linewidths=linewidths,alpha=1)
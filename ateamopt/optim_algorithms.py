@@ -0,0 +1,710 @@
+import os
+import time
+import random
+import shutil
+import logging
+import hashlib
+import contextlib
+import numpy as np
+from collections import OrderedDict
+import deap.algorithms
+import deap.tools
+from ateamopt.utils import utility
+
+logger = logging.getLogger(__name__)
+
+
+def _get_offspring(parents, toolbox, cxpb, mutpb):
+    if hasattr(toolbox, 'variate'):
+        return toolbox.variate(parents, toolbox, cxpb, mutpb)
+    return deap.algorithms.varAnd(parents, toolbox, cxpb, mutpb)
+
+
+def _get_stats():
+    stats = deap.tools.Statistics(key=lambda ind: ind.fitness.sum)
+    stats.register("avg", np.mean)
+    stats.register("std", np.std)
+    stats.register("min", np.min)
+    stats.register("max", np.max)
+    return stats
+
+
+def response_capture_key(params):
+    return hashlib.sha1(np.asarray(params, dtype=float).tobytes()).hexdigest()
+
+
+def response_capture_path(capture_dir, params):
+    return os.path.join(capture_dir, '%s.pkl' % response_capture_key(params))
+
+
+class _Simulation_Done(Exception):
+    pass
+
+
+def evaluate_with_responses(evaluator, evaluate, param_list,
+                            protocol_names=None):
+    """
+    Call evaluate (an evaluation function of evaluator, e.g. the
+    toolbox.evaluate of its DEAPOptimisation) and collect the responses
+    simulated by evaluator.run_protocols on the way, so that the simulator
+    setup, isolation and timeout of the evaluator apply as in the GA
+
+    Parameters
+    ----------
+    protocol_names : list
+        only simulate these fitness protocols and stop the evaluation
+        after the simulation, the returned result is then None
+
+    Returns
+    -------
+    result, responses
+    """
+    responses = {}
+    run_protocols = evaluator.run_protocols
+    fitness_protocols = evaluator.fitness_protocols
+
+    def capture_run_protocols(*args, **kwargs):
+        protocol_responses = run_protocols(*args, **kwargs)
+        responses.update(protocol_responses)
+        if protocol_names is not None:
+            raise _Simulation_Done()
+        return protocol_responses
+
+    evaluator.run_protocols = capture_run_protocols
+    if protocol_names is not None:
+        evaluator.fitness_protocols = OrderedDict(
+            (protocol_name, protocol) for protocol_name, protocol in
+            fitness_protocols.items() if protocol_name in protocol_names)
+    try:
+        result = evaluate(param_list)
+    except _Simulation_Done:
+        result = None
+    finally:
+        del evaluator.run_protocols
+        evaluator.fitness_protocols = fitness_protocols
+    return result, responses
+
+
+class Response_Capture(object):
+    '''
+    Evaluation hook which persists the responses of the individuals good
+    enough to enter the hall of fame, so that the analysis doesn't have to
+    simulate the hall of fame again. The individuals are evaluated by
+    evaluate (toolbox.evaluate) as without the hook.
+    '''
+
+    def __init__(self, evaluator, evaluate, capture_dir):
+        self.evaluator = evaluator
+        self.evaluate = evaluate
+        self.capture_dir = capture_dir
+        self.threshold = -np.inf
+        utility.create_dirpath(capture_dir)
+        # keys of the responses written so far, the only ones pruned
+        self.capture_keys = set(os.path.splitext(capture_file)[0]
+                                for capture_file in os.listdir(capture_dir))
+
+    def __call__(self, param_list):
+        obj_list, responses = evaluate_with_responses(
+            self.evaluator, self.evaluate, param_list)
+        if sum(obj_list) <= self.threshold:
+            utility.save_pickle(response_capture_path(self.capture_dir,
+                                                      param_list), [responses])
+        return obj_list
+
+    def update_threshold(self, halloffames):
+        '''
+        Only individuals better than the worst of a full hall of fame are
+        kept, nothing is kept while a hall of fame is filling up (the
+        initial population)
+        '''
+        thresholds = []
+        for halloffame in halloffames:
+            if len(halloffame) < halloffame.maxsize:
+                self.threshold = -np.inf
+                return
+            thresholds.append(halloffame[-1].fitness.sum)
+        self.threshold = max(thresholds)
+
+    def record(self, inds):
+        '''Note the evaluated individuals whose responses were written'''
+        self.capture_keys.update(response_capture_key(ind) for ind in inds
+                                 if ind.fitness.sum <= self.threshold)
+
+    def prune(self, halloffames):
+        '''Remove the responses of individuals not in any hall of fame'''
+        hof_keys = set(response_capture_key(ind) for halloffame in halloffames
+                       for ind in halloffame)
+        for capture_key in self.capture_keys - hof_keys:
+            capture_path = os.path.join(self.capture_dir, '%s.pkl' % capture_key)
+            if os.path.exists(capture_path):
+                os.remove(capture_path)
+        self.capture_keys &= hof_keys
+
+
+class Island(object):
+    '''
+    A single seed of the GA with its own population, hall of fame and
+    random state, checkpointed in the same format as
+    bluepyopt's eaAlphaMuPlusLambdaCheckpoint
+    '''
+
+    def __init__(self, opt, seed, cp_filename, cp_backup=None,
+                 cp_backup_frequency=5, screener=None):
+        self.opt = opt
+        self.screener = screener
+        self.surrogate_predictions = None
+        self.seed = seed
+        self.cp_filename = cp_filename
+        self.cp_backup = cp_backup
+        self.cp_backup_frequency = cp_backup_frequency
+        self.stats = _get_stats()
+        self.stop_reason = None
+        self.budget = None
+        self.median_history = []
+        self.elapsed_time = 0.
+
+        random.seed(seed)
+        np.random.seed(int(seed))
+        self.rndstate = random.getstate()
+        self.np_rndstate = np.random.get_state()
+
+    @property
+    def toolbox(self):
+        return self.opt.toolbox
+
+    @contextlib.contextmanager
+    def random_state(self):
+        '''Swap in the random state of the island'''
+        random.setstate(self.rndstate)
+        np.random.set_state(self.np_rndstate)
+        try:
+            yield
+        finally:
+            self.rndstate = random.getstate()
+            self.np_rndstate = np.random.get_state()
+
+    def start(self, offspring_size, continue_cp=False):
+        self.mu = offspring_size
+        self.offspring = []
+
+        if continue_cp:
+            cp = utility.load_pickle(self.cp_filename)
+            self.population = cp['population']
+            self.parents = cp['parents']
+            self.generation = cp['generation']
+            self.halloffame = cp['halloffame']
+            self.logbook = cp['logbook']
+            self.history = cp['history']
+            self.rndstate = cp['rndstate']
+            if 'np_rndstate' in cp:
+                self.np_rndstate = cp['np_rndstate']
+            self.stop_reason = cp.get('stop_reason')
+            self.budget = cp.get('budget')
+            self.median_history = cp.get('median_history', [])
+            self.elapsed_time = cp.get('elapsed_time', 0.)
+            logger.debug('Seed %s continuing from generation %s',
+                         self.seed, self.generation)
+        else:
+            self.logbook = deap.tools.Logbook()
+            self.logbook.header = ['gen', 'nevals'] + self.stats.fields
+            self.history = deap.tools.History()
+            self.halloffame = self.opt.hof
+            self.generation = 0
+            with self.random_state():
+                self.population = self.toolbox.population(n=offspring_size)
+            self.parents = self.population[:]
+            self.offspring = self.population
+
+    def variate(self):
+        '''Create the offspring of the next generation'''
+        with self.random_state():
+            self.offspring = _get_offspring(self.parents, self.toolbox,
+                                            self.opt.cxpb, self.opt.mutpb)
+            if self.screener:
+                self.offspring, self.surrogate_predictions = \
+                    self.screener.screen(
+                        self.history, self.parents, self.offspring,
+                        variate=lambda: _get_offspring(
+                            self.parents, self.toolbox, self.opt.cxpb,
+                            self.opt.mutpb))
+        self.population = self.parents + self.offspring
+
+    def pending_evaluations(self):
+        return [ind for ind in self.offspring if not ind.fitness.valid]
+
+    def update(self, nevals):
+        '''Bookkeeping after the offspring has been evaluated'''
+        self.generation += 1
+        if self.halloffame is not None:
+            self.halloffame.update(self.population)
+        self.history.update(self.population)
+        record = self.stats.compile(self.population)
+        self.logbook.record(gen=self.generation, nevals=nevals, **record)
+        self.median_history.append(float(np.median(
+            [ind.fitness.sum for ind in self.population])))
+        if self.surrogate_predictions:
+            self.screener.log_accuracy(self.seed, self.generation,
+                                       self.surrogate_predictions)
+            self.surrogate_predictions = None
+
+        if self.generation > 1:
+            with self.random_state():
+                self.parents = self.toolbox.select(self.population, self.mu)
+        self.offspring = []
+
+    def stop(self, reason):
+        self.stop_reason = reason
+        self.logbook[-1]['stop_reason'] = reason
+        logger.info('Seed %s stopped at generation %s: %s', self.seed,
+                    self.generation, reason)
+
+    def elites(self, n_elites):
+        return sorted(self.parents, key=lambda ind: ind.fitness.sum)[:n_elites]
+
+    def receive_migrants(self, migrants):
+        '''Replace the worst parents with the (cloned) migrants'''
+        if not migrants:
+            return
+        self.parents = sorted(self.parents,
+                              key=lambda ind: ind.fitness.sum)[:-len(migrants)]
+        self.parents.extend(self.toolbox.clone(ind) for ind in migrants)
+
+    def save_checkpoint(self):
+        cp = dict(population=self.population,
+                  generation=self.generation,
+                  parents=self.parents,
+                  halloffame=self.halloffame,
+                  history=self.history,
+                  logbook=self.logbook,
+                  rndstate=self.rndstate,
+                  np_rndstate=self.np_rndstate,
+                  median_history=self.median_history,
+                  elapsed_time=self.elapsed_time,
+                  budget=self.budget)
+        if self.stop_reason:
+            cp['stop_reason'] = self.stop_reason
+        utility.save_pickle(self.cp_filename, cp)
+        log_stream = self.logbook.stream
+        logger.info('Seed %s\n%s', self.seed, log_stream)
+        utility.save_file('logbook_info.txt', '%s %s\n' % (
+            log_stream, self.cp_filename))
+        logger.debug('Wrote checkpoint to %s', self.cp_filename)
+
+        if self.cp_backup and self.cp_backup_frequency and \
+                self.generation % self.cp_backup_frequency == 0:
+            shutil.copyfile(self.cp_filename, self.cp_backup)
+            logger.debug('Wrote checkpoint backup to %s', self.cp_backup)
+
+
+class Surrogate_Screener(object):
+    '''
+    Pre-screening of the offspring with a regressor fitted on the
+    (parameters, fitness) history of the GA. Only the offspring predicted
+    to be competitive with the parents, plus an exploration quota, are
+    simulated.
+
+    Parameters
+    ----------
+    model : str
+        'random_forest' or 'gaussian_process'
+    min_samples : int
+        evaluated individuals needed before screening starts
+    max_samples : int
+        most recent individuals of the history used for fitting
+    quantile : float
+        offspring predicted below this quantile of the parents' fitness
+        are simulated
+    exploration_fraction : float
+        fraction of the remaining offspring simulated anyway
+    refill : bool
+        replace the screened out offspring with new candidates instead of
+        simulating fewer individuals
+    log_file : str
+        per generation prediction accuracy
+    '''
+
+    def __init__(self, model='random_forest', min_samples=500,
+                 max_samples=5000, quantile=0.75, exploration_fraction=0.2,
+                 refill=False, log_file='surrogate_info.txt'):
+        self.model = model
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.quantile = quantile
+        self.exploration_fraction = exploration_fraction
+        self.refill = refill
+        self.log_file = log_file
+
+    def create_regressor(self):
+        if self.model == 'gaussian_process':
+            from sklearn.gaussian_process import GaussianProcessRegressor
+            from sklearn.gaussian_process.kernels import Matern, WhiteKernel
+            return GaussianProcessRegressor(kernel=Matern() + WhiteKernel(),
+                                            normalize_y=True)
+        else:
+            from sklearn.ensemble import RandomForestRegressor
+            return RandomForestRegressor(n_estimators=50, min_samples_leaf=2,
+                                         random_state=0, n_jobs=-1)
+
+    def fit(self, history):
+        # Clones of unchanged parents are re-recorded in the genealogy,
+        # count every parameter vector once (at its latest entry)
+        unique_inds = OrderedDict()
+        for ind in history.genealogy_history.values():
+            if ind.fitness.valid:
+                unique_inds.pop(tuple(ind), None)
+                unique_inds[tuple(ind)] = ind
+        evaluated = list(unique_inds.values())
+        if len(evaluated) < self.min_samples:
+            return None
+        evaluated = evaluated[-self.max_samples:]
+        X = np.array(evaluated, dtype=float)
+        y = np.array([ind.fitness.sum for ind in evaluated])
+        regressor = self.create_regressor()
+        regressor.fit(X, y)
+        return regressor
+
+    def screen(self, history, parents, offspring, variate=None,
+               max_rounds=5):
+        '''
+        Returns the offspring to simulate and the predicted fitness of the
+        simulated offspring (keyed by id). With refill and variate (a
+        callable creating a new batch of offspring) the screened out
+        offspring are replaced by new candidates for up to max_rounds
+        batches, the best predicted of the rejected fill the rest, so the
+        size of the offspring is kept.
+        '''
+        if not self.refill:
+            variate = None
+        candidates = [ind for ind in offspring if not ind.fitness.valid]
+        regressor = self.fit(history)
+        if regressor is None or not candidates:
+            return offspring, None
+
+        threshold = np.quantile([ind.fitness.sum for ind in parents],
+                                self.quantile)
+        offspring_screened = [ind for ind in offspring if ind.fitness.valid]
+        n_simulate = len(candidates)
+        selected, rejected = [], []
+        n_screened, n_explore = 0, 0
+        for _ in range(max_rounds):
+            predicted = regressor.predict(np.array(candidates, dtype=float))
+            competitive = predicted <= threshold
+            rest = list(np.where(~competitive)[0])
+            explore = random.sample(rest, int(round(
+                self.exploration_fraction * len(rest))))
+            simulate = set(np.where(competitive)[0]) | set(explore)
+            for i, ind in enumerate(candidates):
+                if i not in simulate:
+                    rejected.append((ind, predicted[i]))
+                elif len(selected) < n_simulate:
+                    selected.append((ind, predicted[i]))
+            n_screened += len(candidates)
+            n_explore += len(explore)
+
+            if variate is None or len(selected) >= n_simulate:
+                break
+            candidates = [ind for ind in variate() if not ind.fitness.valid]
+
+        if variate is not None and len(selected) < n_simulate:
+            rejected.sort(key=lambda ind_pred: ind_pred[1])
+            selected += rejected[:n_simulate - len(selected)]
+
+        predictions = {}
+        for ind, pred in selected:
+            offspring_screened.append(ind)
+            predictions[id(ind)] = (ind, pred)
+
+        logger.debug('Surrogate screening: simulating %s (%s exploring) '
+                     'of %s screened offspring', len(selected), n_explore,
+                     n_screened)
+        return offspring_screened, predictions
+
+    def log_accuracy(self, seed, generation, predictions):
+        from scipy.stats import spearmanr
+        predicted = np.array([pred for _, pred in predictions.values()])
+        actual = np.array([ind.fitness.sum for ind, _ in predictions.values()])
+        if len(actual) > 1:
+            rank_corr = spearmanr(predicted, actual)[0]
+        else:
+            rank_corr = np.nan
+        # absolute, the summed objectives can be 0
+        abs_error = np.median(np.abs(predicted - actual))
+        logger.debug('Surrogate accuracy (seed %s, gen %s): rank correlation'
+                     ' %.3f, median absolute error %.3f', seed, generation,
+                     rank_corr, abs_error)
+        if self.log_file:
+            utility.save_file(self.log_file, '%s\t%s\t%s\t%.4f\t%.4f\n' % (
+                seed, generation, len(actual), rank_corr, abs_error))
+
+
+class Stopping_Controller(object):
+    '''
+    Convergence criteria for ending a stage before max_ngen
+
+    Parameters
+    ----------
+    stall_window : int
+        number of generations over which the best and the median fitness
+        have to improve
+    stall_tolerance : float
+        minimum relative improvement over the stall window
+    spread_tolerance : float
+        stop once the largest standard deviation of the parents along any
+        parameter, relative to the parameter bounds, drops below this
+    time_budget : float
+        wall-clock budget in seconds (summed over restarts)
+    '''
+
+    def __init__(self, stall_window=None, stall_tolerance=1e-3,
+                 spread_tolerance=None, time_budget=None):
+        self.stall_window = stall_window
+        self.stall_tolerance = stall_tolerance
+        self.spread_tolerance = spread_tolerance
+        self.time_budget = time_budget
+
+    def criteria(self):
+        return dict(stall_window=self.stall_window,
+                    stall_tolerance=self.stall_tolerance,
+                    spread_tolerance=self.spread_tolerance,
+                    time_budget=self.time_budget)
+
+    def _stalled(self, values):
+        if len(values) <= self.stall_window:
+            return False
+        ref_value = values[-self.stall_window - 1]
+        improvement = ref_value - min(values[-self.stall_window:])
+        return improvement <= self.stall_tolerance * abs(ref_value)
+
+    @staticmethod
+    def parameter_spread(island):
+        param_matrix = np.array(island.parents, dtype=float)
+        evaluator = island.opt.evaluator
+        try:
+            bounds = np.array([param.bounds for param in evaluator.params
+                               if not param.frozen], dtype=float)
+            param_range = bounds[:, 1] - bounds[:, 0]
+        except:
+            param_range = np.abs(np.mean(param_matrix, axis=0))
+        param_range[param_range == 0] = 1.
+        return np.max(np.std(param_matrix, axis=0) / param_range)
+
+    def check(self, island):
+        '''Returns the reason for stopping the island or None'''
+        if self.time_budget and island.elapsed_time > self.time_budget:
+            return 'wall-clock budget of %s s exhausted' % self.time_budget
+
+        if self.stall_window and \
+                self._stalled(island.logbook.select('min')) and \
+                self._stalled(island.median_history):
+            return 'best and median fitness stalled for %s generations' % \
+                self.stall_window
+
+        if self.spread_tolerance:
+            spread = self.parameter_spread(island)
+            if spread < self.spread_tolerance:
+                return 'parameter spread collapsed to %.3g' % spread
+
+        return None
+
+
+class Island_Optimizer(object):
+    '''
+    Runs several seeds as islands of one GA. The offspring of all
+    islands are evaluated in a single map call per generation and the
+    elites migrate periodically along a ring of islands.
+    '''
+
+    def __init__(self, islands, migration_interval=10, migration_size=2,
+                 stopping_controller=None, response_capture=None):
+        self.islands = islands
+        self.response_capture = response_capture
+        self.migration_interval = migration_interval
+        self.migration_size = migration_size
+        self.stopping_controller = stopping_controller
+
+    def evaluate(self, islands):
+        pending = [island.pending_evaluations() for island in islands]
+        invalid_ind = [ind for island_inds in pending for ind in island_inds]
+        toolbox = islands[0].toolbox
+        if self.response_capture:
+            self.response_capture.update_threshold(
+                [island.halloffame for island in self.islands])
+            fitnesses = toolbox.map(self.response_capture, invalid_ind)
+        else:
+            fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+        for ind, fit in zip(invalid_ind, fitnesses):
+            ind.fitness.values = fit
+        if self.response_capture:
+            self.response_capture.record(invalid_ind)
+        return [len(island_inds) for island_inds in pending]
+
+    def migrate(self, islands):
+        migrants = [island.elites(self.migration_size)
+                    for island in islands]
+        for i, island in enumerate(islands):
+            island.receive_migrants(migrants[i - 1])
+        logger.debug('Migrated %s elites between %s islands',
+                     self.migration_size, len(islands))
+
+    def finish_generation(self, islands, start_time):
+        if self.response_capture:
+            self.response_capture.prune([island.halloffame
+                                         for island in self.islands])
+        for island in islands:
+            island.elapsed_time += time.time() - start_time
+            if self.stopping_controller and not island.stop_reason:
+                stop_reason = self.stopping_controller.check(island)
+                if stop_reason:
+                    island.stop(stop_reason)
+            island.save_checkpoint()
+
+    def budget(self, max_ngen):
+        criteria = self.stopping_controller.criteria() \
+            if self.stopping_controller else None
+        return dict(max_ngen=max_ngen, stopping_criteria=criteria)
+
+    def run(self, max_ngen, offspring_size):
+        '''
+        A stopped island stays stopped when the run is resumed, unless
+        max_ngen or the stopping criteria have changed since
+        '''
+        start_time = time.time()
+        budget = self.budget(max_ngen)
+        for island in self.islands:
+            island.start(offspring_size,
+                         continue_cp=os.path.exists(island.cp_filename))
+            if island.stop_reason and island.budget != budget:
+                logger.info('Seed %s resumes with a new budget, it had '
+                            'stopped: %s', island.seed, island.stop_reason)
+                island.stop_reason = None
+            island.budget = budget
+
+        # Initial populations of islands which are starting afresh
+        starting = [island for island in self.islands
+                    if island.generation == 0]
+        if starting:
+            nevals = self.evaluate(starting)
+            for island, nevals_island in zip(starting, nevals):
+                island.update(nevals_island)
+            self.finish_generation(starting, start_time)
+
+        while True:
+            start_time = time.time()
+            active = [island for island in self.islands
+                      if island.generation < max_ngen and
+                      not island.stop_reason]
+            if not active:
+                break
+            for island in active:
+                island.variate()
+            nevals = self.evaluate(active)
+            for island, nevals_island in zip(active, nevals):
+                island.update(nevals_island)
+
+            generation = max(island.generation for island in active)
+            if len(active) > 1 and self.migration_size and \
+                    self.migration_interval and \
+                    generation % self.migration_interval == 0:
+                self.migrate(active)
+
+            self.finish_generation(active, start_time)
+
+        return [island.halloffame for island in self.islands]
+
+
+def _opt_param_name(param_config):
+    # as the parameter names of Bpopt_Evaluator
+    if param_config['type'] == 'global':
+        return param_config['param_name']
+    return '%s.%s' % (param_config['param_name'], param_config['sectionlist'])
+
+
+def _opt_param_bounds(param_path):
+    '''
+    Bounds and distribution (dist_type, dist) of the optimized parameters,
+    keyed on the parameter names (param_name for the global parameters,
+    param_name.sectionlist otherwise)
+    '''
+    param_configs = utility.load_json(param_path)
+    return OrderedDict((_opt_param_name(param_config),
+                        (param_config['bounds'],
+                         (param_config.get('dist_type'), param_config.get('dist'))))
+                       for param_config in param_configs
+                       if 'bounds' in param_config)
+
+
+def load_warm_start_params(cp_files, prev_param_path, param_path):
+    '''
+    Collect the hall of fame and the final parents of a previous stage and
+    map them onto the parameters of the current stage
+
+    Parameters
+    ----------
+    cp_files : list
+        checkpoints of the previous stage
+    prev_param_path : str
+        bluepyopt parameter file of the previous stage
+    param_path : str
+        bluepyopt parameter file of the current stage
+
+    Returns
+    -------
+    warm_start_params : list
+        parameter vectors ordered by fitness (hall of fame first), values
+        are clipped to the current bounds and parameters that were frozen
+        or absent in the previous stage (or distributed differently) are None
+    '''
+    prev_param_bounds = _opt_param_bounds(prev_param_path)
+    prev_param_names = list(prev_param_bounds.keys())
+    param_bounds = _opt_param_bounds(param_path)
+
+    # the checkpoint summaries carry the hall of fame and the parents
+    hof_inds, parent_inds = [], []
+    for cp_file in cp_files:
+        cp_summary = utility.load_cp_summary(cp_file)
+        hof_inds.extend(zip(cp_summary['halloffame'],
+                            cp_summary['halloffame_fitness']))
+        parent_inds.extend(zip(cp_summary['parents'],
+                               cp_summary['parents_fitness']))
+
+    warm_start_params, visited = [], set()
+    for inds in [hof_inds, parent_inds]:
+        for ind, fitness in sorted(inds, key=lambda x: sum(x[1])):
+            if tuple(ind) in visited:
+                continue
+            visited.add(tuple(ind))
+            prev_param_dict = dict(zip(prev_param_names, ind))
+            warm_start_ind = []
+            for param_name, (bounds, distribution) in param_bounds.items():
+                # a value of a different distribution doesn't carry over
+                if param_name in prev_param_dict and \
+                        prev_param_bounds[param_name][1] == distribution:
+                    warm_start_ind.append(float(np.clip(
+                        prev_param_dict[param_name], bounds[0], bounds[1])))
+                else:
+                    warm_start_ind.append(None)
+            warm_start_params.append(warm_start_ind)
+
+    logger.debug('%s warm start individuals from %s checkpoints',
+                 len(warm_start_params), len(cp_files))
+    return warm_start_params
+
+
+def register_warm_start(toolbox, warm_start_params, warm_start_fraction=0.5):
+    '''
+    Seed a fraction of the initial population with the warm start
+    parameters, missing values keep their uniformly sampled value
+    '''
+    random_population = toolbox.population
+
+    def population(n):
+        pop = random_population(n=n)
+        n_warm = min(int(round(warm_start_fraction * n)),
+                     len(warm_start_params))
+        for ind, warm_start_ind in zip(pop[:n_warm], warm_start_params):
+            for i, value in enumerate(warm_start_ind):
+                if value is not None:
+                    ind[i] = value
+        return pop
+
+    toolbox.register('population', population)
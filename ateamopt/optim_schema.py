@@ -70,6 +70,51 @@ class Stage_JobConfig(ags.schemas.DefaultSchema):
                                     default=2)
     max_ngen = ags.fields.Int(description='maximum number of generations',default=2)
     seed = ags.fields.List(ags.fields.Int, description="")
+    island_model = ags.fields.Boolean(default=False,
+                          description='Run all the seeds as islands of a single GA '
+                          'from one driver process')
+    migration_interval = ags.fields.Int(description="Generations between migrations "
+                                        "of elites (island model)", default=10)
+    migration_size = ags.fields.Int(description="Number of elites migrating from "
+                                    "each island (island model)", default=2)
+    # Early stopping
+    stop_stall_window = ags.fields.Int(allow_none=True, default=None,
+                          description='Stop when the best and median fitness have not '
+                          'improved over this many generations')
+    stop_stall_tolerance = ags.fields.Float(default=1e-3,
+                          description='Minimum relative improvement over the stall window')
+    stop_spread_tolerance = ags.fields.Float(allow_none=True, default=None,
+                          description='Stop when the spread of the parents along every '
+                          'parameter (std relative to the bounds) drops below this')
+    stop_time_budget = ags.fields.Int(allow_none=True, default=None,
+                          description='Wall-clock budget of the optimization in seconds')
+    # Surrogate pre-screening of the offspring
+    surrogate_screening = ags.fields.Boolean(default=False,
+                          description='Simulate only the offspring predicted to be '
+                          'competitive by a regressor fitted on the GA history')
+    surrogate_model = ags.fields.OptionList(description="",
+                          options=['random_forest', 'gaussian_process'],
+                          default='random_forest')
+    surrogate_min_samples = ags.fields.Int(default=500,
+                          description='Evaluated individuals needed before screening')
+    surrogate_max_samples = ags.fields.Int(default=5000,
+                          description='Most recent evaluated individuals the '
+                          'regressor is fitted on')
+    surrogate_quantile = ags.fields.Float(default=0.75,
+                          description='Offspring predicted below this quantile of '
+                          'the parent fitness are simulated')
+    surrogate_exploration = ags.fields.Float(default=0.2,
+                          description='Fraction of the screened out offspring '
+                          'simulated anyway')
+    surrogate_refill = ags.fields.Boolean(default=False,
+                          description='Replace the screened out offspring with new '
+                          'candidates, so every generation simulates offspring_size '
+                          'individuals')
+    # Hall of fame responses saved during the optimization
+    capture_hof_responses = ags.fields.Boolean(default=False,
+                          description='Save the responses of the hall of fame '
+                          'individuals while optimizing, the analysis then '
+                          'only simulates the protocols missing from them')
     # Bluepyopt used for both
     timeout = ags.fields.Int(description="Simulation cut-off time in seconds")
     learn_eval_trend = ags.fields.Boolean(default=False,
@@ -85,6 +130,9 @@ class Stage_JobConfig(ags.schemas.DefaultSchema):
     calc_time_statistics = ags.fields.Boolean(description="", default=False)
     hoc_export = ags.fields.Boolean(description="Whether to export the model in .hoc format",
                                     default=False)
+    plot_point_budget = ags.fields.Int(allow_none=True, default=5000,
+                          description='Maximum points per plotted trace in the '
+                          'analysis report (peaks are kept), None plots every point')
 
     # TODO: maybe can make default only for certain stage?
     # for now, specify
@@ -94,6 +142,11 @@ class Stage_JobConfig(ags.schemas.DefaultSchema):
     adjust_param_bounds_prev = ags.fields.Float(description="Relax the bounds for parameters fitted"
                                                 "in previous stage",default=0.5)
     prev_stage_path = ags.fields.Str(description="")
+    warm_start = ags.fields.Boolean(description="Seed the initial population from the "
+                                    "hall of fame and final population of the previous "
+                                    "stage", default=False)
+    warm_start_fraction = ags.fields.Float(description="Fraction of the initial population "
+                                           "seeded from the previous stage", default=0.5)
     optim_config = ags.fields.Nested(Job_Parameters)
     analysis_config = ags.fields.Nested(Job_Parameters)
     
@@ -155,5 +208,11 @@ class Optim_Config(ags.ArgSchema):
     released_aa_mechanism = ags.fields.InputFile(description="",allow_none=True)
     released_peri_model = ags.fields.InputFile(description="", allow_none=True)
     released_peri_mechanism = ags.fields.InputFile(description="", allow_none=True)
+    warm_start_checkpoints = ags.fields.List(ags.fields.InputFile, description="Checkpoints "
+                                             "of the previous stage", allow_none=True)
+    warm_start_parameters = ags.fields.InputFile(description="Parameter file of the "
+                                                 "previous stage", allow_none=True)
 
 
+    show_stale = ags.fields.Boolean(description="Only list the analysis steps "
+                                    "which would be rerun", default=False)
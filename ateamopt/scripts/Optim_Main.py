@@ -5,12 +5,20 @@ from datetime import datetime
 from ateamopt.utils import utility
 import shutil
 from ateamopt.bpopt_evaluator import Bpopt_Evaluator
+from ateamopt.optim_algorithms import Island, Island_Optimizer,\
+    Stopping_Controller, Surrogate_Screener, Response_Capture,\
+    load_warm_start_params, register_warm_start
 from ateamopt.optim_schema import Optim_Config
 import argschema as ags
 
 logger = logging.getLogger()
 
 
+def get_seed(args):
+    '''Seed of a single seed job, BLUEPYOPT_SEED overrides the config'''
+    return os.getenv('BLUEPYOPT_SEED', args.get('seed', 1))
+
+
 def create_optimizer(args):
     '''returns configured bluepyopt.optimisations.DEAPOptimisation'''
 
@@ -41,8 +49,7 @@ def create_optimizer(args):
     else:
         map_function = None
 
-    seed = args.get('seed',1)
-    seed = os.getenv('BLUEPYOPT_SEED', seed)
+    seed = get_seed(args)
 
     # load the configuration paths
 
@@ -73,15 +80,7 @@ def create_optimizer(args):
 
 
 
-def main(args):
-    """Main"""
-    stage_jobconfig = args['stage_jobconfig']
-    highlevel_job_props = args['highlevel_jobconfig']
-    seed = args.get('seed',1)
-    logging.basicConfig(level=highlevel_job_props['log_level'])
-
-    opt = create_optimizer(args)
-
+def get_cp_files(stage_jobconfig, seed):
     cp_file = os.path.join(stage_jobconfig['cp_dir'], 'seed%s.pkl' % seed)
     utility.create_filepath(cp_file)
     if stage_jobconfig.get('cp_backup_dir'):
@@ -90,12 +89,6 @@ def main(args):
         utility.create_filepath(cp_backup_file)
     else:
         cp_backup_file = None
-    cp_backup_frequency = stage_jobconfig['cp_backup_frequency']
-    max_ngen = stage_jobconfig['max_ngen']
-    offspring_size = stage_jobconfig['offspring_size']
-
-    continue_cp = os.path.exists(cp_file)
-    logger.debug('Doing start or continue')
 
     if os.path.exists(cp_file):
         try:
@@ -105,6 +98,130 @@ def main(args):
             if cp_backup_file and os.path.exists(cp_backup_file):
                 shutil.copyfile(cp_backup_file, cp_file)
 
+    return cp_file, cp_backup_file
+
+
+def get_warm_start_params(args):
+    stage_jobconfig = args['stage_jobconfig']
+    if not (stage_jobconfig.get('warm_start') and
+            args.get('warm_start_checkpoints')):
+        return None
+
+    return load_warm_start_params(args['warm_start_checkpoints'],
+                                  args['warm_start_parameters'],
+                                  args['parameters'])
+
+
+def create_stopping_controller(stage_jobconfig):
+    stall_window = stage_jobconfig.get('stop_stall_window')
+    spread_tolerance = stage_jobconfig.get('stop_spread_tolerance')
+    time_budget = stage_jobconfig.get('stop_time_budget')
+    if not (stall_window or spread_tolerance or time_budget):
+        return None
+
+    return Stopping_Controller(stall_window=stall_window,
+                               stall_tolerance=stage_jobconfig.get(
+                                   'stop_stall_tolerance', 1e-3),
+                               spread_tolerance=spread_tolerance,
+                               time_budget=time_budget)
+
+
+def create_surrogate_screener(stage_jobconfig):
+    if not stage_jobconfig.get('surrogate_screening'):
+        return None
+
+    return Surrogate_Screener(model=stage_jobconfig['surrogate_model'],
+                              min_samples=stage_jobconfig['surrogate_min_samples'],
+                              max_samples=stage_jobconfig['surrogate_max_samples'],
+                              quantile=stage_jobconfig['surrogate_quantile'],
+                              exploration_fraction=stage_jobconfig[
+                                  'surrogate_exploration'],
+                              refill=stage_jobconfig['surrogate_refill'])
+
+
+def create_response_capture(stage_jobconfig, opt):
+    if not stage_jobconfig.get('capture_hof_responses'):
+        return None
+
+    capture_dir = os.path.join(stage_jobconfig['cp_dir'], 'hof_responses')
+    return Response_Capture(opt.evaluator, opt.toolbox.evaluate, capture_dir)
+
+
+def run_islands(args, seeds):
+    """Run the seeds as islands of a single GA"""
+    stage_jobconfig = args['stage_jobconfig']
+    opt = create_optimizer(args)
+    warm_start_params = get_warm_start_params(args)
+    screener = create_surrogate_screener(stage_jobconfig)
+
+    islands = []
+    for seed in seeds:
+        opt_seed = bpopt.optimisations.DEAPOptimisation(
+            evaluator=opt.evaluator,
+            map_function=opt.map_function,
+            seed=seed)
+        if warm_start_params:
+            register_warm_start(opt_seed.toolbox, warm_start_params,
+                                stage_jobconfig['warm_start_fraction'])
+        cp_file, cp_backup_file = get_cp_files(stage_jobconfig, seed)
+        islands.append(Island(opt_seed, seed, cp_file, cp_backup_file,
+                              stage_jobconfig['cp_backup_frequency'],
+                              screener))
+
+    island_opt = Island_Optimizer(islands,
+                                  stage_jobconfig['migration_interval'],
+                                  stage_jobconfig['migration_size'],
+                                  create_stopping_controller(stage_jobconfig),
+                                  create_response_capture(stage_jobconfig, opt))
+    island_opt.run(max_ngen=stage_jobconfig['max_ngen'],
+                   offspring_size=stage_jobconfig['offspring_size'])
+
+    for island in islands:
+        utility.save_cp_summary(island.cp_filename)
+
+
+def main(args):
+    """Main"""
+    stage_jobconfig = args['stage_jobconfig']
+    highlevel_job_props = args['highlevel_jobconfig']
+    seed = get_seed(args)
+    logging.basicConfig(level=highlevel_job_props['log_level'])
+
+    if stage_jobconfig.get('island_model'):
+        logger.info('Running seeds %s as islands of one GA',
+                    stage_jobconfig['seed'])
+        run_islands(args, stage_jobconfig['seed'])
+        return
+    island_options = [option for option in ['stop_stall_window',
+                                            'stop_spread_tolerance',
+                                            'stop_time_budget',
+                                            'surrogate_screening',
+                                            'capture_hof_responses']
+                      if stage_jobconfig.get(option)]
+    if island_options:
+        # bluepyopt's GA loop has no hooks for these, run a single island
+        # (same generations as eaAlphaMuPlusLambdaCheckpoint otherwise,
+        # see tests/test_optim_algorithms.py)
+        logger.info('Running seed %s with the island GA loop for %s', seed,
+                    ', '.join(island_options))
+        run_islands(args, [seed])
+        return
+
+    logger.info('Running seed %s with eaAlphaMuPlusLambdaCheckpoint', seed)
+    opt = create_optimizer(args)
+    warm_start_params = get_warm_start_params(args)
+    if warm_start_params:
+        register_warm_start(opt.toolbox, warm_start_params,
+                            stage_jobconfig['warm_start_fraction'])
+
+    cp_file, cp_backup_file = get_cp_files(stage_jobconfig, seed)
+    cp_backup_frequency = stage_jobconfig['cp_backup_frequency']
+    max_ngen = stage_jobconfig['max_ngen']
+    offspring_size = stage_jobconfig['offspring_size']
+
+    continue_cp = os.path.exists(cp_file)
+    logger.debug('Doing start or continue')
+
     opt.run(max_ngen=max_ngen,
             offspring_size=offspring_size,
             continue_cp=continue_cp,
@@ -112,6 +229,9 @@ def main(args):
             cp_backup=cp_backup_file,
             cp_backup_frequency=cp_backup_frequency)
 
+    # Sidecar summary so that the analysis doesn't unpickle the checkpoint
+    utility.save_cp_summary(cp_file)
+
 
 if __name__ == '__main__':
     mod = ags.ArgSchemaParser(schema_type=Optim_Config)
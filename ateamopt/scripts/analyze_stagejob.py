@@ -1,11 +1,16 @@
 import os
 import glob
+import threading
+from functools import partial
 from ateamopt.utils import utility
 from ateamopt.analysis.optim_analysis import Optim_Analyzer
 from ateamopt.bpopt_evaluator import Bpopt_Evaluator
 import bluepyopt as bpopt
-from matplotlib.backends.backend_pdf import PdfPages
+from ateamopt.analysis.report import Report_Builder
+from ateamopt.analysis.analysis_pipeline import Analysis_Pipeline
+from ateamopt.analysis.response_store import Response_Store
 import numpy as np
+from collections import OrderedDict
 from ateamopt.analysis import analysis_module
 from ateamopt.optim_schema import Optim_Config
 import argschema as ags
@@ -65,6 +70,7 @@ def main(args):
     morph_path = highlevel_job_props['swc_path']
     axon_type = highlevel_job_props['axon_type']
     ephys_dir = highlevel_job_props['ephys_dir']
+    stim_mapfile = highlevel_job_props['stimmap_file']
 
     train_features_path = args['train_features']
     test_features_path = args['test_features']
@@ -72,222 +78,178 @@ def main(args):
     mech_write_path = args['mechanism']
     release_param_write_path = args['released_aa_model']
     mech_release_write_path = args['released_aa_mechanism']
+    peri_param_path = args.get('released_peri_model')
+    peri_mech_path = args.get('released_peri_mechanism')
 
+    # Captured responses only hold the training protocols, the engines
+    # still simulate the rest of the protocols for the analysis
     analysis_parallel = (stage_jobconfig['analysis_config'].get('ipyparallel') and 
             stage_jobconfig['run_hof_analysis'])
 
     props = dict(axon_type=axon_type, ephys_dir=ephys_dir)
 
-    map_function = analyzer_map(analysis_parallel)
-    opt_train = get_opt_obj(all_protocols_path, train_features_path,
-                            morph_path, param_write_path,
-                            mech_write_path, map_function, **props)
-    opt_all = get_opt_obj(all_protocols_path, all_features_path,
-                          morph_path, param_write_path,
-                          mech_write_path, map_function, **props)
-    opt_test = get_opt_obj(all_protocols_path, test_features_path,
-                           morph_path, param_write_path,
-                           mech_write_path, map_function, **props)
-
-    analysis_handler = Optim_Analyzer(args, opt_all)
-    best_model = analysis_handler.get_best_model()  # Model with least training error
-
-    aibs_params_modelname = 'fitted_params/optim_param_%s.json' % cell_id
-    analysis_handler.save_params_aibs_format(aibs_params_modelname,
-                                             best_model[0],expand_params = True)
-    aibs_params_compact_modelname = 'fitted_params/optim_param_%s_compact.json'%cell_id
-    analysis_handler.save_params_aibs_format(aibs_params_compact_modelname,best_model[0])
-    bpopt_params_modelname = 'fitted_params/optim_param_%s_bpopt.json'%cell_id
-    analysis_handler.save_params_bpopt_format(bpopt_params_modelname,
-                                              best_model[0])
-    
-    # Export hoc model
-    if stage_jobconfig['hoc_export']:
-        hoc_export_path = 'fitted_params/model_template_%s.hoc'%cell_id
-        utility.create_filepath(hoc_export_path)
-        best_param_dict = {key:best_model[0][i] for i,key in \
-                            enumerate(opt_train.evaluator.param_names)}
-        model_string = opt_train.evaluator.cell_model.create_hoc(best_param_dict)
-        with open(hoc_export_path, "w") as hoc_template:
-            hoc_template.write(model_string)
-    
-    hof_model_params, seed_indices = analysis_handler.get_all_models()
-
-    if not stage_jobconfig.get('run_hof_analysis'):
-        hof_model_params, seed_indices = best_model, [seed_indices[0]]
+    # Evaluators (and the engines) are only set up when a step needs them
+    features_paths = {'train': train_features_path, 'all': all_features_path,
+                      'test': test_features_path}
+    opt_objs = {}
+    opt_lock = threading.Lock()
+
+    def get_opt(target):
+        with opt_lock:
+            if 'map_function' not in opt_objs:
+                opt_objs['map_function'] = analyzer_map(analysis_parallel)
+            if target not in opt_objs:
+                opt_objs[target] = get_opt_obj(all_protocols_path,
+                                               features_paths[target],
+                                               morph_path, param_write_path,
+                                               mech_write_path,
+                                               opt_objs['map_function'], **props)
+            return opt_objs[target]
+
+    def get_handler(target):
+        return Optim_Analyzer(args, get_opt(target))
+
+    analysis_handler = Optim_Analyzer(args)
+    cp_files = sorted(glob.glob(os.path.join(stage_jobconfig['cp_dir'],
+                                             'seed*.pkl')))
+    model_files = [param_write_path, mech_write_path, morph_path,
+                   all_protocols_path]
+
+    def get_hof_models():
+        best_model = analysis_handler.get_best_model()  # Model with least training error
+        hof_model_params, seed_indices = analysis_handler.get_all_models()
+        if not stage_jobconfig.get('run_hof_analysis'):
+            hof_model_params, seed_indices = best_model, [seed_indices[0]]
+        return hof_model_params, seed_indices
 
     hof_params_filename = 'analysis_params/hof_model_params.pkl'
-    hof_responses_filename = 'analysis_params/hof_response_all.pkl'
+    hof_responses_filename = 'analysis_params/hof_response_store'
     obj_list_train_filename = 'analysis_params/hof_obj_train.pkl'
     obj_list_all_filename = 'analysis_params/hof_obj_all.pkl'
     feat_list_all_filename = 'analysis_params/hof_features_all.pkl'
     obj_list_test_filename = 'analysis_params/hof_obj_test.pkl'
     seed_indices_filename = 'analysis_params/seed_indices.pkl'
-
     score_list_train_filename = 'analysis_params/score_list_train.pkl'
-
-    # Response for the entire hall of fame not arranged
-    hof_response_list = analysis_handler.get_model_responses(hof_model_params,
-                                                             hof_responses_filename)
-
-    analysis_handler._opt = opt_train
-    obj_list_train = analysis_handler.get_response_scores(hof_response_list)
-
-    # Sort everything with respect to training error
-
-    if not os.path.exists(score_list_train_filename):
-        score_list_train = [np.sum(list(obj_dict_train.values()))
-                            for obj_dict_train in obj_list_train]
-        utility.create_filepath(score_list_train_filename)
-        utility.save_pickle(score_list_train_filename, score_list_train)
-    else:
-        score_list_train = utility.load_pickle(score_list_train_filename)
-
-    if not os.path.exists(seed_indices_filename):
-        seed_indices_sorted = analysis_handler.organize_models(seed_indices,
-                                                               score_list_train)
-        utility.save_pickle(seed_indices_filename, seed_indices_sorted)
-
-    if not os.path.exists(obj_list_train_filename):
-        obj_list_train_sorted = analysis_handler.organize_models(obj_list_train,
-                                                                 score_list_train)
-        utility.save_pickle(obj_list_train_filename, obj_list_train_sorted)
-
-    if not os.path.exists(obj_list_all_filename):
-        analysis_handler._opt = opt_all
-        obj_list_gen = analysis_handler.get_response_scores(hof_response_list)
-        obj_list_gen_sorted = analysis_handler.organize_models(obj_list_gen,
-                                                               score_list_train)
-        utility.save_pickle(obj_list_all_filename, obj_list_gen_sorted)
-
-    if not os.path.exists(feat_list_all_filename):
-        analysis_handler._opt = opt_all
-        feat_list_gen = analysis_handler.get_response_features(
-            hof_response_list)
-        feat_list_gen_sorted = analysis_handler.organize_models(feat_list_gen,
-                                                                score_list_train)
-        utility.save_pickle(feat_list_all_filename, feat_list_gen_sorted)
-
-    if not os.path.exists(obj_list_test_filename):
-        analysis_handler._opt = opt_test
-        obj_list_test = analysis_handler.get_response_scores(hof_response_list)
-
-        obj_list_test_sorted = analysis_handler.organize_models(obj_list_test,
-                                                                score_list_train)
-        utility.save_pickle(obj_list_test_filename, obj_list_test_sorted)
-
-    analysis_handler._opt = opt_train
-
-    # Save the sorted hof responses at the end
-    hof_response_sorted = analysis_handler.organize_models(hof_response_list,
-                                                           score_list_train)
-    utility.save_pickle(hof_responses_filename, hof_response_sorted)
-
-    # Save the sorted hall of fame output in .pkl
-    hof_model_params_sorted = analysis_handler.save_hof_output_params(hof_model_params,
-                                                  hof_params_filename, score_list_train)
-    # Save the entire hall of fame parameters
-    for i, hof_param in enumerate(hof_model_params_sorted):
-        aibs_params_modelname = os.path.join('fitted_params','hof_param_%s_%s.json' % (
-            cell_id,i))
-        analysis_handler.save_params_aibs_format(aibs_params_modelname,
-                                                 hof_param, expand_params=True)
-
-    # Now save the sorted score
-    utility.save_pickle(score_list_train_filename, sorted(score_list_train))
-
+    # Parsed experimental sweeps shared by the report processes
+    utility.sweep_cache_dir = os.path.join('analysis_params', 'sweep_cache')
     GA_evol_path = os.path.join('analysis_params','GA_evolution_params.pkl')
-    analysis_handler.save_GA_evolultion_info(GA_evol_path)
-
     resp_filename = os.path.join(os.getcwd(),'resp_opt.txt')
-    analysis_handler.save_best_response(hof_response_sorted[0], resp_filename)
-
-    if release_param_write_path:
+    resp_release_filename = os.path.join(os.getcwd(),'resp_release.txt') \
+        if release_param_write_path else None
+    resp_peri_filename = os.path.join(os.getcwd(),'resp_peri.txt')
+    features_aa_filename = os.path.join('Validation_Responses','Features_released_aa_%s.pkl'% cell_id)
+    features_peri_filename = os.path.join('Validation_Responses','Features_peri_%s.pkl' % cell_id)
+    spiketimes_exp_path = os.path.join('Validation_Responses','spiketimes_exp_noise.pkl')
+    spiketimes_hof_path = os.path.join('Validation_Responses','spiketimes_model_noise.pkl')
+    exp_variance_hof_path = os.path.join('Validation_Responses','exp_variance_hof.pkl')
+    model_perf_filename = os.path.join('Validation_Responses','fitness_metrics_%s.csv'%cell_id)
+    exp_fi_path = os.path.join('Validation_Responses','fI_exp_%s.pkl'%cell_id)
+    exp_AP_shape_path = os.path.join('Validation_Responses','AP_shape_exp_%s.pkl' % cell_id)
+    model_fi_paths = {'All-active': os.path.join('Validation_Responses','fI_aa_%s.pkl' % cell_id),
+                      'Perisomatic': os.path.join('Validation_Responses','fI_peri_%s.pkl' % cell_id)}
+    model_AP_shape_paths = {'All-active': os.path.join('Validation_Responses','AP_shape_aa_%s.pkl' % cell_id),
+                            'Perisomatic': os.path.join('Validation_Responses','AP_shape_peri_%s.pkl'%cell_id)}
+    analysis_write_path = '%s_%s.pdf' % (
+        cell_id, stage_jobconfig['stage_name'])
+    run_peri_comparison = bool(peri_model_id and stage_jobconfig['run_peri_comparison'])
+
+    def save_best_model():
+        best_model = analysis_handler.get_best_model()
+        handler_train = get_handler('train')
+        aibs_params_modelname = 'fitted_params/optim_param_%s.json' % cell_id
+        handler_train.save_params_aibs_format(aibs_params_modelname,
+                                              best_model[0],expand_params = True)
+        aibs_params_compact_modelname = 'fitted_params/optim_param_%s_compact.json'%cell_id
+        handler_train.save_params_aibs_format(aibs_params_compact_modelname,best_model[0])
+        bpopt_params_modelname = 'fitted_params/optim_param_%s_bpopt.json'%cell_id
+        handler_train.save_params_bpopt_format(bpopt_params_modelname,
+                                               best_model[0])
+
+        # Export hoc model
+        if stage_jobconfig['hoc_export']:
+            opt_train = get_opt('train')
+            hoc_export_path = 'fitted_params/model_template_%s.hoc'%cell_id
+            utility.create_filepath(hoc_export_path)
+            best_param_dict = {key:best_model[0][i] for i,key in \
+                                enumerate(opt_train.evaluator.param_names)}
+            model_string = opt_train.evaluator.cell_model.create_hoc(best_param_dict)
+            with open(hoc_export_path, "w") as hoc_template:
+                hoc_template.write(model_string)
+
+    def save_hof_responses():
+        # Response for the entire hall of fame not arranged
+        hof_model_params, _ = get_hof_models()
+        if stage_jobconfig.get('capture_hof_responses'):
+            capture_dir = os.path.join(stage_jobconfig['cp_dir'], 'hof_responses')
+        else:
+            capture_dir = None
+        get_handler('all').get_model_response_store(
+            hof_model_params, hof_responses_filename, capture_dir=capture_dir)
+
+    def save_hof_scores():
+        hof_model_params, seed_indices = get_hof_models()
+        hof_response_store = Response_Store(hof_responses_filename)
+        hof_response_store.reset_order()
+        hof_response_list = hof_response_store.responses()
+
+        # Score against train, all and test features in a single pass
+        opt_targets = OrderedDict([('train', get_opt('train')),
+                                   ('all', get_opt('all')),
+                                   ('test', get_opt('test'))])
+        obj_lists, feat_list_gen = get_handler('all').\
+            get_response_scores_multi_target(hof_response_list, opt_targets)
+
+        # Sort everything with respect to training error
+        score_list_train = [np.sum(list(obj_dict_train.values()))
+                            for obj_dict_train in obj_lists['train']]
+        for model_list, model_list_filename in [
+                (seed_indices, seed_indices_filename),
+                (obj_lists['train'], obj_list_train_filename),
+                (obj_lists['all'], obj_list_all_filename),
+                (feat_list_gen, feat_list_all_filename),
+                (obj_lists['test'], obj_list_test_filename)]:
+            utility.create_filepath(model_list_filename)
+            utility.save_pickle(model_list_filename, analysis_handler.
+                                organize_models(model_list, score_list_train))
+
+        # Sort the hof responses at the end
+        hof_response_store.reorder(np.argsort(score_list_train, kind='stable'))
+
+        # Save the sorted hall of fame output in .pkl
+        handler_train = get_handler('train')
+        hof_model_params_sorted = handler_train.save_hof_output_params(hof_model_params,
+                                                      hof_params_filename, score_list_train)
+        # Save the entire hall of fame parameters
+        for i, hof_param in enumerate(hof_model_params_sorted):
+            aibs_params_modelname = os.path.join('fitted_params','hof_param_%s_%s.json' % (
+                cell_id,i))
+            handler_train.save_params_aibs_format(aibs_params_modelname,
+                                                  hof_param, expand_params=True)
+
+        # Now save the sorted score
+        utility.save_pickle(score_list_train_filename, sorted(score_list_train))
+
+    def save_best_response():
+        hof_response_list = Response_Store(hof_responses_filename).responses()
+        analysis_handler.save_best_response(hof_response_list[0], resp_filename)
+
+    def save_release_responses(param_path, mech_path, resp_path,
+                               features_path, **release_props):
         eval_handler_release = Bpopt_Evaluator(all_protocols_path,
                                                all_features_path,
-                                               morph_path, release_param_write_path,
-                                               mech_release_write_path,
-                                               stub_axon=False,
-                                               do_replace_axon=True,
-                                               ephys_dir=ephys_dir)
+                                               morph_path, param_path,
+                                               mech_path, **release_props)
         evaluator_release = eval_handler_release.create_evaluator()
         opt_release = bpopt.optimisations.DEAPOptimisation(
             evaluator=evaluator_release)
-        resp_release_filename = os.path.join(os.getcwd(),'resp_release.txt')
-        analysis_handler.get_release_responses(
-            opt_release, resp_release_filename)
-        resp_release_aa = utility.load_pickle(resp_release_filename)[0]
-        features_release_aa = opt_release.evaluator.fitness_calculator.\
-            calculate_features(resp_release_aa)
-        features_aa_filename = os.path.join('Validation_Responses','Features_released_aa_%s.pkl'% cell_id)
-        utility.create_filepath(features_aa_filename)
-        utility.save_pickle(features_aa_filename, features_release_aa)
-    else:
-        resp_release_filename = None
-
-    stim_mapfile = highlevel_job_props['stimmap_file']
-    analysis_write_path = '%s_%s.pdf' % (
-        cell_id, stage_jobconfig['stage_name'])
-    pdf_pages = PdfPages(analysis_write_path)
-    model_type = 'All-active'
-    pdf_pages = analysis_handler.plot_grid_Response(resp_filename,
-                                                    resp_release_filename,
-                                                    stim_mapfile,
-                                                    pdf_pages)
-
-    pdf_pages = analysis_handler.plot_feature_comp(resp_filename,
-                                                   resp_release_filename, pdf_pages)
-    pdf_pages = analysis_handler.plot_GA_evol(GA_evol_path, pdf_pages)
-    pdf_pages = analysis_handler.plot_param_diversity(hof_params_filename,
-                                                      pdf_pages)
-
-    if stage_jobconfig['model_postprocess']:
-        exp_fi_path = os.path.join('Validation_Responses','fI_exp_%s.pkl'%cell_id)
-        model_fi_path = os.path.join('Validation_Responses','fI_aa_%s.pkl' % cell_id)
-        exp_AP_shape_path = os.path.join('Validation_Responses','AP_shape_exp_%s.pkl' % cell_id)
-        model_AP_shape_path = os.path.join('Validation_Responses','AP_shape_aa_%s.pkl' % cell_id)
-
-        pdf_pages = analysis_handler.postprocess(stim_mapfile, resp_filename, pdf_pages,
-                                                 exp_fi_path, model_fi_path, exp_AP_shape_path, model_AP_shape_path,
-                                                 model_type)
-
-    # Perisomatic model
-
-    if peri_model_id and stage_jobconfig['run_peri_comparison']:
-        resp_peri_filename = os.path.join(os.getcwd(),'resp_peri.txt')
-        peri_param_path = args['released_peri_model']
-        peri_mech_path = args['released_peri_mechanism']
-
-        props_peri = props.copy()
-        props_peri['axon_type'] = 'stub_axon'
-        eval_handler_peri = Bpopt_Evaluator(all_protocols_path,
-                                            all_features_path,
-                                            morph_path, peri_param_path,
-                                            peri_mech_path, **props_peri)
-        evaluator_peri = eval_handler_peri.create_evaluator()
-        opt_peri = bpopt.optimisations.DEAPOptimisation(
-            evaluator=evaluator_peri)
-        model_type = 'Perisomatic'
-        analysis_handler.get_release_responses(opt_peri, resp_peri_filename)
-        resp_peri = utility.load_pickle(resp_peri_filename)[0]
-        features_peri = opt_peri.evaluator.fitness_calculator.calculate_features(
-            resp_peri)
-        features_peri_filename = os.path.join('Validation_Responses','Features_peri_%s.pkl' % cell_id)
-        utility.create_filepath(features_peri_filename)
-        utility.save_pickle(features_peri_filename, features_peri)
-
-        pdf_pages = analysis_handler.plot_grid_Response(resp_filename,
-                        resp_peri_filename,stim_mapfile, pdf_pages, 
-                        resp_comparison=model_type)
-        if stage_jobconfig['model_postprocess']:
-            model_fi_path = os.path.join('Validation_Responses','fI_peri_%s.pkl' % cell_id)
-            model_AP_shape_path = os.path.join('Validation_Responses','AP_shape_peri_%s.pkl'%cell_id)
-            pdf_pages = analysis_handler.postprocess(stim_mapfile, resp_peri_filename, 
-                        pdf_pages, exp_fi_path, model_fi_path, exp_AP_shape_path, 
-                        model_AP_shape_path, model_type)
-
-    if stage_jobconfig.get('calc_model_perf'):
-        spiketimes_exp_path = os.path.join('Validation_Responses','spiketimes_exp_noise.pkl')
+        get_handler('train').get_release_responses(opt_release, resp_path)
+        resp_release = utility.load_pickle(resp_path)[0]
+        features_release = opt_release.evaluator.fitness_calculator.\
+            calculate_features(resp_release)
+        utility.create_filepath(features_path)
+        utility.save_pickle(features_path, features_release)
+
+    def save_spiketimes_exp():
         all_features = utility.load_json(all_features_path)
         spiketimes_noise_exp = {}
         for stim_, feat in all_features.items():
@@ -298,26 +260,172 @@ def main(args):
             utility.create_filepath(spiketimes_exp_path)
             utility.save_pickle(spiketimes_exp_path, spiketimes_noise_exp)
 
-        spiketimes_hof_path = os.path.join('Validation_Responses','spiketimes_model_noise.pkl')
-        exp_variance_hof_path = os.path.join('Validation_Responses','exp_variance_hof.pkl')
-        model_perf_filename = os.path.join('Validation_Responses','fitness_metrics_%s.csv'%cell_id)
-        pdf_pages = analysis_handler.hof_statistics(stim_mapfile, pdf_pages,
-                                                    obj_list_all_filename, hof_responses_filename,
-                                                    obj_list_train_filename, obj_list_test_filename,
-                                                    seed_indices_filename, spiketimes_exp_path, spiketimes_hof_path,
-                                                    exp_variance_hof_path, cell_metadata, model_perf_filename)
-    pdf_pages.close()
+    def render_report():
+        handler_train = get_handler('train')
+        # Independent pages are rendered in parallel and merged in order
+        report = Report_Builder(analysis_write_path,
+                                nprocs=stage_jobconfig['analysis_config'].get('nprocs'))
+        model_type = 'All-active'
+        # The sorted hall of fame store, its first model is the best one
+        for page in range(handler_train.grid_Response_pages(stim_mapfile)):
+            report.add_section(handler_train.plot_grid_Response, hof_responses_filename,
+                               resp_release_filename, stim_mapfile, pages=[page])
+
+        report.add_section(handler_train.plot_feature_comp, hof_responses_filename,
+                           resp_release_filename)
+        report.add_section(handler_train.plot_GA_evol, GA_evol_path)
+        report.add_section(handler_train.plot_param_diversity,
+                           hof_params_filename)
 
-    if stage_jobconfig.get('calc_time_statistics'):
-#        time_by_gen_filename = 'time_info.txt'
-#        if os.path.exists(time_by_gen_filename):
-#            time_metrics_filename = 'time_metrics_%s.csv' % cell_id
-#            analysis_module.save_optimization_time(time_by_gen_filename,
-#                                                   time_metrics_filename, cell_metadata)
+        if stage_jobconfig['model_postprocess']:
+            postprocess_section = report.add_section(
+                handler_train.postprocess, stim_mapfile, hof_responses_filename,
+                exp_fi_path=exp_fi_path, model_fi_path=model_fi_paths[model_type],
+                exp_AP_shape_path=exp_AP_shape_path,
+                model_AP_shape_path=model_AP_shape_paths[model_type],
+                model_type=model_type)
+
+        # Perisomatic model
+        if run_peri_comparison:
+            model_type = 'Perisomatic'
+            for page in range(handler_train.grid_Response_pages(stim_mapfile)):
+                report.add_section(handler_train.plot_grid_Response,
+                                   hof_responses_filename, resp_peri_filename, stim_mapfile,
+                                   resp_comparison=model_type, pages=[page])
+            if stage_jobconfig['model_postprocess']:
+                # The experimental fI and AP shape are cached by the all-active postprocess
+                report.add_section(handler_train.postprocess, stim_mapfile,
+                                   resp_peri_filename, exp_fi_path=exp_fi_path,
+                                   model_fi_path=model_fi_paths[model_type],
+                                   exp_AP_shape_path=exp_AP_shape_path,
+                                   model_AP_shape_path=model_AP_shape_paths[model_type],
+                                   model_type=model_type,
+                                   depends_on=[postprocess_section])
+
+        if stage_jobconfig.get('calc_model_perf'):
+            report.add_section(handler_train.hof_statistics, stim_mapfile,
+                               hof_obj_all_filename=obj_list_all_filename,
+                               hof_responses_filename=hof_responses_filename,
+                               hof_obj_train_filename=obj_list_train_filename,
+                               hof_obj_untrain_filename=obj_list_test_filename,
+                               seed_indices_filename=seed_indices_filename,
+                               spiketimes_exp_path=spiketimes_exp_path,
+                               spiketimes_hof_path=spiketimes_hof_path,
+                               exp_variance_hof_path=exp_variance_hof_path,
+                               cell_metadata=cell_metadata,
+                               model_perf_filename=model_perf_filename,
+                               nprocs=stage_jobconfig['analysis_config'].get('nprocs'),
+                               in_parent=True)
+        report.render()
+
+    def save_compute_statistics():
         compute_statistics_filename = 'compute_metrics_%s.csv' % cell_id
         opt_logbook = 'logbook_info.txt'
         analysis_module.save_compute_statistics(opt_logbook,compute_statistics_filename)
 
+    # Analysis as a DAG of steps, only the stale ones are rerun
+    pipeline = Analysis_Pipeline('analysis_params/pipeline_manifest.json')
+    best_model_outputs = ['fitted_params/optim_param_%s.json' % cell_id,
+                          'fitted_params/optim_param_%s_compact.json' % cell_id,
+                          'fitted_params/optim_param_%s_bpopt.json' % cell_id]
+    if stage_jobconfig['hoc_export']:
+        best_model_outputs.append('fitted_params/model_template_%s.hoc' % cell_id)
+    pipeline.add_node('best_model', save_best_model, outputs=best_model_outputs,
+                      input_files=model_files + [train_features_path] + cp_files,
+                      params={'hoc_export': stage_jobconfig['hoc_export']},
+                      exclusive=True)
+    pipeline.add_node('hof_responses', save_hof_responses,
+                      outputs=[hof_responses_filename],
+                      input_files=model_files + [all_features_path] + cp_files,
+                      params={'run_hof_analysis': stage_jobconfig.get('run_hof_analysis'),
+                              'capture_hof_responses': stage_jobconfig.get('capture_hof_responses')},
+                      exclusive=True)
+    pipeline.add_node('hof_scores', save_hof_scores,
+                      outputs=[hof_params_filename, obj_list_train_filename,
+                               obj_list_all_filename, feat_list_all_filename,
+                               obj_list_test_filename, seed_indices_filename,
+                               score_list_train_filename],
+                      optional_outputs=[os.path.join('fitted_params',
+                                                     'hof_param_%s_*.json' % cell_id)],
+                      input_files=[train_features_path, all_features_path,
+                                   test_features_path],
+                      depends_on=['hof_responses'], exclusive=True)
+    pipeline.add_node('GA_evolution', lambda: analysis_handler.save_GA_evolultion_info(GA_evol_path),
+                      outputs=[GA_evol_path], input_files=cp_files)
+    pipeline.add_node('best_response', save_best_response,
+                      outputs=[resp_filename], depends_on=['hof_scores'])
+    report_deps = ['best_model', 'hof_scores', 'GA_evolution']
+    if release_param_write_path:
+        pipeline.add_node('released_aa_responses',
+                          partial(save_release_responses, release_param_write_path,
+                                  mech_release_write_path, resp_release_filename,
+                                  features_aa_filename, stub_axon=False,
+                                  do_replace_axon=True, ephys_dir=ephys_dir),
+                          outputs=[resp_release_filename, features_aa_filename],
+                          input_files=[release_param_write_path, mech_release_write_path,
+                                       morph_path, all_protocols_path,
+                                       all_features_path, train_features_path],
+                          exclusive=True)
+        report_deps.append('released_aa_responses')
+    if run_peri_comparison:
+        props_peri = props.copy()
+        props_peri['axon_type'] = 'stub_axon'
+        pipeline.add_node('peri_responses',
+                          partial(save_release_responses, peri_param_path,
+                                  peri_mech_path, resp_peri_filename,
+                                  features_peri_filename, **props_peri),
+                          outputs=[resp_peri_filename, features_peri_filename],
+                          input_files=[peri_param_path, peri_mech_path, morph_path,
+                                       all_protocols_path, all_features_path,
+                                       train_features_path],
+                          exclusive=True)
+        report_deps.append('peri_responses')
+    if stage_jobconfig.get('calc_model_perf'):
+        # only written when the features have Noise spike times
+        pipeline.add_node('spiketimes_exp', save_spiketimes_exp,
+                          optional_outputs=[spiketimes_exp_path],
+                          input_files=[all_features_path])
+        report_deps.append('spiketimes_exp')
+
+    report_outputs = [analysis_write_path]
+    report_optional_outputs = []
+    if stage_jobconfig['model_postprocess']:
+        model_types = ['All-active', 'Perisomatic'] if run_peri_comparison \
+            else ['All-active']
+        report_outputs += [exp_fi_path] + [model_fi_paths[model_type_]
+                                           for model_type_ in model_types]
+        # the AP shapes (and their variance) need spiking stimuli
+        AP_shape_paths = [exp_AP_shape_path] + [model_AP_shape_paths[model_type_]
+                                                for model_type_ in model_types]
+        report_optional_outputs += AP_shape_paths + [
+            Optim_Analyzer.spike_shape_variance_path(AP_shape_path)
+            for AP_shape_path in AP_shape_paths]
+    if stage_jobconfig.get('calc_model_perf'):
+        report_outputs += [exp_variance_hof_path,
+                           exp_variance_hof_path.replace('pkl', 'csv'),
+                           model_perf_filename]
+        report_optional_outputs.append(spiketimes_hof_path)
+    pipeline.add_node('report', render_report, outputs=report_outputs,
+                      optional_outputs=report_optional_outputs,
+                      input_files=[stim_mapfile, train_features_path],
+                      depends_on=report_deps,
+                      params={key: stage_jobconfig.get(key) for key in
+                              ['model_postprocess', 'calc_model_perf',
+                               'run_peri_comparison', 'plot_point_budget']},
+                      exclusive=True, forks=True)
+    if stage_jobconfig.get('calc_time_statistics'):
+        pipeline.add_node('compute_statistics', save_compute_statistics,
+                          outputs=['compute_metrics_%s.csv' % cell_id],
+                          input_files=['logbook_info.txt'])
+
+    if args.get('show_stale'):
+        for name, reason in pipeline.stale_nodes().items():
+            logger.info('%-24s %s', name, 'rerun (%s)' % reason if reason else 'up to date')
+        return
+
+    pipeline.run()
+
+
 if __name__ == '__main__':
     mod = ags.ArgSchemaParser(schema_type=Optim_Config)
     main(mod.args)
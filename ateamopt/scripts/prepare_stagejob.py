@@ -132,6 +132,17 @@ def main(args):
         props['released_peri_model'] = peri_params_write_path
         props['released_peri_mechanism'] = peri_mech_write_path
 
+    # Initial population seeded from the previous stage
+    if prev_stage_path and stage_jobconfig.get('warm_start'):
+        prev_stage_config = utility.load_json(os.path.join(prev_stage_path,
+                                                           'stage_job_config.json'))
+        prev_cp_dir = os.path.join(prev_stage_path,
+                                   prev_stage_config['stage_jobconfig']['cp_dir'])
+        props['warm_start_checkpoints'] = sorted(glob.glob(
+            os.path.join(prev_cp_dir, 'seed*.pkl')))
+        props['warm_start_parameters'] = os.path.join(prev_stage_path,
+                                                      prev_stage_config['parameters'])
+
     # Config file with all the necessary paths to feed into the optimization
     # TODO: clarify how this fits into schema
     model_params_handler.write_opt_config_file(param_write_path,
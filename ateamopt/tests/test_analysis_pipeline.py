@@ -0,0 +1,69 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from ateamopt.analysis.analysis_pipeline import Analysis_Pipeline
+
+
+class TestAnalysisPipeline(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_path = self.path('input.txt')
+        self.write(self.input_path, '3')
+        self.runs = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, filename):
+        return os.path.join(self.tmp_dir, filename)
+
+    @staticmethod
+    def write(path, content):
+        with open(path, 'w') as file_write:
+            file_write.write(content)
+
+    def create_pipeline(self):
+        def count():
+            self.runs.append('count')
+            with open(self.input_path) as file_read:
+                n_models = int(file_read.read())
+            self.write(self.path('count.txt'), str(n_models))
+            for i in range(n_models):
+                self.write(self.path('model_%s.json' % i), str(i))
+
+        def summary():
+            self.runs.append('summary')
+            self.write(self.path('summary.txt'), 'done')
+
+        pipeline = Analysis_Pipeline(self.path('manifest.json'))
+        pipeline.add_node('count', count, outputs=[self.path('count.txt')],
+                          optional_outputs=[self.path('model_*.json')],
+                          input_files=[self.input_path])
+        pipeline.add_node('summary', summary,
+                          outputs=[self.path('summary.txt')],
+                          depends_on=['count'])
+        return pipeline
+
+    def test_rerun_stale(self):
+        self.assertEqual(self.create_pipeline().run(), ['count', 'summary'])
+        self.assertEqual(self.create_pipeline().run(), [])
+
+        # touched but identical input
+        os.utime(self.input_path, (0, 0))
+        self.assertEqual(self.create_pipeline().run(), [])
+
+        # a missing optional output written by the last run
+        os.remove(self.path('model_1.json'))
+        pipeline = self.create_pipeline()
+        self.assertIn('model_1.json', pipeline.stale_nodes()['count'])
+        self.assertEqual(pipeline.run(), ['count', 'summary'])
+        self.assertTrue(os.path.exists(self.path('model_1.json')))
+
+        # the optional outputs of the previous run are removed first
+        self.write(self.input_path, '2')
+        self.assertEqual(self.create_pipeline().run(), ['count', 'summary'])
+        self.assertFalse(os.path.exists(self.path('model_2.json')))
+        self.assertEqual(self.create_pipeline().run(), [])
+        self.assertEqual(self.runs, ['count', 'summary'] * 3)
@@ -0,0 +1,118 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from scipy import stats
+from ateamopt.analysis.batch_stats import signed_rank_test, rank_sum_test,\
+    adjust_pvalues, pad_samples, rank_rows, paired_feature_tests,\
+    group_feature_tests
+
+
+def scipy_wilcoxon(x, y, zero_method, correction, alternative):
+    result = stats.wilcoxon(x, y, zero_method=zero_method,
+                            correction=correction, alternative=alternative,
+                            method='approx')
+    return result.statistic, result.pvalue
+
+
+class TestBatchStats(TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # rounded so that there are ties and zero differences
+        self.x_list = [np.round(rng.randn(n), 1) for n in [12, 25, 40, 9]]
+        self.y_list = [np.round(x_ + rng.randn(len(x_))*0.5 + shift, 1)
+                       for x_, shift in zip(self.x_list, [0, 0.3, -0.2, 1])]
+
+    def test_rank_rows(self):
+        values = pad_samples([[3, 1, 3, 2], [5, 5], [4]])
+        ranks, tie_term = rank_rows(values)
+        for row, ranks_row in zip(values, ranks):
+            valid = ~np.isnan(row)
+            np.testing.assert_array_equal(ranks_row[valid],
+                                          stats.rankdata(row[valid]))
+            self.assertTrue(np.all(np.isnan(ranks_row[~valid])))
+        np.testing.assert_array_equal(tie_term, [6, 6, 0])
+
+    def test_signed_rank_test(self):
+        for zero_method in ['wilcox', 'pratt', 'zsplit']:
+            for correction in [False, True]:
+                for alternative in ['two-sided', 'greater', 'less']:
+                    statistic, pvalue = signed_rank_test(
+                        pad_samples(self.x_list), pad_samples(self.y_list),
+                        zero_method=zero_method, correction=correction,
+                        alternative=alternative)
+                    for ii, (x_, y_) in enumerate(zip(self.x_list,
+                                                      self.y_list)):
+                        expected = scipy_wilcoxon(x_, y_, zero_method,
+                                                  correction, alternative)
+                        self.assertAlmostEqual(statistic[ii], expected[0])
+                        self.assertAlmostEqual(pvalue[ii], expected[1])
+
+    def test_rank_sum_test(self):
+        for correction in [False, True]:
+            for alternative in ['two-sided', 'greater', 'less']:
+                statistic, pvalue = rank_sum_test(
+                    pad_samples(self.x_list), pad_samples(self.y_list),
+                    correction=correction, alternative=alternative)
+                for ii, (x_, y_) in enumerate(zip(self.x_list, self.y_list)):
+                    expected = stats.mannwhitneyu(x_, y_,
+                                                  use_continuity=correction,
+                                                  alternative=alternative,
+                                                  method='asymptotic')
+                    self.assertAlmostEqual(statistic[ii], expected.statistic)
+                    self.assertAlmostEqual(pvalue[ii], expected.pvalue)
+
+    def test_no_test(self):
+        statistic, pvalue = signed_rank_test([[1., 2., np.nan]],
+                                             [[1., 2., 3.]])
+        self.assertTrue(np.isnan(statistic[0]) and np.isnan(pvalue[0]))
+        statistic, pvalue = rank_sum_test([[np.nan, np.nan]], [[1., 2.]])
+        self.assertTrue(np.isnan(statistic[0]) and np.isnan(pvalue[0]))
+
+    def test_adjust_pvalues(self):
+        pvalues = np.array([0.01, 0.04, np.nan, 0.03, 0.2, 0.001])
+        valid = ~np.isnan(pvalues)
+        p = pvalues[valid]
+        m = len(p)
+        order = np.argsort(p)
+        # Benjamini-Hochberg
+        bh = np.minimum.accumulate(
+            (p[order]*m/np.arange(1, m + 1))[::-1])[::-1]
+        expected = np.empty(m)
+        expected[order] = np.minimum(bh, 1)
+        np.testing.assert_allclose(adjust_pvalues(pvalues)[valid], expected)
+        self.assertTrue(np.isnan(adjust_pvalues(pvalues)[2]))
+        np.testing.assert_allclose(
+            adjust_pvalues(pvalues, 'bonferroni')[valid], np.minimum(p*m, 1))
+        holm = np.maximum.accumulate(p[order]*(m - np.arange(m)))
+        expected[order] = np.minimum(holm, 1)
+        np.testing.assert_allclose(adjust_pvalues(pvalues, 'holm')[valid],
+                                   expected)
+        if hasattr(stats, 'false_discovery_control'):
+            np.testing.assert_allclose(adjust_pvalues(pvalues)[valid],
+                                       stats.false_discovery_control(p))
+
+    def test_feature_tables(self):
+        feature_rows = []
+        for ii, (x_, y_) in enumerate(zip(self.x_list, self.y_list)):
+            for jj, (x_val, y_val) in enumerate(zip(x_, y_)):
+                feature_rows.append({'Cell_id': jj,
+                                     'feature': 'feature_%s' % ii,
+                                     'value_exp': x_val, 'value_aa': y_val})
+        feature_df = pd.DataFrame(feature_rows)
+        stat_df = paired_feature_tests(feature_df, 'value_exp',
+                                       {'All-active': 'value_aa'})
+        for ii, (x_, y_) in enumerate(zip(self.x_list, self.y_list)):
+            _, pvalue = scipy_wilcoxon(y_, x_, 'wilcox', False, 'two-sided')
+            self.assertAlmostEqual(stat_df.pvalue[ii], pvalue)
+        np.testing.assert_allclose(stat_df.pvalue_corrected,
+                                   adjust_pvalues(stat_df.pvalue.values))
+
+        x_, y_ = self.x_list[1][:12], self.y_list[1][:12]
+        data = pd.DataFrame({'group': ['a']*12 + ['b']*12,
+                             'feature_0': np.concatenate((x_, y_))})
+        stat_df = group_feature_tests(data, ['feature_0'], 'group')
+        expected = stats.mannwhitneyu(x_, y_, use_continuity=False,
+                                      method='asymptotic')
+        self.assertAlmostEqual(stat_df.statistic[0], expected.statistic)
+        self.assertAlmostEqual(stat_df.pvalue[0], expected.pvalue)
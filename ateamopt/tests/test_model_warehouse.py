@@ -0,0 +1,99 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from ateamopt.utils import utility
+from ateamopt.analysis.model_warehouse import Model_Warehouse,\
+    read_metadata_rows
+
+
+class Counting_Warehouse(Model_Warehouse):
+    # counts the content hashes
+
+    n_hashed = 0
+
+    @staticmethod
+    def _file_hash(file_path):
+        Counting_Warehouse.n_hashed += 1
+        return Model_Warehouse._file_hash(file_path)
+
+
+class TestModelWarehouse(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.warehouse_dir = os.path.join(self.tmp_dir, 'warehouse')
+        self.metadata_files = {}
+        for ii, cell_id in enumerate(['480351780', '483101699', '485184849']):
+            metadata_file = os.path.join(self.tmp_dir, cell_id,
+                                         'cell_metadata_%s.json' % cell_id)
+            utility.create_filepath(metadata_file)
+            utility.save_json(metadata_file, {'Cell_id': cell_id,
+                                              'Dendrite_type': 'spiny',
+                                              'depth': 100.*ii})
+            self.metadata_files[cell_id] = metadata_file
+        Counting_Warehouse.n_hashed = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def ingest(self, cell_ids, **kwargs):
+        warehouse = Counting_Warehouse(self.warehouse_dir, nprocs=1)
+        updated_cells = warehouse.ingest('metadata',
+                                         [self.metadata_files[cell_id]
+                                          for cell_id in cell_ids],
+                                         read_metadata_rows, **kwargs)
+        return warehouse, updated_cells
+
+    def test_incremental_ingest(self):
+        cell_ids = sorted(self.metadata_files)
+        warehouse, updated_cells = self.ingest(cell_ids)
+        self.assertEqual(updated_cells, cell_ids)
+        self.assertEqual(Counting_Warehouse.n_hashed, 3)  # once per file
+        metadata_df = warehouse.read_table('metadata')
+        self.assertEqual(list(metadata_df.Cell_id), cell_ids)
+        self.assertEqual(list(metadata_df.depth), [0, 100, 200])
+
+        # nothing changed, nothing read or hashed
+        _, updated_cells = self.ingest(cell_ids)
+        self.assertEqual(updated_cells, [])
+        self.assertEqual(Counting_Warehouse.n_hashed, 3)
+
+        # touched but same content
+        os.utime(self.metadata_files[cell_ids[0]], (0, 0))
+        _, updated_cells = self.ingest(cell_ids)
+        self.assertEqual(updated_cells, [])
+        self.assertEqual(Counting_Warehouse.n_hashed, 4)
+        _, updated_cells = self.ingest(cell_ids)
+        self.assertEqual(Counting_Warehouse.n_hashed, 4)
+
+        # changed content, hashed once
+        utility.save_json(self.metadata_files[cell_ids[1]],
+                          {'Cell_id': cell_ids[1], 'Dendrite_type': 'aspiny',
+                           'depth': 150.})
+        warehouse, updated_cells = self.ingest(cell_ids)
+        self.assertEqual(updated_cells, [cell_ids[1]])
+        self.assertEqual(Counting_Warehouse.n_hashed, 5)
+        metadata_df = warehouse.read_table('metadata')
+        self.assertEqual(list(metadata_df.Dendrite_type),
+                         ['spiny', 'aspiny', 'spiny'])
+
+    def test_cohorts(self):
+        cell_ids = sorted(self.metadata_files)
+        self.ingest(cell_ids)
+
+        # another cohort in the same table keeps the other cells
+        warehouse, updated_cells = self.ingest(cell_ids[:1])
+        self.assertEqual(updated_cells, [])
+        self.assertEqual(list(warehouse.read_table('metadata').Cell_id),
+                         cell_ids[:1])
+        self.assertEqual(len(warehouse.read_table('metadata',
+                                                  cell_ids=cell_ids)), 3)
+        _, updated_cells = self.ingest(cell_ids)
+        self.assertEqual(updated_cells, [])
+
+        warehouse, _ = self.ingest(cell_ids[:1], prune=True)
+        self.assertEqual(sorted(warehouse.manifest['metadata']['cells']),
+                         cell_ids[:1])
+        self.assertEqual(os.listdir(os.path.join(self.warehouse_dir, 'metadata')),
+                         ['%s.parquet' % cell_ids[0]])
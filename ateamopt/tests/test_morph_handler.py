@@ -0,0 +1,48 @@
+from unittest import TestCase
+import os
+import numpy as np
+from ateamopt.morph_handler import MorphHandler
+
+
+test_data_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'test_data')
+
+
+def loop_segments(swc_rows, reject_axon=True):
+    # (parent, child) row pairs, searching the parent of every row
+    segments = []
+    for child_row, row in enumerate(swc_rows):
+        for parent_row, parent in enumerate(swc_rows):
+            if parent[0] == row[6] and not (reject_axon and parent[1] == 2):
+                segments.append((parent_row, child_row))
+    return sorted(segments)
+
+
+class TestMorphHandler(TestCase):
+
+    def setUp(self):
+        self.morph_path = os.path.join(test_data_path, 'small_morph.swc')
+        self.swc_rows = np.loadtxt(self.morph_path)
+
+    def test_segments(self):
+        morph_handler = MorphHandler(self.morph_path)
+        self.assertEqual(morph_handler.soma_index(), 0)
+        np.testing.assert_array_equal(morph_handler.soma_coord, [0, 0, 0])
+        self.assertEqual(morph_handler.soma_rad, 5)
+
+        # ids out of order, an axon branch and a dangling parent id
+        for reject_axon in [True, False]:
+            parent_rows, child_rows = morph_handler.segments(reject_axon)
+            self.assertEqual(list(zip(parent_rows, child_rows)),
+                             loop_segments(self.swc_rows, reject_axon))
+        parent_rows, child_rows = morph_handler.segments()
+        self.assertNotIn(8, child_rows)
+        self.assertNotIn(9, child_rows)
+
+        seg_start, seg_end, seg_dist, seg_type = \
+            morph_handler.rotated_segments(0, np.array([0, 0, 1]))
+        np.testing.assert_allclose(seg_start, self.swc_rows[parent_rows, 2:5])
+        np.testing.assert_allclose(seg_end, self.swc_rows[child_rows, 2:5])
+        np.testing.assert_allclose(
+            seg_dist, np.linalg.norm(self.swc_rows[child_rows, 2:5], axis=1))
+        np.testing.assert_array_equal(seg_type, self.swc_rows[parent_rows, 1])
@@ -0,0 +1,87 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import bluepyopt.ephys as ephys
+from ateamopt.analysis.analysis_module import calculate_multi_target_scores
+
+
+# Three point soma, read by NEURON's Import3d
+soma_swc = '''1 1 0 0 0 10 -1
+2 1 0 -10 0 10 1
+3 1 0 10 0 10 1
+'''
+
+
+def simulate_hh_soma(morph_path):
+    morph = ephys.morphologies.NrnFileMorphology(morph_path)
+    somatic = ephys.locations.NrnSeclistLocation('somatic',
+                                                 seclist_name='somatic')
+    hh = ephys.mechanisms.NrnMODMechanism(name='hh', suffix='hh',
+                                          locations=[somatic])
+    cm = ephys.parameters.NrnSectionParameter(name='cm', param_name='cm',
+                                              value=1., frozen=True,
+                                              locations=[somatic])
+    cell = ephys.models.CellModel('hh_soma', morph=morph, mechs=[hh],
+                                  params=[cm])
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma', seclist_name='somatic', sec_index=0, comp_x=0.5)
+    stim = ephys.stimuli.NrnSquarePulse(step_amplitude=0.5, step_delay=20,
+                                        step_duration=100, location=soma_loc,
+                                        total_duration=150)
+    rec = ephys.recordings.CompRecording(name='step.soma.v',
+                                         location=soma_loc, variable='v')
+    protocol = ephys.protocols.SweepProtocol('step', [stim], [rec])
+    return protocol.run(cell_model=cell, param_values={},
+                        sim=ephys.simulators.NrnSimulator())
+
+
+def step_feature(efel_feature_name, exp_mean, exp_std, recording='step.soma.v',
+                 **kwargs):
+    return ephys.efeatures.eFELFeature(
+        'step.%s' % efel_feature_name, efel_feature_name=efel_feature_name,
+        recording_names={'': recording}, stim_start=20, stim_end=120,
+        exp_mean=exp_mean, exp_std=exp_std, **kwargs)
+
+
+def fitness_calculator(features):
+    return ephys.objectivescalculators.ObjectivesCalculator(
+        [ephys.objectives.SingletonObjective(feature.name, feature)
+         for feature in features])
+
+
+class TestMultiTargetScores(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        morph_path = os.path.join(self.tmp_dir, 'soma.swc')
+        with open(morph_path, 'w') as swc_file:
+            swc_file.write(soma_swc)
+        self.response = simulate_hh_soma(morph_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_scores_match_fitness_calculator(self):
+        train = [step_feature('Spikecount', 12, 2),
+                 step_feature('AP_amplitude', 80, 5, force_max_score=True,
+                              max_score=4)]
+        test = [step_feature('mean_frequency', 60, 10),
+                # not recorded, scored with its own max_score
+                step_feature('voltage_base', -70, 2,
+                             recording='missing.soma.v', max_score=50)]
+        targets = OrderedDict([('train', train), ('all', train + test),
+                               ('test', test)])
+
+        obj_dicts, feature_dict = calculate_multi_target_scores(
+            [self.response], targets)
+        for target_name, features in targets.items():
+            expected = fitness_calculator(features).calculate_scores(
+                self.response)
+            self.assertEqual(sorted(expected), sorted(obj_dicts[target_name]))
+            for feature_name, score in expected.items():
+                self.assertAlmostEqual(score, obj_dicts[target_name][feature_name])
+        self.assertEqual(obj_dicts['test']['step.voltage_base'], 50)
+        self.assertIsNone(feature_dict['step.voltage_base'])
+        self.assertGreater(feature_dict['step.Spikecount'], 0)
@@ -0,0 +1,478 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import bluepyopt as bpopt
+import bluepyopt.ephys as ephys
+from bluepyopt.deapext.optimisations import WSListIndividual
+from bluepyopt.evaluators import Evaluator
+from bluepyopt.objectives import Objective
+from bluepyopt.parameters import Parameter
+import deap.tools
+from ateamopt.optim_algorithms import Island, Island_Optimizer,\
+    Stopping_Controller, Surrogate_Screener, Response_Capture,\
+    evaluate_with_responses, response_capture_path, load_warm_start_params
+from ateamopt.utils import utility
+from ateamopt.tests.test_multi_target_scores import soma_swc, step_feature,\
+    fitness_calculator
+
+
+class Sphere_Evaluator(Evaluator):
+    # Two objectives on four bounded parameters, cheap and deterministic
+
+    def __init__(self):
+        params = [Parameter('p%s' % i, bounds=[-1., 1.]) for i in range(4)]
+        objectives = [Objective('sphere'), Objective('offset')]
+        super(Sphere_Evaluator, self).__init__(objectives, params)
+        self.param_names = [param.name for param in params]
+
+    def evaluate_with_lists(self, param_list):
+        param_arr = np.array(param_list)
+        return [float(np.sum(param_arr**2)), float(abs(param_arr[0] - 0.5))]
+
+    def init_simulator_and_evaluate_with_lists(self, param_list, *args,
+                                               **kwargs):
+        # evaluation entry point of the newer bluepyopt releases
+        return self.evaluate_with_lists(param_list)
+
+
+class Test_Island_Equivalence(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)  # Island writes logbook_info.txt here
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_single_island_matches_bluepyopt(self):
+        # With every option off the island loop has to reproduce
+        # eaAlphaMuPlusLambdaCheckpoint generation by generation
+        seed, max_ngen, offspring_size = 3, 6, 8
+
+        opt_bpopt = bpopt.optimisations.DEAPOptimisation(
+            evaluator=Sphere_Evaluator(), seed=seed)
+        cp_bpopt = os.path.join(self.tmp_dir, 'bpopt', 'seed%s.pkl' % seed)
+        utility.create_filepath(cp_bpopt)
+        _, hof_bpopt, log_bpopt, _ = opt_bpopt.run(max_ngen=max_ngen,
+                                                   offspring_size=offspring_size,
+                                                   cp_filename=cp_bpopt)
+
+        opt_island = bpopt.optimisations.DEAPOptimisation(
+            evaluator=Sphere_Evaluator(), seed=seed)
+        cp_island = os.path.join(self.tmp_dir, 'island', 'seed%s.pkl' % seed)
+        utility.create_filepath(cp_island)
+        island = Island(opt_island, seed, cp_island)
+        hof_island = Island_Optimizer([island]).run(
+            max_ngen=max_ngen, offspring_size=offspring_size)[0]
+
+        self.assertEqual(len(log_bpopt), len(island.logbook))
+        for record_bpopt, record_island in zip(log_bpopt, island.logbook):
+            for key in ['gen', 'nevals']:
+                self.assertEqual(record_bpopt[key], record_island[key])
+            for key in ['avg', 'std', 'min', 'max']:
+                self.assertAlmostEqual(record_bpopt[key], record_island[key])
+
+        self.assertEqual([list(ind) for ind in hof_bpopt],
+                         [list(ind) for ind in hof_island])
+
+        cp_expected = utility.load_pickle(cp_bpopt)
+        cp = utility.load_pickle(cp_island)
+        self.assertEqual(cp_expected['generation'], cp['generation'])
+        for key in ['population', 'parents', 'halloffame']:
+            self.assertEqual([list(ind) for ind in cp_expected[key]],
+                             [list(ind) for ind in cp[key]])
+        self.assertEqual(cp_expected['rndstate'], cp['rndstate'])
+
+    def test_warm_start_params(self):
+        seed = 1
+        opt = bpopt.optimisations.DEAPOptimisation(
+            evaluator=Sphere_Evaluator(), seed=seed)
+        cp_file = os.path.join(self.tmp_dir, 'seed%s.pkl' % seed)
+        island = Island(opt, seed, cp_file)
+        Island_Optimizer([island]).run(max_ngen=3, offspring_size=6)
+
+        # global, section and distributed parameters of the two stages
+        prev_params = [{'param_name': 'v_init', 'type': 'global',
+                        'bounds': [-1, 1]},
+                       {'param_name': 'g_pas', 'type': 'section',
+                        'sectionlist': 'all', 'dist_type': 'uniform',
+                        'bounds': [-1, 1]},
+                       {'param_name': 'gbar_Ih', 'type': 'range',
+                        'sectionlist': 'apical', 'dist_type': 'uniform',
+                        'bounds': [-1, 1]},
+                       {'param_name': 'celsius', 'type': 'global', 'value': 34},
+                       {'param_name': 'e_pas', 'type': 'section',
+                        'sectionlist': 'all', 'dist_type': 'uniform',
+                        'bounds': [-1, 1]}]
+        params = [{'param_name': 'e_pas', 'type': 'section',
+                   'sectionlist': 'all', 'dist_type': 'uniform',
+                   'bounds': [0, 0.5]},
+                  {'param_name': 'gbar_Ih', 'type': 'range',
+                   'sectionlist': 'apical', 'dist_type': 'exp',
+                   'dist': '(-0.8696 + 2.087*math.exp(({distance})*0.0031))*{value}',
+                   'bounds': [-1, 1]},
+                  {'param_name': 'v_init', 'type': 'global',
+                   'bounds': [-1, 1]},
+                  {'param_name': 'gbar_NaTs', 'type': 'section',
+                   'sectionlist': 'somatic', 'dist_type': 'uniform',
+                   'bounds': [-1, 1]}]
+        prev_param_path = os.path.join(self.tmp_dir, 'prev_parameters.json')
+        param_path = os.path.join(self.tmp_dir, 'parameters.json')
+        utility.save_json(prev_param_path, prev_params)
+        utility.save_json(param_path, params)
+
+        warm_start_params = load_warm_start_params([cp_file], prev_param_path,
+                                                   param_path)
+        hof_best = list(island.halloffame[0])
+        self.assertEqual(warm_start_params[0],
+                         [float(np.clip(hof_best[3], 0, 0.5)), None,
+                          hof_best[0], None])
+        parents = set(tuple(ind) for ind in island.parents) | \
+            set(tuple(ind) for ind in island.halloffame)
+        self.assertEqual(len(warm_start_params), len(parents))
+        self.assertIn('parents', utility.load_cp_summary(cp_file))
+
+    def run_screened(self, screener, seed=2, max_ngen=8, offspring_size=10):
+        opt = bpopt.optimisations.DEAPOptimisation(
+            evaluator=Sphere_Evaluator(), seed=seed)
+        cp_file = os.path.join(self.tmp_dir, 'screened', 'seed%s.pkl' % seed)
+        if os.path.exists(cp_file):
+            os.remove(cp_file)
+        utility.create_filepath(cp_file)
+        island = Island(opt, seed, cp_file, screener=screener)
+        Island_Optimizer([island]).run(max_ngen=max_ngen,
+                                       offspring_size=offspring_size)
+        return island
+
+    def test_surrogate_screening(self):
+        offspring_size = 10
+        screener = Surrogate_Screener(min_samples=20, max_samples=30,
+                                      quantile=0.5, exploration_fraction=0.2,
+                                      log_file='surrogate_info.txt')
+        island = self.run_screened(screener, offspring_size=offspring_size)
+
+        # only the offspring predicted to be competitive are simulated
+        nevals = island.logbook.select('nevals')[1:]
+        self.assertTrue(all(n <= offspring_size for n in nevals))
+        self.assertLess(sum(nevals), 0.75*offspring_size*len(nevals))
+        self.assertTrue(os.path.exists('surrogate_info.txt'))
+
+        # clones of unchanged parents count once in the fitting data
+        screener.max_samples = 10000
+        unique_vectors = set(tuple(ind) for ind in
+                             island.history.genealogy_history.values())
+        regressor = screener.fit(island.history)
+        self.assertEqual(regressor.estimators_samples_[0].shape[0],
+                         len(unique_vectors))
+
+    def test_surrogate_refill(self):
+        offspring_size = 10
+        screener = Surrogate_Screener(min_samples=20, max_samples=30,
+                                      quantile=0.25, exploration_fraction=0.,
+                                      refill=True, log_file=None)
+        island = self.run_screened(screener, offspring_size=offspring_size)
+
+        # the screened out offspring are replaced, not dropped
+        self.assertEqual(island.logbook.select('nevals')[1:],
+                         [offspring_size]*7)
+        self.assertEqual(len(island.population), 2*offspring_size)
+
+    def create_islands(self, seeds, map_function=None):
+        islands = []
+        for seed in seeds:
+            opt = bpopt.optimisations.DEAPOptimisation(
+                evaluator=Sphere_Evaluator(), seed=seed,
+                map_function=map_function)
+            cp_file = os.path.join(self.tmp_dir, 'seed%s.pkl' % seed)
+            islands.append(Island(opt, seed, cp_file))
+        return islands
+
+    def test_island_model(self):
+        seeds, max_ngen, offspring_size = [1, 2, 3], 4, 8
+        batch_sizes = []
+
+        def recording_map(func, inds):
+            inds = list(inds)
+            batch_sizes.append(len(inds))
+            return list(map(func, inds))
+
+        class Recording_Optimizer(Island_Optimizer):
+            def migrate(self, islands):
+                self.migrants = [[list(ind) for ind in
+                                  island.elites(self.migration_size)]
+                                 for island in islands]
+                self.n_migrations = getattr(self, 'n_migrations', 0) + 1
+                super(Recording_Optimizer, self).migrate(islands)
+
+        islands = self.create_islands(seeds, recording_map)
+        island_opt = Recording_Optimizer(islands, migration_interval=2,
+                                         migration_size=2)
+        island_opt.run(max_ngen=max_ngen, offspring_size=offspring_size)
+
+        # the offspring of all islands are evaluated in one batch
+        self.assertEqual(len(batch_sizes), max_ngen)
+        for gen, batch_size in enumerate(batch_sizes):
+            self.assertEqual(batch_size, sum(island.logbook[gen]['nevals']
+                                             for island in islands))
+
+        # the elites move along the ring of islands at every interval
+        self.assertEqual(island_opt.n_migrations, max_ngen // 2)
+        for i, island in enumerate(islands):
+            parents = [list(ind) for ind in island.parents]
+            self.assertEqual(len(parents), offspring_size)
+            for migrant in island_opt.migrants[i - 1]:
+                self.assertIn(migrant, parents)
+
+        # the per seed checkpoints continue with bluepyopt's GA loop
+        for island in islands:
+            cp = utility.load_pickle(island.cp_filename)
+            self.assertEqual(cp['generation'], max_ngen)
+            opt = bpopt.optimisations.DEAPOptimisation(
+                evaluator=Sphere_Evaluator(), seed=island.seed)
+            _, _, logbook, _ = opt.run(max_ngen=max_ngen + 2,
+                                       offspring_size=offspring_size,
+                                       continue_cp=True,
+                                       cp_filename=island.cp_filename)
+            self.assertEqual(logbook.select('gen'),
+                             list(range(1, max_ngen + 3)))
+
+    def test_island_resume(self):
+        seeds, offspring_size = [1, 2], 8
+        island_opt = Island_Optimizer(self.create_islands(seeds),
+                                      migration_interval=2)
+        hofs_expected = island_opt.run(max_ngen=6,
+                                       offspring_size=offspring_size)
+        parents_expected = [[list(ind) for ind in island.parents]
+                            for island in island_opt.islands]
+        for seed in seeds:
+            os.remove(os.path.join(self.tmp_dir, 'seed%s.pkl' % seed))
+
+        # stop at generation 3 and continue from the checkpoints
+        Island_Optimizer(self.create_islands(seeds),
+                         migration_interval=2).run(
+            max_ngen=3, offspring_size=offspring_size)
+        island_opt = Island_Optimizer(self.create_islands(seeds),
+                                      migration_interval=2)
+        hofs = island_opt.run(max_ngen=6, offspring_size=offspring_size)
+
+        for island, parents in zip(island_opt.islands, parents_expected):
+            self.assertEqual(island.generation, 6)
+            self.assertEqual([list(ind) for ind in island.parents], parents)
+        for hof, hof_expected in zip(hofs, hofs_expected):
+            self.assertEqual([list(ind) for ind in hof],
+                             [list(ind) for ind in hof_expected])
+
+
+class Stub_Island(object):
+    # what the stopping controller reads of an island
+
+    def __init__(self, mins=(), medians=(), elapsed_time=0., parents=()):
+        self.logbook = deap.tools.Logbook()
+        for gen, min_ in enumerate(mins):
+            self.logbook.record(gen=gen + 1, min=min_)
+        self.median_history = list(medians)
+        self.elapsed_time = elapsed_time
+        self.parents = [list(ind) for ind in parents]
+        self.opt = bpopt.optimisations.DEAPOptimisation(
+            evaluator=Sphere_Evaluator())
+
+
+class Test_Stopping_Controller(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        self.parents = np.random.RandomState(0).uniform(-1, 1, (10, 4))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stall(self):
+        controller = Stopping_Controller(stall_window=3, stall_tolerance=0.01)
+        improving = [10., 8., 6., 4., 2., 1.]
+        stalled = [10., 8., 6., 5.99, 5.98, 5.97]
+        self.assertIsNone(controller.check(Stub_Island(stalled[:3],
+                                                       stalled[:3])))
+        self.assertIsNone(controller.check(Stub_Island(improving,
+                                                       improving)))
+        # both the best and the median fitness have to stall
+        self.assertIsNone(controller.check(Stub_Island(stalled, improving)))
+        self.assertIsNone(controller.check(Stub_Island(improving, stalled)))
+        self.assertIn('stalled for 3 generations', controller.check(
+            Stub_Island(stalled, stalled)))
+
+    def test_spread(self):
+        controller = Stopping_Controller(spread_tolerance=0.05)
+        self.assertIsNone(controller.check(
+            Stub_Island(parents=self.parents)))
+        # bounds are [-1, 1], a standard deviation of 0.02 is 1% of them
+        collapsed = 0.3 + 0.02*self.parents
+        reason = controller.check(Stub_Island(parents=collapsed))
+        self.assertIn('parameter spread collapsed', reason)
+        spread = Stopping_Controller.parameter_spread(
+            Stub_Island(parents=collapsed))
+        self.assertAlmostEqual(spread, np.max(np.std(collapsed, axis=0))/2)
+
+    def test_time_budget(self):
+        controller = Stopping_Controller(time_budget=60)
+        self.assertIsNone(controller.check(
+            Stub_Island(elapsed_time=59., parents=self.parents)))
+        self.assertIn('wall-clock budget of 60 s', controller.check(
+            Stub_Island(elapsed_time=61., parents=self.parents)))
+
+    def run_islands(self, max_ngen, controller):
+        opt = bpopt.optimisations.DEAPOptimisation(
+            evaluator=Sphere_Evaluator(), seed=1)
+        island = Island(opt, 1, os.path.join(self.tmp_dir, 'seed1.pkl'))
+        Island_Optimizer([island], stopping_controller=controller).run(
+            max_ngen=max_ngen, offspring_size=6)
+        return island
+
+    def test_stop_reason(self):
+        # tolerance of 100% of the fitness, stalled after the first window
+        controller = Stopping_Controller(stall_window=2, stall_tolerance=1.)
+        island = self.run_islands(10, controller)
+        self.assertEqual(island.generation, 3)
+        self.assertIn('stalled', island.logbook[-1]['stop_reason'])
+        cp = utility.load_pickle(island.cp_filename)
+        self.assertEqual(cp['stop_reason'], island.stop_reason)
+        self.assertEqual(cp['logbook'][-1]['stop_reason'],
+                         island.stop_reason)
+
+        # stays stopped when resumed with the same budget
+        island = self.run_islands(10, controller)
+        self.assertEqual(island.generation, 3)
+        self.assertTrue(island.stop_reason)
+
+        # a new budget continues the run
+        island = self.run_islands(10, Stopping_Controller(time_budget=3600))
+        self.assertEqual(island.generation, 10)
+        self.assertIsNone(island.stop_reason)
+        self.assertNotIn('stop_reason', utility.load_pickle(island.cp_filename))
+
+
+def hh_evaluator(morph_path):
+    # HH soma with a free sodium conductance and two step protocols
+    morph = ephys.morphologies.NrnFileMorphology(morph_path)
+    somatic = ephys.locations.NrnSeclistLocation('somatic',
+                                                 seclist_name='somatic')
+    hh = ephys.mechanisms.NrnMODMechanism(name='hh', suffix='hh',
+                                          locations=[somatic])
+    gnabar = ephys.parameters.NrnSectionParameter(
+        name='gnabar_hh', param_name='gnabar_hh', bounds=[0.05, 0.2],
+        locations=[somatic])
+    cell = ephys.models.CellModel('hh_soma', morph=morph, mechs=[hh],
+                                  params=[gnabar])
+    soma_loc = ephys.locations.NrnSeclistCompLocation(
+        name='soma', seclist_name='somatic', sec_index=0, comp_x=0.5)
+    protocols = OrderedDict()
+    for protocol_name, amp in [('step', 0.5), ('weak', 0.2)]:
+        stim = ephys.stimuli.NrnSquarePulse(
+            step_amplitude=amp, step_delay=20, step_duration=100,
+            location=soma_loc, total_duration=150)
+        rec = ephys.recordings.CompRecording(
+            name='%s.soma.v' % protocol_name, location=soma_loc, variable='v')
+        protocols[protocol_name] = ephys.protocols.SweepProtocol(
+            protocol_name, [stim], [rec])
+    features = [step_feature('Spikecount', 12, 2),
+                step_feature('Spikecount', 5, 2, recording='weak.soma.v')]
+    return ephys.evaluators.CellEvaluator(
+        cell_model=cell, param_names=['gnabar_hh'],
+        fitness_protocols=protocols,
+        fitness_calculator=fitness_calculator(features),
+        isolate_protocols=False, sim=ephys.simulators.NrnSimulator())
+
+
+class Test_Response_Capture(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        morph_path = os.path.join(self.tmp_dir, 'soma.swc')
+        with open(morph_path, 'w') as swc_file:
+            swc_file.write(soma_swc)
+        self.evaluator = hh_evaluator(morph_path)
+        self.opt = bpopt.optimisations.DEAPOptimisation(
+            evaluator=self.evaluator)
+        self.capture_dir = os.path.join(self.tmp_dir, 'hof_responses')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_capture_evaluates_with_toolbox(self):
+        evaluations = []
+
+        def evaluate(param_list):
+            evaluations.append(param_list)
+            return self.opt.toolbox.evaluate(param_list)
+
+        capture = Response_Capture(self.evaluator, evaluate, self.capture_dir)
+        capture.threshold = np.inf
+        obj_list = capture([0.12])
+        self.assertEqual(evaluations, [[0.12]])
+        self.assertEqual(obj_list, self.evaluator.evaluate_with_lists([0.12]))
+        self.assertNotIn('run_protocols', vars(self.evaluator))
+
+        responses = utility.load_pickle(response_capture_path(
+            self.capture_dir, [0.12]))[0]
+        self.assertEqual(sorted(responses), ['step.soma.v', 'weak.soma.v'])
+        expected = self.evaluator.run_protocols(
+            self.evaluator.fitness_protocols.values(),
+            self.evaluator.param_dict([0.12]))
+        for name, recording in expected.items():
+            np.testing.assert_allclose(responses[name]['voltage'],
+                                       recording['voltage'])
+
+        # only the protocols asked for, without scoring them
+        result, responses = evaluate_with_responses(
+            self.evaluator, self.opt.toolbox.evaluate, [0.12],
+            protocol_names=['weak'])
+        self.assertIsNone(result)
+        self.assertEqual(list(responses), ['weak.soma.v'])
+        self.assertEqual(list(self.evaluator.fitness_protocols),
+                         ['step', 'weak'])
+        np.testing.assert_allclose(responses['weak.soma.v']['voltage'],
+                                   expected['weak.soma.v']['voltage'])
+
+    def test_threshold_and_prune(self):
+        capture = Response_Capture(self.evaluator, self.opt.toolbox.evaluate,
+                                   self.capture_dir)
+        halloffame = deap.tools.HallOfFame(2)
+        inds = [WSListIndividual([value], obj_size=2)
+                for value in [0.06, 0.12, 0.18]]
+
+        # nothing is written while the hall of fame fills up
+        capture.update_threshold([halloffame])
+        for ind in inds:
+            ind.fitness.values = capture(list(ind))
+        capture.record(inds)
+        self.assertEqual(os.listdir(self.capture_dir), [])
+
+        halloffame.update(inds)
+        capture.update_threshold([halloffame])
+        self.assertEqual(capture.threshold, halloffame[-1].fitness.sum)
+        for ind in inds:
+            capture(list(ind))
+        capture.record(inds)
+        capture_paths = set(os.path.join(self.capture_dir, capture_file)
+                            for capture_file in os.listdir(self.capture_dir))
+        self.assertEqual(capture_paths, set(
+            response_capture_path(self.capture_dir, ind) for ind in inds
+            if ind.fitness.sum <= capture.threshold))
+        for ind in halloffame:
+            self.assertIn(response_capture_path(self.capture_dir, ind),
+                          capture_paths)
+        capture.prune([halloffame])
+        self.assertEqual(len(os.listdir(self.capture_dir)), len(halloffame))
+
+        # only the responses written by the hook are pruned
+        other_path = os.path.join(self.capture_dir, 'other.pkl')
+        utility.save_pickle(other_path, [])
+        capture.prune([deap.tools.HallOfFame(2)])
+        self.assertEqual(os.listdir(self.capture_dir), ['other.pkl'])
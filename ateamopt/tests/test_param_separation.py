@@ -0,0 +1,44 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from ateamopt.analysis.allactive_classification import Allactive_Classification
+
+
+def hof_param_table(seed=0, n_cells=6, n_models=8):
+    rng = np.random.RandomState(seed)
+    param_rows = []
+    for cell_idx in range(n_cells):
+        cell_id = str(480000000 + 7919*cell_idx)
+        scale = rng.uniform(0.5, 2, 4)
+        # hall of fame rows of a cell shuffled, as read from the files
+        for hof_index in rng.permutation(n_models):
+            param_rows.append({'Cell_id': cell_id, 'hof_index': hof_index,
+                               'gbar_NaTs2_t.somatic': scale[0]*rng.uniform(0.5, 1.5),
+                               'gbar_Ih.apical': scale[1]*rng.uniform(0.5, 1.5),
+                               'e_pas.all': -scale[2]*rng.uniform(60, 80),
+                               # constant within every other cell
+                               'g_pas.all': scale[3]*(1 if cell_idx % 2
+                                                      else rng.uniform(0.5, 1.5)),
+                               # missing for a cell, left out altogether
+                               'gbar_Im.axonal': np.nan if cell_idx == 3
+                               else rng.uniform(0, 1)})
+    return pd.DataFrame(param_rows)
+
+
+class TestParamSeparation(TestCase):
+
+    def test_matches_calc_param_dist(self):
+        hof_param_df = hof_param_table()
+        aa_clf = Allactive_Classification()
+        param_dist_list = aa_clf.calc_param_separation(hof_param_df)
+
+        # per cell, as calc_param_separation used to do it
+        hof_param_df = hof_param_df.dropna(how='any', axis=1)
+        cell_ids = hof_param_df.Cell_id.unique()
+        expected_list = [Allactive_Classification.calc_param_dist(
+            hof_param_df.loc[hof_param_df.Cell_id == cell_id, ])
+            for cell_id in cell_ids]
+
+        self.assertEqual(len(param_dist_list), len(cell_ids))
+        for param_dist, expected in zip(param_dist_list, expected_list):
+            np.testing.assert_allclose(param_dist, expected, rtol=1e-12)
@@ -0,0 +1,55 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from ateamopt.analysis.report import Report_Builder
+
+
+def plot_pages(title, n_pages, pdf_pages, cache_path=None):
+    for page in range(n_pages):
+        fig, ax = plt.subplots()
+        ax.set_title('%s %s' % (title, page))
+        pdf_pages.savefig(fig)
+        plt.close(fig)
+    if cache_path:
+        with open(cache_path, 'w') as cache_file:
+            cache_file.write(title)
+    return pdf_pages
+
+
+def plot_cached(cache_path, pdf_pages):
+    with open(cache_path) as cache_file:
+        return plot_pages(cache_file.read(), 1, pdf_pages)
+
+
+class TestReportBuilder(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_render(self):
+        from pypdf import PdfReader
+        report_path = os.path.join(self.tmp_dir, 'report.pdf')
+        cache_path = os.path.join(self.tmp_dir, 'cache.txt')
+        report = Report_Builder(report_path, nprocs=2)
+        cached = report.add_section(plot_pages, 'first', 2,
+                                    cache_path=cache_path)
+        report.add_section(plot_pages, 'empty', 0)
+        report.add_section(plot_cached, cache_path, depends_on=[cached])
+        report.add_section(plot_pages, 'parent', 1, in_parent=True)
+        report.render()
+
+        # the sections in the order they were added, the empty one dropped
+        page_text = [page.extract_text() for page in
+                     PdfReader(report_path).pages]
+        self.assertEqual(len(page_text), 4)
+        for text, title in zip(page_text, ['first 0', 'first 1', 'first 0',
+                                           'parent 0']):
+            self.assertIn(title, text)
+        self.assertFalse(os.path.exists(report.section_dir))
@@ -0,0 +1,45 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from ateamopt.analysis.response_store import Response_Store, load_response
+from ateamopt.utils import utility
+
+
+def model_response(scale):
+    time = np.arange(0, 10, 0.5)
+    return {'%s.soma.v' % stim: pd.DataFrame({'time': time,
+                                              'voltage': scale*np.sin(time)})
+            for stim in ['LongDC_1', 'Noise_1']}
+
+
+class TestResponseStore(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_response(self):
+        store_dir = os.path.join(self.tmp_dir, 'store')
+        store = Response_Store(store_dir)
+        store.add_responses([[model_response(scale)] for scale in [1, 2, 3]])
+        store.reorder([2, 0, 1])
+
+        # the first model of the sorted store, as the pickled best response
+        resp_path = os.path.join(self.tmp_dir, 'resp_opt.txt')
+        utility.save_pickle(resp_path, [model_response(3)])
+        for response in [load_response(store_dir), load_response(resp_path)]:
+            self.assertEqual(sorted(response.keys()),
+                             ['LongDC_1.soma.v', 'Noise_1.soma.v'])
+            for name, recording in model_response(3).items():
+                np.testing.assert_allclose(response[name]['voltage'].values,
+                                           recording['voltage'].values)
+
+        response = load_response(store_dir, lambda name: 'Noise' in name)
+        self.assertEqual(list(response.keys()), ['Noise_1.soma.v'])
+        response = load_response(store_dir, ['LongDC_1.soma.v'])
+        self.assertEqual(list(response.keys()), ['LongDC_1.soma.v'])
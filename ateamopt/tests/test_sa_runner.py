@@ -0,0 +1,87 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+from ateamopt.utils import utility
+from ateamopt.analysis.sa_runner import SA_Runner
+from ateamopt.analysis.sa_sample_store import SA_Sample_Store
+from ateamopt.tests.test_multi_target_scores import soma_swc
+
+
+def hh_model_config(model_dir, param_name='gnabar_hh'):
+    # Bpopt_Evaluator files of a HH soma with one free parameter
+    utility.create_dirpath(model_dir)
+    paths = {key: os.path.join(model_dir, '%s.json' % key)
+             for key in ['protocols', 'features', 'parameters', 'mechanism']}
+    utility.save_json(paths['protocols'], {
+        'step': {'stimuli': [{'type': 'SquarePulse', 'amp': 0.5, 'delay': 20,
+                              'duration': 100, 'stim_end': 120,
+                              'totduration': 150}]}})
+    utility.save_json(paths['features'], {
+        'step': {'soma': {'Spikecount': [12, 2]}}})
+    utility.save_json(paths['parameters'], [
+        {'param_name': param_name, 'bounds': [0.05, 0.2],
+         'dist_type': 'uniform', 'type': 'section',
+         'sectionlist': 'somatic'}])
+    utility.save_json(paths['mechanism'], {'somatic': ['hh']})
+    morph_path = os.path.join(model_dir, 'soma.swc')
+    with open(morph_path, 'w') as swc_file:
+        swc_file.write(soma_swc)
+    return {'protocol_path': paths['protocols'],
+            'feature_path': paths['features'],
+            'morph_path': morph_path,
+            'param_path': paths['parameters'],
+            'mech_path': paths['mechanism'],
+            'optim_param': {'%s.somatic' % param_name: 0.12}}
+
+
+class TestSARunner(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.model_config = hh_model_config(os.path.join(self.tmp_dir, 'hh'))
+        self.samples = np.array([[0.06], [0.1], [0.15], [0.2]])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_run(self):
+        sa_runner = SA_Runner({'hh': self.model_config}, ['step'],
+                              ['Spikecount', 'voltage_base'], nprocs=2)
+        sample_store = SA_Sample_Store(os.path.join(self.tmp_dir, 'store'))
+        model_features = sa_runner.run(
+            {'hh': (['gnabar_hh.somatic'], self.samples)},
+            sample_store=sample_store)
+
+        features = model_features['hh']
+        self.assertEqual(features.shape, (4, 2))
+        self.assertFalse(np.any(np.isnan(features)))
+        self.assertTrue(np.all(features[:, 0] > 0))
+        outputs, done = sample_store.load_results('hh')
+        self.assertTrue(np.all(done))
+        np.testing.assert_array_equal(outputs, features)
+
+    def test_failed_samples(self):
+        # the samples of the second model set a parameter it does not have
+        model_configs = {'hh': self.model_config,
+                         'broken': hh_model_config(
+                             os.path.join(self.tmp_dir, 'broken'))}
+        sa_runner = SA_Runner(model_configs, ['step'], ['Spikecount'],
+                              nprocs=2)
+        model_samples = {'hh': (['gnabar_hh.somatic'], self.samples),
+                         'broken': (['gkbar_hh.somatic'], self.samples)}
+        sample_store = SA_Sample_Store(os.path.join(self.tmp_dir, 'store'))
+        with self.assertLogs('ateamopt.analysis.sa_runner', 'WARNING') as logs:
+            model_features = sa_runner.run(model_samples,
+                                           sample_store=sample_store)
+        self.assertIn('4 of 4 samples of broken failed', '\n'.join(logs.output))
+        self.assertTrue(np.all(np.isnan(model_features['broken'])))
+        self.assertFalse(np.any(np.isnan(model_features['hh'])))
+        # the failed samples are not stored as done, a resumed run retries them
+        self.assertEqual(len(sample_store.pending_samples('hh')), 0)
+        np.testing.assert_array_equal(sample_store.pending_samples('broken'),
+                                      range(4))
+
+        with self.assertRaises(Exception):
+            sa_runner.run({'broken': model_samples['broken']})
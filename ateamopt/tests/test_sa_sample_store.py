@@ -0,0 +1,81 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import numpy as np
+from ateamopt.analysis.sa_sample_store import SA_Sample_Store
+
+
+class TestSASampleStore(TestCase):
+
+    def setUp(self):
+        self.store_dir = os.path.join(tempfile.mkdtemp(), 'sa_store')
+        rng = np.random.RandomState(0)
+        self.param_names = ['gbar_NaV', 'gbar_Kv3_1', 'g_pas']
+        self.output_names = [('LongDC_55', 'Spikecount'),
+                             ('LongDC_55', 'AP_width')]
+        self.samples = rng.rand(12, 3)
+        self.outputs = rng.rand(12, 2)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.store_dir))
+
+    def create_store(self):
+        store = SA_Sample_Store(self.store_dir)
+        store.create_model('allactive', self.param_names, self.samples,
+                           self.output_names, design={'method': 'saltelli'})
+        return store
+
+    def test_resume(self):
+        store = self.create_store()
+        done_first = [3, 0, 7, 4, 5, 6]
+        for sample_idx in done_first:
+            store.append('allactive', sample_idx, self.outputs[sample_idx])
+        store.close()
+
+        # a new run on the same directory picks up where the first stopped
+        store = self.create_store()
+        self.assertEqual(store.output_names('allactive'), self.output_names)
+        np.testing.assert_array_equal(store.pending_samples('allactive'),
+                                      [1, 2, 8, 9, 10, 11])
+        outputs, done = store.load_results('allactive')
+        np.testing.assert_array_equal(outputs[done], self.outputs[done])
+        self.assertTrue(np.all(np.isnan(outputs[~done])))
+        # only the second block of 4 samples (4..7) is complete
+        np.testing.assert_array_equal(store.complete_blocks('allactive', 4),
+                                      self.outputs[4:8])
+
+        for sample_idx in store.pending_samples('allactive'):
+            store.append('allactive', sample_idx, self.outputs[sample_idx])
+        store.close()
+        outputs, done = SA_Sample_Store(self.store_dir).load_results('allactive')
+        self.assertTrue(np.all(done))
+        np.testing.assert_array_equal(outputs, self.outputs)
+
+    def test_truncated_record(self):
+        store = self.create_store()
+        for sample_idx in range(3):
+            store.append('allactive', sample_idx, self.outputs[sample_idx])
+        store.close()
+        # the run is killed while writing the record of sample 3
+        results_path = os.path.join(self.store_dir, 'allactive_results.bin')
+        record = np.concatenate(([3], self.outputs[3]))
+        with open(results_path, 'ab') as result_file:
+            result_file.write(record.tobytes()[:13])
+
+        store = self.create_store()
+        np.testing.assert_array_equal(store.pending_samples('allactive'),
+                                      np.arange(3, 12))
+        store.append('allactive', 3, self.outputs[3])
+        store.close()
+        self.assertEqual(os.path.getsize(results_path), 4*3*8)
+        outputs, done = store.load_results('allactive')
+        np.testing.assert_array_equal(done, np.arange(12) < 4)
+        np.testing.assert_array_equal(outputs[:4], self.outputs[:4])
+
+    def test_different_design(self):
+        self.create_store()
+        store = SA_Sample_Store(self.store_dir)
+        with self.assertRaises(Exception):
+            store.create_model('allactive', self.param_names,
+                               self.samples[::-1], self.output_names)
@@ -0,0 +1,94 @@
+from unittest import TestCase
+import numpy as np
+from ateamopt.analysis.sensitivity_estimators import saltelli_sample,\
+    saltelli_sample_size, sobol_indices, morris_sample,\
+    morris_elementary_effects, rank_parameters
+
+
+def ishigami(X, a=7., b=0.1):
+    return np.sin(X[:, 0]) + a*np.sin(X[:, 1])**2 + \
+        b*X[:, 2]**4*np.sin(X[:, 0])
+
+
+def ishigami_indices(a=7., b=0.1):
+    # Analytical first and total order indices
+    V1 = 0.5*(1 + b*np.pi**4/5)**2
+    V2 = a**2/8.
+    V13 = b**2*np.pi**8*(1/18. - 1/50.)
+    V = V1 + V2 + V13
+    return np.array([V1, V2, 0])/V, np.array([V1 + V13, V2, V13])/V
+
+
+class TestSobolIndices(TestCase):
+
+    def setUp(self):
+        self.bounds = [[-np.pi, np.pi]]*3
+
+    def test_saltelli_sample(self):
+        n_base = 8
+        X = saltelli_sample(self.bounds, n_base)
+        self.assertEqual(X.shape, (saltelli_sample_size(3, n_base), 3))
+        self.assertTrue(np.all((X >= -np.pi) & (X <= np.pi)))
+        blocks = X.reshape(n_base, 5, 3)
+        A, B = blocks[:, 0], blocks[:, 1]
+        for i in range(3):
+            AB_i = A.copy()
+            AB_i[:, i] = B[:, i]
+            np.testing.assert_array_equal(blocks[:, 2 + i], AB_i)
+
+    def test_ishigami(self):
+        X = saltelli_sample(self.bounds, 2**13)
+        Y = ishigami(X)
+        S1, ST = ishigami_indices()
+        result = sobol_indices(Y, 3, n_bootstrap=50)
+        self.assertEqual(result['n_base'], 2**13)
+        np.testing.assert_allclose(result['S1'][:, 0], S1, atol=0.03)
+        np.testing.assert_allclose(result['ST'][:, 0], ST, atol=0.03)
+        self.assertTrue(np.all(result['S1_conf'] > 0))
+        self.assertTrue(np.all(result['ST_conf'] < 0.1))
+
+    def test_failed_samples(self):
+        # an output undefined for some samples, a trailing partial block
+        X = saltelli_sample(self.bounds, 2**12)
+        Y = np.column_stack((ishigami(X), ishigami(X)))
+        Y[::37, 1] = np.nan
+        result = sobol_indices(Y[:-2], 3, n_bootstrap=0)
+        self.assertEqual(result['n_base'], 2**12 - 1)
+        np.testing.assert_allclose(result['S1'][:, 1], result['S1'][:, 0],
+                                   atol=0.05)
+        np.testing.assert_allclose(result['ST'][:, 1], result['ST'][:, 0],
+                                   atol=0.05)
+
+
+class TestMorris(TestCase):
+
+    def test_trajectories(self):
+        bounds = np.array([[0, 1], [-2, 2], [10, 20], [0, 0.5]])
+        X = morris_sample(bounds, 6, num_levels=4, seed=1)
+        self.assertEqual(X.shape, (6*5, 4))
+        self.assertTrue(np.all((X >= bounds[:, 0]) & (X <= bounds[:, 1])))
+        # every parameter changes exactly once along a trajectory, by delta
+        X_unit = (X - bounds[:, 0])/(bounds[:, 1] - bounds[:, 0])
+        steps = np.diff(X_unit.reshape(6, 5, 4), axis=1)
+        self.assertTrue(np.all(np.sum(steps != 0, axis=2) == 1))
+        np.testing.assert_allclose(np.abs(steps).sum(axis=1), 2/3.)
+
+    def test_elementary_effects(self):
+        # linear in x0 and x1, x2 only through its interaction with x0,
+        # x3 inert
+        bounds = np.array([[0, 1], [0, 1], [0, 1], [0, 1]])
+        X = morris_sample(bounds, 20, seed=0)
+        Y = np.column_stack((3*X[:, 0] - 2*X[:, 1] + 4*X[:, 0]*X[:, 2],
+                             X[:, 1]))
+        Y[5, 1] = np.nan
+        result = morris_elementary_effects(X, Y, bounds)
+        np.testing.assert_allclose(result['mu'][1], [-2, 1])
+        np.testing.assert_allclose(result['sigma'][1], [0, 0], atol=1e-12)
+        np.testing.assert_allclose(result['mu_star'][3], [0, 0])
+        np.testing.assert_allclose(result['mu'][0, 0],
+                                   3 + 4*np.mean(X[:, 2]), atol=1)
+        self.assertGreater(result['sigma'][0, 0], 0)
+        self.assertGreater(result['mu_star'][2, 0], 0)
+        self.assertEqual(rank_parameters(result['mu_star'][:, :1],
+                                         ['x0', 'x1', 'x2', 'x3'],
+                                         top_k=2)[0][0], 'x0')
@@ -0,0 +1,64 @@
+from unittest import TestCase
+import numpy as np
+import scipy.signal as signal
+from ateamopt.analysis.analysis_module import calculate_spike_time_metrics_batch,\
+    get_spike_shape_matrix,\
+    trial_expvar
+
+
+def dense_spike_time_metrics(expt_trains, model_train, total_length, dt, sigma):
+    # Explained variance from the dense convolved trains
+    expvar_result = []
+    for s in sigma:
+        sigma_points = s / dt
+        gauss_func = signal.windows.gaussian(int(10 * sigma_points), sigma_points)
+        convolved_expt_trains = []
+        for et in expt_trains:
+            bt = np.zeros(total_length)
+            bt[et] = 1
+            convolved_expt_trains.append(signal.fftconvolve(gauss_func, bt))
+        f = np.array(convolved_expt_trains)
+        bm = np.zeros(total_length)
+        bm[model_train] = 1
+        convolved_model_train = signal.fftconvolve(gauss_func, bm)
+        expvar_result.append(trial_expvar(f, convolved_model_train) /
+                             trial_expvar(f, np.mean(f, axis=0)))
+    return np.array(expvar_result)
+
+
+class TestSpikeTimeMetrics(TestCase):
+
+    def test_batch_explained_variance(self):
+        rng = np.random.RandomState(0)
+        dt, total_length = 0.05, 20000
+        spikes = np.sort(rng.choice(total_length, 30, replace=False))
+        expt_trains = [np.clip(spikes + rng.randint(-40, 40, 30), 0,
+                               total_length - 1) for _ in range(3)]
+        model_trains = [np.clip(spikes + rng.randint(-200, 200, 30), 0,
+                                total_length - 1) for _ in range(4)]
+        model_trains.append(np.sort(rng.choice(total_length, 10, replace=False)))
+        model_trains.append(np.array([], dtype=int))
+        sigma = [10, 2]
+
+        expvar_batch = calculate_spike_time_metrics_batch(
+            expt_trains, model_trains, total_length, dt, sigma)
+        for model_train, expvar_model in zip(model_trains, expvar_batch):
+            np.testing.assert_allclose(expvar_model, dense_spike_time_metrics(
+                expt_trains, model_train, total_length, dt, sigma), atol=1e-10)
+
+
+class TestSpikeShape(TestCase):
+
+    def test_window_inside_trace(self):
+        time = np.arange(0, 100, 0.05)
+        voltage = np.sin(time)
+        AP_shape_time = np.arange(-2, 20, 0.05)  # longer than the postfix pad
+        spike_times = np.array([1., 50., 75., 81.])
+        AP_shapes = get_spike_shape_matrix(time, voltage, spike_times,
+                                           AP_shape_time)
+        # 1 - 2 and 81 + 20 run off the trace
+        self.assertEqual(AP_shapes.shape, (2, len(AP_shape_time)))
+        for AP_shape, spike_time in zip(AP_shapes, [50., 75.]):
+            expected = np.sin(spike_time + AP_shape_time)
+            np.testing.assert_allclose(AP_shape, expected - expected[0],
+                                       atol=1e-3)
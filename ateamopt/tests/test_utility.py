@@ -0,0 +1,135 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from ateamopt.utils import utility
+
+
+test_data_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'test_data')
+
+
+def spiking_trace(dt=0.02, t_stop=2000., spike_times=(105.3, 410.7, 1288.1)):
+    # Noisy baseline with narrow spikes and their afterhyperpolarizations
+    time = np.arange(0, t_stop, dt)
+    voltage = -70 + 0.5*np.random.RandomState(0).randn(len(time))
+    for ii, spike_time in enumerate(spike_times):
+        voltage += (95 + ii)*np.exp(-((time - spike_time)/0.2)**2)
+        voltage -= (12 + ii)*np.exp(-((time - spike_time - 2)/0.8)**2)
+    return time, voltage
+
+
+class TestDecimateTrace(TestCase):
+
+    def setUp(self):
+        self.time, self.voltage = spiking_trace()
+        self.peak_idx = [np.argmax(self.voltage*((self.time > t - 1) &
+                                                 (self.time < t + 1)))
+                         for t in (105.3, 410.7, 1288.1)]
+
+    def check_decimated(self, max_points, method):
+        time_dec, voltage_dec = utility.decimate_trace(
+            self.time, self.voltage, max_points=max_points, method=method)
+        self.assertLessEqual(len(time_dec), max_points)
+        self.assertTrue(np.all(np.diff(time_dec) > 0))
+        self.assertEqual(time_dec[0], self.time[0])
+        self.assertEqual(time_dec[-1], self.time[-1])
+        self.assertEqual(voltage_dec.max(), self.voltage.max())
+        self.assertEqual(voltage_dec.min(), self.voltage.min())
+        for peak_idx in self.peak_idx:
+            if method == 'minmax':
+                self.assertIn(self.time[peak_idx], time_dec)
+            else:
+                # the largest triangle of the bucket, not always the peak
+                near_peak = np.abs(time_dec - self.time[peak_idx]) < 1
+                self.assertAlmostEqual(voltage_dec[near_peak].max(),
+                                       self.voltage[peak_idx], delta=2)
+        # decimated points are points of the trace
+        idx = np.searchsorted(self.time, time_dec)
+        np.testing.assert_array_equal(self.voltage[idx], voltage_dec)
+
+    def test_minmax(self):
+        for max_points in [101, 1000, 5000]:
+            self.check_decimated(max_points, 'minmax')
+
+    def test_lttb(self):
+        for max_points in [500, 1000, 5000]:
+            self.check_decimated(max_points, 'lttb')
+
+    def test_no_decimation(self):
+        time_dec, voltage_dec = utility.decimate_trace(
+            self.time[:100], self.voltage[:100], max_points=5000)
+        np.testing.assert_array_equal(time_dec, self.time[:100])
+        time_dec, _ = utility.decimate_trace(self.time, self.voltage,
+                                             max_points=None)
+        self.assertEqual(len(time_dec), len(self.time))
+
+    def test_x_range(self):
+        time_dec, voltage_dec = utility.decimate_trace(
+            self.time, self.voltage, max_points=200, x_range=(400, 420))
+        self.assertLessEqual(len(time_dec), 200)
+        self.assertLess(time_dec[0], 400)
+        self.assertGreater(time_dec[-1], 420)
+        self.assertEqual(voltage_dec.max(), self.voltage[self.peak_idx[1]])
+
+
+class TestLoadSweep(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.sweep_dir = os.path.join(self.tmp_dir, 'preprocessed')
+        os.makedirs(self.sweep_dir)
+        self.sweep_path = os.path.join(self.sweep_dir, 'LongDC_45.txt')
+        self.sweep_data = np.column_stack(spiking_trace(t_stop=50.))
+        np.savetxt(self.sweep_path, self.sweep_data)
+        utility._sweep_cache.clear()
+        utility._sweep_cache_bytes = 0
+
+    def tearDown(self):
+        utility.sweep_cache_dir = None
+        utility._sweep_cache.clear()
+        utility._sweep_cache_bytes = 0
+        shutil.rmtree(self.tmp_dir)
+
+    def test_memory_cache(self):
+        data = utility.load_sweep(self.sweep_path)
+        np.testing.assert_allclose(data, self.sweep_data)
+        self.assertIs(utility.load_sweep(self.sweep_path), data)
+        self.assertFalse(data.flags.writeable)
+        self.assertEqual(os.listdir(self.sweep_dir), ['LongDC_45.txt'])
+
+    def test_cache_dir(self):
+        utility.sweep_cache_dir = os.path.join(self.tmp_dir, 'sweep_cache')
+        data = utility.load_sweep(self.sweep_path)
+        self.assertEqual(os.listdir(self.sweep_dir), ['LongDC_45.txt'])
+        npy_files = os.listdir(utility.sweep_cache_dir)
+        self.assertEqual(len(npy_files), 1)
+        np.testing.assert_array_equal(np.load(os.path.join(
+            utility.sweep_cache_dir, npy_files[0])), data)
+
+    def test_threads(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            sweeps = list(executor.map(utility.load_sweep,
+                                       [self.sweep_path]*32))
+        self.assertEqual(len(utility._sweep_cache), 1)
+        self.assertEqual(utility._sweep_cache_bytes, sweeps[0].nbytes)
+
+
+class TestLoadSwc(TestCase):
+
+    def setUp(self):
+        self.morph_path = os.path.join(test_data_path, 'small_morph.swc')
+        self.swc_rows = np.loadtxt(self.morph_path)
+
+    def test_load_swc(self):
+        swc_arr = utility.load_swc(self.morph_path)
+        self.assertEqual(swc_arr.dtype, utility.swc_dtype)
+        self.assertEqual(len(swc_arr), len(self.swc_rows))
+        np.testing.assert_array_equal(swc_arr['id'], self.swc_rows[:, 0])
+        np.testing.assert_array_equal(swc_arr['type'], self.swc_rows[:, 1])
+        np.testing.assert_array_equal(swc_arr['xyz'], self.swc_rows[:, 2:5])
+        np.testing.assert_array_equal(swc_arr['radius'], self.swc_rows[:, 5])
+        np.testing.assert_array_equal(swc_arr['parent'], self.swc_rows[:, 6])
+        self.assertFalse(utility.check_swc_for_apical(self.morph_path))
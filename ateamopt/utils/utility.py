@@ -6,9 +6,11 @@ import numpy as np
 import pkg_resources
 import ateamopt.template as templ
 import pickle
-import allensdk.core.swc as swc
 import ateamopt.scripts as pyscripts
 import logging
+import hashlib
+import threading
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
@@ -145,6 +147,135 @@ def load_pickle(path):
     return pickle_data
 
 
+def cp_summary_path(cp_file):
+    # seed1.pkl -> seed1_summary.json (kept out of the seed*.pkl glob)
+    return os.path.splitext(cp_file)[0] + '_summary.json'
+
+
+def save_cp_summary(cp_file, checkpoint=None):
+    '''
+    Write a light-weight sidecar summary next to an optimization checkpoint
+
+    Parameters
+    ----------
+    cp_file : str
+        path to the checkpoint (seed*.pkl)
+    checkpoint : dict
+        already loaded checkpoint, read from cp_file if not provided
+
+    Returns
+    -------
+    cp_summary : dict
+        logbook statistics per generation, the hall of fame and the final
+        parents (parameters and fitnesses)
+    '''
+    if checkpoint is None:
+        checkpoint = load_pickle(cp_file)
+    log = checkpoint['logbook']
+    hof = checkpoint['halloffame']
+
+    logbook_summary = {'gen': [int(gen) for gen in log.select('gen')]}
+    for stat in ['avg', 'std', 'min', 'max']:
+        logbook_summary[stat] = [float(val) if val is not None else None
+                                 for val in log.select(stat)]
+
+    cp_summary = {'checkpoint': os.path.basename(cp_file),
+                  'cp_mtime': os.path.getmtime(cp_file),
+                  'generation': int(checkpoint['generation']),
+                  'logbook': logbook_summary,
+                  'halloffame': [[float(val) for val in ind] for ind in hof],
+                  'halloffame_fitness': [[float(val) for val in ind.fitness.values]
+                                         for ind in hof],
+                  'parents': [[float(val) for val in ind]
+                              for ind in checkpoint['parents']],
+                  'parents_fitness': [[float(val) for val in ind.fitness.values]
+                                      for ind in checkpoint['parents']]}
+    save_json(cp_summary_path(cp_file), cp_summary)
+    return cp_summary
+
+
+def load_cp_summary(cp_file):
+    '''
+    Read the sidecar summary of a checkpoint, (re)building it from the
+    checkpoint if it is missing or older than the checkpoint
+    '''
+    summary_file = cp_summary_path(cp_file)
+    if os.path.exists(summary_file):
+        try:
+            cp_summary = load_json(summary_file)
+            if cp_summary['cp_mtime'] == os.path.getmtime(cp_file) and \
+                    'parents' in cp_summary:
+                return cp_summary
+            logger.debug('Checkpoint summary %s is stale' % summary_file)
+        except:
+            logger.debug('Checkpoint summary %s is corrupt' % summary_file)
+    return save_cp_summary(cp_file)
+
+
+# Process-wide LRU cache of the experimental sweeps, parsed sweeps are
+# also saved as .npy under sweep_cache_dir (if set) for other processes
+_sweep_cache = OrderedDict()
+_sweep_cache_bytes = 0
+_sweep_cache_lock = threading.Lock()
+sweep_cache_maxbytes = 1024**3
+sweep_cache_dir = None
+
+
+def _parse_sweep(sweep_path):
+    if not sweep_cache_dir:
+        return np.loadtxt(sweep_path)
+
+    abs_path = os.path.abspath(sweep_path)
+    npy_path = os.path.join(sweep_cache_dir, '%s_%s.npy' % (
+        os.path.splitext(os.path.basename(abs_path))[0],
+        hashlib.sha1(abs_path.encode()).hexdigest()[:12]))
+    if os.path.exists(npy_path) and \
+            os.path.getmtime(npy_path) >= os.path.getmtime(sweep_path):
+        try:
+            return np.load(npy_path)
+        except:
+            logger.debug('Sweep %s is corrupt' % npy_path)
+
+    data = np.loadtxt(sweep_path)
+    # written atomically since several processes might parse the same sweep
+    try:
+        create_dirpath(sweep_cache_dir)
+        tmp_path = '%s.%s.tmp' % (npy_path, os.getpid())
+        with open(tmp_path, 'wb') as npy_write:
+            np.save(npy_write, data)
+        os.replace(tmp_path, npy_path)
+    except OSError:
+        logger.debug('Could not write %s' % npy_path)
+    return data
+
+
+def load_sweep(sweep_path):
+    '''
+    Experimental sweep (text file with time, voltage, ... columns) as a
+    read-only array, through a bounded process-wide LRU cache (thread safe).
+    With sweep_cache_dir set the parsed text is saved there as a .npy and
+    loaded from it afterwards, the experimental directory is never written.
+    '''
+    global _sweep_cache_bytes
+    sweep_key = (os.path.abspath(sweep_path), os.path.getmtime(sweep_path))
+    with _sweep_cache_lock:
+        if sweep_key in _sweep_cache:
+            _sweep_cache.move_to_end(sweep_key)
+            return _sweep_cache[sweep_key]
+
+    data = _parse_sweep(sweep_path)
+    data.setflags(write=False)
+    with _sweep_cache_lock:
+        if sweep_key not in _sweep_cache:
+            _sweep_cache[sweep_key] = data
+            _sweep_cache_bytes += data.nbytes
+        while _sweep_cache_bytes > sweep_cache_maxbytes and \
+                len(_sweep_cache) > 1:
+            _, evicted = _sweep_cache.popitem(last=False)
+            _sweep_cache_bytes -= evicted.nbytes
+    return data
+
+
 def downsample_ephys_data(time, stim, response, downsample_interval=5):
 
     time_end = time[-1]
@@ -162,13 +293,106 @@ def downsample_ephys_data(time, stim, response, downsample_interval=5):
     return time, stim, response
 
 
+def _minmax_decimate(y, max_points):
+    # min and max of each bucket, in their original order
+    n_buckets = max(max_points // 2, 1)
+    bucket_size = int(np.ceil(len(y) / float(n_buckets)))
+    n_buckets = int(np.ceil(len(y) / float(bucket_size)))
+    y_padded = np.empty(n_buckets * bucket_size)
+    y_padded[:len(y)] = y
+    y_padded[len(y):] = y[-1]
+    y_buckets = y_padded.reshape(n_buckets, bucket_size)
+    offsets = np.arange(n_buckets) * bucket_size
+    idx = np.concatenate((offsets + np.argmin(y_buckets, axis=1),
+                          offsets + np.argmax(y_buckets, axis=1)))
+    return np.minimum(idx, len(y) - 1)
+
+
+def _lttb_decimate(x, y, max_points):
+    # Largest-Triangle-Three-Buckets (Steinarsson, 2013)
+    n_buckets = max_points - 2
+    edges = np.linspace(1, len(y) - 1, n_buckets + 1).astype(int)
+    idx = np.empty(max_points, dtype=int)
+    idx[0], idx[-1] = 0, len(y) - 1
+    prev = 0
+    for i in range(n_buckets):
+        start, end = edges[i], edges[i+1]
+        if i < n_buckets - 1:
+            next_x = x[edges[i+1]:edges[i+2]].mean()
+            next_y = y[edges[i+1]:edges[i+2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[prev] - next_x) * (y[start:end] - y[prev]) -
+                      (x[prev] - x[start:end]) * (next_y - y[prev]))
+        prev = start + np.argmax(area)
+        idx[i+1] = prev
+    return idx
+
+
+def decimate_trace(x, y, max_points=5000, x_range=None, method='minmax'):
+    '''
+    Reduce a trace to at most ~max_points for plotting, keeping its visual
+    shape: 'minmax' keeps the extrema of every bucket (spike peaks and
+    troughs are always preserved), 'lttb' the largest-triangle-three-buckets
+    selection plus the global extrema
+
+    Parameters
+    ----------
+    x, y : array-like
+        trace, x sorted
+    max_points : int
+        point budget, no decimation if None
+    x_range : tuple
+        visible x limits, the points outside (but one on each side) are dropped
+    method : str
+        'minmax' or 'lttb'
+
+    Returns
+    -------
+    x, y : np.ndarray
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x_range is not None and len(x):
+        start = max(np.searchsorted(x, x_range[0]) - 1, 0)
+        end = min(np.searchsorted(x, x_range[1], side='right') + 1, len(x))
+        x, y = x[start:end], y[start:end]
+
+    if not max_points or len(x) <= max_points or max_points < 3:
+        return x, y
+
+    if method == 'lttb':
+        # two points of the budget are kept for the global extrema
+        idx = _lttb_decimate(x, y, max_points - 2) if max_points > 4 else \
+            np.array([0, len(y) - 1])
+        idx = np.unique(np.concatenate((idx, [np.argmin(y), np.argmax(y)])))
+    else:
+        idx = _minmax_decimate(y, max_points - 2)
+        idx = np.unique(np.concatenate(([0, len(y) - 1], idx)))
+    return x[idx], y[idx]
+
+
+swc_dtype = np.dtype([('id', int), ('type', int), ('xyz', float, 3),
+                      ('radius', float), ('parent', int)])
+
+
+def load_swc(morph_path):
+    '''
+    SWC morphology as a structured array (one record per compartment, in
+    file order) with the fields id, type, xyz, radius and parent
+    '''
+    swc_data = np.loadtxt(morph_path, comments='#', ndmin=2)
+    swc_arr = np.empty(len(swc_data), dtype=swc_dtype)
+    swc_arr['id'] = swc_data[:, 0]
+    swc_arr['type'] = swc_data[:, 1]
+    swc_arr['xyz'] = swc_data[:, 2:5]
+    swc_arr['radius'] = swc_data[:, 5]
+    swc_arr['parent'] = swc_data[:, 6]
+    return swc_arr
+
+
 def check_swc_for_apical(morph_path):
-    morphology = swc.read_swc(morph_path)
-    no_apical = True
-    for n in morphology.compartment_list:
-        if n['type'] == 4:
-            no_apical = False
-            break
+    no_apical = not np.any(load_swc(morph_path)['type'] == 4)
     return no_apical
 
 
@@ -2,7 +2,9 @@ import os
 import bluepyopt.ephys as ephys
 import bluepyopt as bpopt
 import copy
-from ateamopt.analysis.sensitivity_analysis import SA_helper
+from ateamopt.analysis.sensitivity_analysis import SA_helper,SA_Runner,\
+    saltelli_sample
+from ateamopt.analysis.sa_sample_store import SA_Sample_Store
 from ateamopt.bpopt_evaluator import Bpopt_Evaluator
 from ateamopt.utils import utility
 import uncertainpy as un
@@ -10,6 +12,9 @@ import operator
 from ateam.data import lims
 import multiprocessing as mp
 import sys,shutil
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def nrnsim_bpopt(**kwargs):
@@ -39,6 +44,33 @@ def nrnsim_bpopt(**kwargs):
     
     return time, value, info
 
+def sa_bounds(parameters,param_mod_range):
+    # Same interval as un.uniform(param_mod_range)
+    return [sorted([val*(1-param_mod_range/2.),val*(1+param_mod_range/2.)])
+            for val in parameters.values()]
+
+
+def native_sobol_analysis(sa_models,stim_names,efel_features,param_mod_range,
+                          n_base,cpu_count,cell_id,data_folder='sensitivity_data'):
+    # All the models and stimuli simulated in one pooled sweep
+    model_configs,model_samples = {},{}
+    for model_name,(SA_obj,model_config,param_dict_uc,parameters) in sa_models.items():
+        model_configs[model_name] = model_config
+        model_samples[model_name] = ([param_dict_uc[key] for key in parameters.keys()],
+                        saltelli_sample(sa_bounds(parameters,param_mod_range),n_base))
+    sa_runner = SA_Runner(model_configs,stim_names,efel_features,nprocs=cpu_count)
+    # Samples are stored as they finish, a rerun resumes the sweep
+    sample_store = SA_Sample_Store(os.path.join(data_folder,'sa_samples_%s'%cell_id))
+    sa_runner.run(model_samples,sample_store=sample_store)
+
+    for model_name,(SA_obj,_,_,parameters) in sa_models.items():
+        sa_csv_path = os.path.join(data_folder,'sa_%s_%s.csv'%(model_name,cell_id))
+        sa_datadf = SA_obj.sobol_data_from_store(sample_store,model_name,
+                                                 filepath=sa_csv_path)
+        SA_obj.plot_sobol_analysis_from_df(sa_datadf,analysis_path = \
+                          'figures/sa_analysis_%s_%s.pdf'%(model_name,cell_id))
+
+
 def main():
     
     # Read sensitivity analysis config file
@@ -126,6 +158,46 @@ def main():
         raise Exception('Compiled modfiles do not exist')
     
     efel_features = utility.load_json(select_feature_path)
+
+    if sens_config_dict.get('sa_method') == 'saltelli':
+        stim_names = sens_config_dict.get('stim_names',[stim_name])
+        screen_method = sens_config_dict.get('screen_method') # morris/finite_difference
+        if screen_method:
+            # Only the top_k parameters go to the Sobol analysis
+            model_config_aa = SA_obj_aa.get_sa_model_config(sens_param_bound_write_path_aa,
+                                   optim_param_aa,morph_path,model_base_path)
+            screen_runner = SA_Runner({'allactive':model_config_aa},stim_names,
+                                      efel_features,nprocs=cpu_count)
+            ranked_params,_ = SA_obj_aa.screen_parameters(screen_runner,'allactive',
+                        parameters_aa,sa_bounds(parameters_aa,param_mod_range),
+                        method=screen_method,top_k=sens_config_dict.get('top_k'),
+                        select_param_path='select_aa_param_screened.json')
+            logger.info('Parameter screening: %s', ranked_params)
+            param_dict_uc_aa = SA_obj_aa.create_sens_param_dict()
+            parameters_aa ={key:optim_param_aa[val] for key,val in param_dict_uc_aa.items()}
+        sa_models = {'allactive':(SA_obj_aa,
+                     SA_obj_aa.get_sa_model_config(sens_param_bound_write_path_aa,
+                                   optim_param_aa,morph_path,model_base_path),
+                     param_dict_uc_aa,parameters_aa)}
+        if perisomatic_sa:
+            SA_obj_peri = SA_helper(None,select_peri_param_path,param_mod_range,
+                                   opt_config_file)
+            _,_,_,_,param_bound_path_peri = SA_obj_peri.load_config(model_base_path,
+                                                                perisomatic=True)
+            sens_param_bound_write_path_peri = "param_sensitivity_peri.json"
+            optim_param_peri = SA_obj_peri.create_sa_bound_peri(param_bound_path_peri,
+                                                     sens_param_bound_write_path_peri)
+            param_dict_uc_peri = SA_obj_peri.create_sens_param_dict()
+            parameters_peri ={key:optim_param_peri[val] for key,val in param_dict_uc_peri.items()}
+            sa_models['perisomatic'] = (SA_obj_peri,
+                     SA_obj_peri.get_sa_model_config(sens_param_bound_write_path_peri,
+                                   optim_param_peri,morph_path,model_base_path,
+                                   perisomatic=True),
+                     param_dict_uc_peri,parameters_peri)
+        native_sobol_analysis(sa_models,stim_names,efel_features,param_mod_range,
+                              sens_config_dict.get('n_base',256),cpu_count,cell_id)
+        return
+
     un_features = un.EfelFeatures(features_to_run=efel_features)
     
     un_parameters_aa = un.Parameters(parameters_aa)
@@ -214,4 +286,5 @@ def main():
 #    shutil.rmtree('x86_64')
         
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     main()
@@ -33,6 +33,7 @@ all_pop = list(checkpoint['history'].genealogy_history.values())
 
 prefix= 'frames_ga_evol/evol_'
 select_stim = 'LongDC_55'
+plot_point_budget = 5000 # per trace, peaks are kept
 
 gen_vector = []
 error_vector=[]
@@ -75,6 +76,7 @@ def run_simulation(sim_tuple):
 def plot_responses(ax,ind_responses,exp_data,gen_error,error_vector,
                    error_span):
     hof_num = 1
+    xlim = [200,1350]
     for jj,ind_response in enumerate(ind_responses):
         if bool(ind_response):
             ind_time = ind_response['%s.soma.v'%select_stim]['time']
@@ -83,6 +85,8 @@ def plot_responses(ax,ind_responses,exp_data,gen_error,error_vector,
             # the last indexed individual has highest fitness
             lw_fitness = 1 if jj >= nselect_inds-hof_num else .1   
             color_fitness = 'b' if jj >= nselect_inds-hof_num else 'lightsteelblue'
+            ind_time,ind_voltage = utility.decimate_trace(ind_time,ind_voltage,
+                                        plot_point_budget,x_range=xlim)
             if jj == nselect_inds-1:
                 ax.plot(ind_time,ind_voltage,color=color_fitness,alpha=1,
                         lw=lw_fitness,label='Best Model')
@@ -90,9 +94,11 @@ def plot_responses(ax,ind_responses,exp_data,gen_error,error_vector,
                 ax.plot(ind_time,ind_voltage,color=color_fitness,alpha=alpha_fitness,
                         lw=lw_fitness)
     
-    ax.plot(exp_data[:,0],exp_data[:,1],color='k',lw=1,label='Experiment')
+    exp_time,exp_voltage = utility.decimate_trace(exp_data[:,0],exp_data[:,1],
+                                        plot_point_budget,x_range=xlim)
+    ax.plot(exp_time,exp_voltage,color='k',lw=1,label='Experiment')
             
-    ax.set_xlim([200,1350])
+    ax.set_xlim(xlim)
     ax.set_ylim([-105,50])
     ax.grid(False)
     sns.despine(ax=ax)
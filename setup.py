@@ -6,6 +6,10 @@ setup(name='ateamopt',
       author='Ani Nandi',
       author_email='anin@alleninstitute.org',
       packages=find_packages(),
+      extras_require={
+        # merging of the report sections rendered in parallel
+        'report': ['pypdf']
+      },
       scripts=['ateamopt/jobscript/submit_opt_jobs'],
       entry_points={
         'console_scripts':[